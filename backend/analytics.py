@@ -0,0 +1,142 @@
+"""
+Incrementally maintained per-bot analytics rollups.
+Handlers call record() as events happen. Events are queued per worker and
+merged per (bot, hour) and (bot, day) before one additive upsert per table,
+so dashboard queries read a few rollup rows instead of scanning
+conversations or messages.
+"""
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.future import select
+
+from batching import BatchWriter
+from database import async_session
+from models import BotStatsDaily, BotStatsHourly
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", 5))
+COUNTERS = (
+    "conversations", "messages", "leads", "llm_calls", "llm_errors",
+    "llm_latency_ms", "prompt_tokens", "completion_tokens",
+)
+
+
+def hour_bucket(ts):
+    return ts.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(ts):
+    return hour_bucket(ts).replace(hour=0)
+
+
+def record(bot_id, ts=None, **counters):
+    """Queue counter increments for a bot, e.g. record(bot_id, messages=2)."""
+    counters = {name: int(value) for name, value in counters.items() if value}
+    if counters:
+        # Normalise so str and UUID ids merge into the same rollup row
+        bot_uuid = bot_id if isinstance(bot_id, uuid.UUID) else uuid.UUID(str(bot_id))
+        stats_writer.submit((bot_uuid, ts or datetime.now(timezone.utc), counters))
+
+
+def record_llm_call(bot_id, stats, error=False):
+    """Record one model call from the stats dict filled in by utils.generate_from_prompt_async."""
+    record(
+        bot_id,
+        llm_calls=1,
+        llm_errors=1 if error else 0,
+        llm_latency_ms=stats.get("latency_ms", 0),
+        prompt_tokens=stats.get("prompt_tokens", 0),
+        completion_tokens=stats.get("completion_tokens", 0)
+    )
+
+
+def _merge(items, bucket_fn):
+    merged = {}
+    for bot_id, ts, counters in items:
+        row = merged.setdefault((bot_id, bucket_fn(ts)), dict.fromkeys(COUNTERS, 0))
+        for name, value in counters.items():
+            row[name] += value
+    return [{"bot_id": bot_id, "bucket": bucket, **row} for (bot_id, bucket), row in merged.items()]
+
+
+def _upsert(model, rows):
+    stmt = pg_insert(model).values(rows)
+    table = model.__table__
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.bot_id, table.c.bucket],
+        set_={name: table.c[name] + stmt.excluded[name] for name in COUNTERS}
+    )
+
+
+async def _flush_stats(items):
+    async with async_session() as db:
+        await db.execute(_upsert(BotStatsHourly, _merge(items, hour_bucket)))
+        await db.execute(_upsert(BotStatsDaily, _merge(items, day_bucket)))
+        await db.commit()
+
+
+stats_writer = BatchWriter("analytics", _flush_stats, max_batch=5000, max_delay=ANALYTICS_FLUSH_INTERVAL)
+
+
+def _series_row(row):
+    calls = row.llm_calls or 0
+    return {
+        "bucket": row.bucket.isoformat(),
+        "conversations": row.conversations,
+        "messages": row.messages,
+        "leads": row.leads,
+        "llm_calls": calls,
+        "llm_errors": row.llm_errors,
+        "avg_llm_latency_ms": round(row.llm_latency_ms / calls, 1) if calls else None,
+        "prompt_tokens": row.prompt_tokens,
+        "completion_tokens": row.completion_tokens,
+    }
+
+
+async def bot_series(db, bot_uuid, granularity="day", since=None, until=None):
+    model = BotStatsHourly if granularity == "hour" else BotStatsDaily
+    if since is None:
+        since = datetime.now(timezone.utc) - (timedelta(days=2) if granularity == "hour" else timedelta(days=30))
+    stmt = select(model).where(model.bot_id == bot_uuid, model.bucket >= since)
+    if until is not None:
+        stmt = stmt.where(model.bucket < until)
+    result = await db.execute(stmt.order_by(model.bucket))
+    return [_series_row(row) for row in result.scalars().all()]
+
+
+async def bot_totals(db, bot_ids):
+    """All-time totals and last activity for many bots, in two grouped rollup queries."""
+    if not bot_ids:
+        return {}
+    totals_result = await db.execute(
+        select(
+            BotStatsDaily.bot_id,
+            *(func.sum(getattr(BotStatsDaily, name)).label(name) for name in COUNTERS)
+        ).where(BotStatsDaily.bot_id.in_(bot_ids)).group_by(BotStatsDaily.bot_id)
+    )
+    totals = {row.bot_id: {name: int(getattr(row, name) or 0) for name in COUNTERS} for row in totals_result}
+    last_result = await db.execute(
+        select(BotStatsHourly.bot_id, func.max(BotStatsHourly.bucket).label("last_bucket"))
+        .where(BotStatsHourly.bot_id.in_(bot_ids)).group_by(BotStatsHourly.bot_id)
+    )
+    for row in last_result:
+        totals.setdefault(row.bot_id, dict.fromkeys(COUNTERS, 0))["last_active"] = row.last_bucket
+    return totals
+
+
+def humanize_last_active(ts, now=None):
+    if ts is None:
+        return "Never"
+    delta = (now or datetime.now(timezone.utc)) - ts
+    # Buckets are hourly, so anything in the current hour is "just now"
+    if delta < timedelta(hours=1):
+        return "Just now"
+    if delta < timedelta(days=1):
+        return f"{int(delta.total_seconds() // 3600)}h ago"
+    return f"{delta.days}d ago"
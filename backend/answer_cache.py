@@ -0,0 +1,92 @@
+"""
+Per-bot cache of model answers for repeated visitor questions.
+Questions are keyed on their normalized text and, unless disabled, on a
+signature that also drops articles and filler, so "What's the price?" and
+"what is the price" share an entry. Word order, repeats, question words,
+negations and pronouns are kept: they change what is being asked. Keys
+include the bot's content fingerprint (system prompt + knowledge), so
+edits to either never serve stale answers.
+"""
+import os
+import re
+from collections import OrderedDict
+
+from cache import TTLCache
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIGNATURE = os.getenv("ANSWER_CACHE_SIGNATURE", "true").lower() == "true"
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 3600))
+ANSWER_CACHE_PER_BOT = int(os.getenv("ANSWER_CACHE_PER_BOT", 256))
+ANSWER_CACHE_MAX_BOTS = int(os.getenv("ANSWER_CACHE_MAX_BOTS", 512))
+# Long questions are rarely repeated verbatim and are more context-dependent
+ANSWER_CACHE_MAX_QUERY_LENGTH = int(os.getenv("ANSWER_CACHE_MAX_QUERY_LENGTH", 200))
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]", re.UNICODE)
+# Words that never change the question; "s" is the remains of "what's"
+_SIGNATURE_FILLER = frozenset("a an the is are s please".split())
+
+
+def normalize_query(query):
+    return " ".join(_PUNCTUATION_RE.sub(" ", query.lower()).split())
+
+
+def query_signature(query):
+    """The question's words in order, without punctuation and filler."""
+    return " ".join(word for word in normalize_query(query).split() if word not in _SIGNATURE_FILLER)
+
+
+class AnswerCache:
+    def __init__(self, per_bot=ANSWER_CACHE_PER_BOT, max_bots=ANSWER_CACHE_MAX_BOTS, ttl=ANSWER_CACHE_TTL):
+        self.per_bot = per_bot
+        self.max_bots = max_bots
+        self.ttl = ttl
+        self._bots = OrderedDict()  # bot_id -> TTLCache
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, runtime, query):
+        if len(query) > ANSWER_CACHE_MAX_QUERY_LENGTH:
+            return None
+        text = query_signature(query) if ANSWER_CACHE_SIGNATURE else normalize_query(query)
+        if not text:
+            return None
+        return f"{runtime.fingerprint}:{text}"
+
+    def get(self, runtime, query):
+        key = self._key(runtime, query) if ANSWER_CACHE_ENABLED else None
+        bot_cache = self._bots.get(runtime.bot_id) if key else None
+        answer = bot_cache.get(key) if bot_cache is not None else None
+        if answer is None:
+            self.misses += 1
+            return None
+        self._bots.move_to_end(runtime.bot_id)
+        self.hits += 1
+        return answer
+
+    def set(self, runtime, query, answer):
+        key = self._key(runtime, query) if ANSWER_CACHE_ENABLED else None
+        if not key or not answer:
+            return
+        bot_cache = self._bots.get(runtime.bot_id)
+        if bot_cache is None:
+            bot_cache = self._bots[runtime.bot_id] = TTLCache(maxsize=self.per_bot, ttl=self.ttl)
+            while len(self._bots) > self.max_bots:
+                self._bots.popitem(last=False)
+        self._bots.move_to_end(runtime.bot_id)
+        bot_cache.set(key, answer)
+
+    def invalidate_bot(self, bot_id):
+        self._bots.pop(str(bot_id), None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "bots": len(self._bots),
+            "entries": sum(len(c) for c in self._bots.values()),
+        }
+
+
+answer_cache = AnswerCache()
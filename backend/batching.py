@@ -0,0 +1,135 @@
+"""
+Write-behind batching for high-volume inserts.
+A BatchWriter collects items in memory and hands them to an async flush
+function in batches, either when max_batch items are pending or after
+max_delay seconds, whichever comes first. Writers are started on app startup
+and drained on shutdown so queued items are not lost on a clean restart.
+When a batch is rejected because of its data (a constraint or encoding
+error) it is retried one item at a time and only the failing items are
+dropped; connection errors put the batch back to be retried whole.
+"""
+import asyncio
+import logging
+
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+
+logger = logging.getLogger(__name__)
+
+
+def is_data_error(e):
+    """True for database errors caused by the statement's rows rather than the connection or server."""
+    return isinstance(e, DBAPIError) and not e.connection_invalidated and not isinstance(e, (InterfaceError, OperationalError))
+
+
+def strip_nul(value):
+    """Remove NUL characters, which Postgres text and jsonb reject, from strings in `value`."""
+    if isinstance(value, str):
+        return value.replace("\x00", "")
+    if isinstance(value, dict):
+        return {strip_nul(k): strip_nul(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [strip_nul(v) for v in value]
+    return value
+
+
+class BatchWriter:
+    def __init__(self, name, flush_fn, max_batch=500, max_delay=0.5, max_pending=50000):
+        self.name = name
+        self.flush_fn = flush_fn
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self._pending = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self._lock = asyncio.Lock()
+        self.flushed = 0
+        self.dropped = 0
+
+    def submit(self, item):
+        if len(self._pending) >= self.max_pending:
+            # Protect the worker's memory if the database is down for a long time
+            self._pending.pop(0)
+            self.dropped += 1
+            logger.warning(f"{self.name}: pending queue full, dropping oldest item")
+        self._pending.append(item)
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    def pending(self):
+        return len(self._pending)
+
+    def pending_snapshot(self):
+        """Copy of the items accepted but not yet flushed, oldest first."""
+        return list(self._pending)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            # Let the loop finish a flush in progress instead of cancelling it mid-write
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+        await self.flush()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._stopping:
+                await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            while self._pending:
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                try:
+                    await self.flush_fn(batch)
+                    self.flushed += len(batch)
+                except asyncio.CancelledError:
+                    # Cancelled from outside (e.g. loop teardown): keep the batch for the final flush
+                    self._pending[:0] = batch
+                    raise
+                except Exception as e:
+                    if not is_data_error(e):
+                        # Put the batch back for the next tick; submit() bounds the queue
+                        self._pending[:0] = batch
+                        logger.error(f"{self.name}: flush of {len(batch)} item(s) failed: {e}")
+                        return
+                    if len(batch) == 1:
+                        self._reject(e)
+                    elif not await self._flush_each(batch, e):
+                        return
+
+    async def _flush_each(self, batch, error):
+        """Write a rejected batch item by item, dropping the items that fail; False if it had to stop."""
+        logger.warning(f"{self.name}: batch of {len(batch)} item(s) rejected, retrying one by one: {error}")
+        for index, item in enumerate(batch):
+            try:
+                await self.flush_fn([item])
+                self.flushed += 1
+            except asyncio.CancelledError:
+                self._pending[:0] = batch[index:]
+                raise
+            except Exception as e:
+                if not is_data_error(e):
+                    self._pending[:0] = batch[index:]
+                    logger.error(f"{self.name}: flush failed: {e}")
+                    return False
+                self._reject(e)
+        return True
+
+    def _reject(self, error):
+        self.dropped += 1
+        # The error names the problem; the item itself may hold visitor data, so it isn't logged
+        logger.warning(f"{self.name}: dropping item the database rejected: {getattr(error, 'orig', error)}")
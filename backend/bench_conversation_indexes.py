@@ -0,0 +1,115 @@
+"""
+Benchmark for the conversation indexes added by migrate_conversations.py.
+Seeds a scratch copy of the conversations table (default one million rows
+across 200 bots, 10% with captured data) in its own schema, prints the query
+plans for the capture lookup and the leads listing before and after the
+indexes, then drops the schema.
+
+Usage: python bench_conversation_indexes.py [rows] [bots] [--keep]
+Point DATABASE_URL at a scratch database; nothing outside the bench schema is touched.
+"""
+import asyncio
+import sys
+import time
+from sqlalchemy import text
+from database import engine
+from migrate_conversations import CONVERSATION_INDEXES, LEADS_PREDICATE, index_ddl
+
+SCHEMA = "bench_conversation_indexes"
+TABLE = f"{SCHEMA}.conversations"
+
+CREATE_TABLE = f"""
+    CREATE TABLE {TABLE} (
+        conversation_id UUID PRIMARY KEY,
+        bot_id UUID NOT NULL,
+        visitor_session_id TEXT NOT NULL,
+        captured_data JSONB DEFAULT '{{}}'::jsonb,
+        summary TEXT,
+        summarized_until TIMESTAMP WITH TIME ZONE,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    )
+"""
+
+SEED = f"""
+    INSERT INTO {TABLE} (conversation_id, bot_id, visitor_session_id, captured_data, created_at)
+    SELECT gen_random_uuid(),
+           bots.ids[1 + (g % :bots)],
+           'v' || g,
+           CASE WHEN g % 10 = 0 THEN jsonb_build_object('email', 'visitor' || g || '@example.com')
+                ELSE '{{}}'::jsonb END,
+           NOW() - make_interval(secs => g)
+    FROM generate_series(1, :rows) g,
+         (SELECT array_agg(gen_random_uuid()) AS ids FROM generate_series(1, :bots)) bots
+"""
+
+QUERIES = {
+    "capture lookup (bot_id, visitor_session_id)": f"""
+        SELECT conversation_id FROM {TABLE}
+        WHERE bot_id = :bot_id AND visitor_session_id = :session_id
+    """,
+    "leads page (non-empty captured_data, newest 50)": f"""
+        SELECT conversation_id, visitor_session_id, captured_data, created_at FROM {TABLE}
+        WHERE bot_id = :bot_id AND {LEADS_PREDICATE}
+        ORDER BY created_at DESC, conversation_id DESC LIMIT 50
+    """,
+    "conversations by bot (newest 50)": f"""
+        SELECT conversation_id, created_at FROM {TABLE}
+        WHERE bot_id = :bot_id ORDER BY created_at DESC LIMIT 50
+    """,
+}
+
+async def explain_all(conn, params):
+    timings = {}
+    for name, query in QUERIES.items():
+        result = await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {query}"), params)
+        plan = [row[0] for row in result]
+        print(f"\n-- {name}")
+        print("\n".join(plan))
+        timings[name] = next((line for line in plan if line.startswith("Execution Time")), "")
+    return timings
+
+async def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    rows = int(args[0]) if args else 1_000_000
+    bots = int(args[1]) if len(args) > 1 else 200
+    keep = "--keep" in sys.argv
+
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        await conn.execute(text(CREATE_TABLE))
+
+        start = time.perf_counter()
+        await conn.execute(text(SEED), {"rows": rows, "bots": bots})
+        await conn.execute(text(f"ANALYZE {TABLE}"))
+        print(f"Seeded {rows} conversations across {bots} bots in {time.perf_counter() - start:.1f}s")
+
+        sample = (await conn.execute(text(
+            f"SELECT bot_id, visitor_session_id FROM {TABLE} ORDER BY created_at LIMIT 1 OFFSET :offset"
+        ), {"offset": rows // 2})).first()
+        params = {"bot_id": sample.bot_id, "session_id": sample.visitor_session_id}
+
+        print("\n===== BEFORE (primary key only) =====")
+        before = await explain_all(conn, params)
+
+        start = time.perf_counter()
+        for _, statement in CONVERSATION_INDEXES:
+            await conn.execute(text(index_ddl(statement, table=TABLE)))
+        await conn.execute(text(f"ANALYZE {TABLE}"))
+        print(f"\nBuilt {len(CONVERSATION_INDEXES)} indexes in {time.perf_counter() - start:.1f}s")
+
+        print("\n===== AFTER =====")
+        after = await explain_all(conn, params)
+
+        print("\n===== SUMMARY =====")
+        for name in QUERIES:
+            print(f"{name}:\n  before: {before[name]}\n  after:  {after[name]}")
+
+        if not keep:
+            await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+    await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
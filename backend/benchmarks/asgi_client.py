@@ -0,0 +1,104 @@
+"""
+Minimal in-process ASGI client for the benchmarks.
+Requests go straight into the app's ASGI callable, so timings cover the
+middleware, routing, handlers and database, but no sockets or HTTP parsing.
+Also drives the lifespan protocol so startup and shutdown hooks run.
+"""
+import asyncio
+import json as jsonlib
+import uuid
+from urllib.parse import urlencode
+
+
+class Response:
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return jsonlib.loads(self.body)
+
+
+def multipart(field, filename, content, content_type="text/plain"):
+    """(body, content-type header) for a single-file multipart/form-data upload."""
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class ASGIClient:
+    def __init__(self, app):
+        self.app = app
+        self._lifespan = None
+
+    async def startup(self):
+        receive, sent = asyncio.Queue(), asyncio.Queue()
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        task = asyncio.create_task(self.app(scope, receive.get, sent.put))
+        self._lifespan = (task, receive, sent)
+        await receive.put({"type": "lifespan.startup"})
+        message = await sent.get()
+        if message["type"] != "lifespan.startup.complete":
+            raise RuntimeError(f"App startup failed: {message.get('message')}")
+
+    async def shutdown(self):
+        task, receive, sent = self._lifespan
+        await receive.put({"type": "lifespan.shutdown"})
+        await sent.get()
+        await task
+
+    async def request(self, method, path, json=None, params=None, body=b"", headers=None):
+        headers = dict(headers or {})
+        if json is not None:
+            body = jsonlib.dumps(json).encode()
+            headers["content-type"] = "application/json"
+        headers.setdefault("content-length", str(len(body)))
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": urlencode(params or {}).encode(),
+            "root_path": "",
+            "headers": [(k.lower().encode(), str(v).encode()) for k, v in headers.items()],
+            "client": ("127.0.0.1", 50000),
+            "server": ("benchmark", 80),
+            "state": {},
+        }
+        done = asyncio.Event()
+        request_sent = False
+        status, response_headers, chunks = 500, {}, []
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status, response_headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers = {k.decode().lower(): v.decode() for k, v in message.get("headers", [])}
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    done.set()
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            done.set()
+        return Response(status, response_headers, b"".join(chunks))
@@ -0,0 +1,121 @@
+"""
+Request mixes for the benchmark runner.
+Each operation is an async function (client, fixture, rng) that makes one
+request and returns the Response; mixes weight operations the way real
+traffic does. Fixtures are created by setup() before the timed run.
+"""
+import asyncio
+import uuid
+
+from benchmarks.asgi_client import multipart
+
+KNOWLEDGE_TEXT = "\n\n".join(
+    f"Section {i}. Store {i} is open from {8 + i % 3} am to {5 + i % 4} pm. "
+    f"We sell product line {i} with free delivery over {20 + i} dollars. Returns are accepted within {14 + i % 3} days."
+    for i in range(200)
+)
+QUESTIONS = [
+    "When does store 12 open?",
+    "Do you offer free delivery?",
+    "What is your return policy?",
+    "hi",
+    "Tell me about product line 42",
+]
+
+
+class Fixture:
+    def __init__(self, user_id, bot_ids):
+        self.user_id = user_id
+        self.bot_ids = bot_ids
+        self.uploads = 0
+
+
+async def _wait_for_job(client, bot_id, job_id, timeout=120):
+    for _ in range(int(timeout / 0.2)):
+        job = (await client.request("GET", f"/api/bots/{bot_id}/knowledge/jobs/{job_id}")).json()
+        if job["status"] in ("done", "failed"):
+            return job
+        await asyncio.sleep(0.2)
+    raise TimeoutError(f"Knowledge job {job_id} did not finish")
+
+
+async def setup(client, bots=5, leads_per_bot=200):
+    """Create a user, bots with knowledge and captured leads; returns a Fixture."""
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+    response = await client.request("POST", "/api/auth/signup", json={"email": email, "name": "Bench", "password": "bench-password"})
+    if response.status != 200:
+        raise RuntimeError(f"Signup failed ({response.status}): {response.body[:200]}")
+    user_id = response.json()["user_id"]
+    bot_ids = []
+    for i in range(bots):
+        response = await client.request("POST", "/api/bots/create", json={
+            "user_id": user_id, "bot_name": f"Bench bot {i}", "system_prompt": "You are a helpful store assistant."
+        })
+        bot_id = response.json()["bot_id"]
+        body, content_type = multipart("file", "knowledge.txt", KNOWLEDGE_TEXT.encode())
+        response = await client.request(
+            "POST", f"/api/bots/{bot_id}/knowledge/upload", body=body, headers={"content-type": content_type}
+        )
+        await _wait_for_job(client, bot_id, response.json()["job_id"])
+        for lead in range(leads_per_bot):
+            await client.request("POST", "/api/chat/variables/batch", json={
+                "bot_id": bot_id,
+                "visitor_session_id": f"seed-{lead}",
+                "variables": {"email": f"lead{lead}@example.com", "name": f"Lead {lead}"}
+            })
+        bot_ids.append(bot_id)
+    return Fixture(user_id, bot_ids)
+
+
+async def widget_config(client, fixture, rng):
+    return await client.request("GET", f"/api/bots/{rng.choice(fixture.bot_ids)}/widget-config")
+
+
+async def chat(client, fixture, rng):
+    return await client.request("POST", "/api/chat/message", json={
+        "bot_id": rng.choice(fixture.bot_ids),
+        "message": rng.choice(QUESTIONS),
+        "visitor_session_id": f"visitor-{rng.randrange(100000)}",
+        "history": []
+    })
+
+
+async def chat_stream(client, fixture, rng):
+    return await client.request("POST", "/api/chat/stream", json={
+        "bot_id": rng.choice(fixture.bot_ids),
+        "message": rng.choice(QUESTIONS),
+        "visitor_session_id": f"visitor-{rng.randrange(100000)}",
+        "history": []
+    })
+
+
+async def capture(client, fixture, rng):
+    return await client.request("POST", "/api/chat/variables", json={
+        "bot_id": rng.choice(fixture.bot_ids),
+        "visitor_session_id": f"visitor-{rng.randrange(100000)}",
+        "variable_name": "email",
+        "variable_value": f"visitor{rng.randrange(100000)}@example.com"
+    })
+
+
+async def leads(client, fixture, rng):
+    return await client.request("GET", f"/api/bots/{rng.choice(fixture.bot_ids)}/leads", params={"limit": 50})
+
+
+async def knowledge_upload(client, fixture, rng):
+    fixture.uploads += 1
+    # Unique content each time, otherwise the upload is deduplicated without work
+    content = f"Upload {fixture.uploads} {uuid.uuid4()}\n\n{KNOWLEDGE_TEXT[:20000]}".encode()
+    body, content_type = multipart("file", f"extra-{fixture.uploads}.txt", content)
+    return await client.request(
+        "POST", f"/api/bots/{rng.choice(fixture.bot_ids)}/knowledge/upload",
+        body=body, headers={"content-type": content_type}
+    )
+
+
+MIXES = {
+    # Widget traffic dominates; the dashboard is a small share
+    "default": {widget_config: 40, chat: 25, chat_stream: 5, capture: 20, leads: 8, knowledge_upload: 2},
+    "chat": {chat: 70, chat_stream: 30},
+    "dashboard": {leads: 60, widget_config: 30, knowledge_upload: 10},
+}
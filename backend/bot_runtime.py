@@ -0,0 +1,157 @@
+"""
+Per-worker cache of everything the chat path needs from a bot.
+Entries are keyed by bot_id and carry the bot's content_version. Once an entry
+is older than BOT_CACHE_REVALIDATE_SECONDS it is revalidated with a one-column
+version query. If the version moved, the knowledge chunks are reloaded and
+indexed (in a thread) only when the bot's documents changed.
+Edits made through this worker invalidate immediately.
+"""
+import hashlib
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy.future import select
+
+from knowledge_store import load_runtime_knowledge
+from models import Bot
+import prompt_builder
+from prompt_builder import PROMPT_TOKEN_BUDGET, build_prompt_prefix, token_counter
+from retrieval import INDEX_VERSION, KNOWLEDGE_MODE, select_chunks
+
+BOT_CACHE_SIZE = int(os.getenv("BOT_CACHE_SIZE", 256))
+BOT_CACHE_REVALIDATE_SECONDS = float(os.getenv("BOT_CACHE_REVALIDATE_SECONDS", 15))
+
+
+class BotRuntime:
+    """Preprocessed chat inputs for one version of a bot."""
+
+    def __init__(self, bot_id, version, system_prompt, knowledge_base, knowledge_index, knowledge_hash=None,
+                 token_budget=None):
+        self.bot_id = bot_id
+        self.version = version
+        self.system_prompt = system_prompt or "You are a helpful assistant."
+        self.knowledge_base = knowledge_base or ""
+        self.knowledge_index = knowledge_index
+        self.knowledge_hash = knowledge_hash
+        self.token_budget = token_budget or PROMPT_TOKEN_BUDGET
+        # Identifies what the model answers from; visual or flow edits leave it unchanged
+        knowledge_key = knowledge_hash if knowledge_hash is not None else self.knowledge_base
+        self.fingerprint = hashlib.sha256(
+            f"{self.system_prompt}\0{knowledge_key}\0{self.token_budget}".encode("utf-8")
+        ).hexdigest()[:16]
+        self.full_context = (
+            KNOWLEDGE_MODE == "full"
+            or not knowledge_index
+            or knowledge_index.get("version") != INDEX_VERSION
+        )
+        # In full-context mode everything except the question is constant, so compile and count it once
+        self.prompt_prefix = None
+        self.knowledge_tokens = None
+        if self.full_context:
+            self.prompt_prefix = build_prompt_prefix(self.system_prompt, self.knowledge_base)
+            self.knowledge_tokens = token_counter.raw(self.knowledge_base)
+
+    def context_chunks(self, query):
+        """Knowledge passages for a query, best first."""
+        if self.full_context:
+            return [self.knowledge_base] if self.knowledge_base else []
+        return select_chunks(self.knowledge_index, query)
+
+    def build_prompt(self, query, memory=None):
+        """A prompt_builder.BuiltPrompt within this bot's token budget."""
+        summary, turns = (memory.summary, memory.turns) if memory is not None else ("", ())
+        if self.full_context:
+            return prompt_builder.build(
+                self.system_prompt, query, self.context_chunks(query),
+                chunk_tokens=[token_counter.scale(self.knowledge_tokens)],
+                summary=summary, turns=turns, budget=self.token_budget, prefix=self.prompt_prefix
+            )
+        return prompt_builder.build(
+            self.system_prompt, query, self.context_chunks(query),
+            summary=summary, turns=turns, budget=self.token_budget
+        )
+
+
+class VersionedBotCache:
+    """
+    LRU of per-bot objects that carry a `version` (the bot's content_version).
+    Subclasses implement load(bot_uuid, db), returning the object or None.
+    """
+
+    def __init__(self, maxsize=BOT_CACHE_SIZE, revalidate_after=BOT_CACHE_REVALIDATE_SECONDS):
+        self.maxsize = maxsize
+        self.revalidate_after = revalidate_after
+        self._entries = OrderedDict()  # bot_id -> [checked_at, object]
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+
+    async def load(self, bot_uuid: uuid.UUID, db):
+        raise NotImplementedError
+
+    async def get(self, bot_uuid: uuid.UUID, db):
+        """Return the cached object for a bot, or None if the bot does not exist."""
+        key = str(bot_uuid)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None:
+            if now - entry[0] < self.revalidate_after:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            result = await db.execute(select(Bot.content_version).where(Bot.bot_id == bot_uuid))
+            version = result.scalar()
+            if version is not None and version == entry[1].version:
+                entry[0] = now
+                self._entries.move_to_end(key)
+                self.revalidations += 1
+                return entry[1]
+
+        self.misses += 1
+        value = await self.load(bot_uuid, db)
+        if value is None:
+            self._entries.pop(key, None)
+            return None
+        self._entries[key] = [now, value]
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, bot_id):
+        self._entries.pop(str(bot_id), None)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "revalidations": self.revalidations,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+
+class BotRuntimeCache(VersionedBotCache):
+    async def load(self, bot_uuid: uuid.UUID, db):
+        result = await db.execute(
+            select(Bot.content_version, Bot.system_prompt, Bot.prompt_token_budget).where(Bot.bot_id == bot_uuid)
+        )
+        row = result.first()
+        if not row:
+            return None
+        # Visual and flow edits bump the version too; they keep the knowledge (and its index) of the entry they replace
+        entry = self._entries.get(str(bot_uuid))
+        previous = None
+        if entry is not None and entry[1].knowledge_hash is not None:
+            runtime = entry[1]
+            previous = (runtime.knowledge_base, runtime.knowledge_index, runtime.knowledge_hash)
+        knowledge_base, knowledge_index, knowledge_hash = await load_runtime_knowledge(db, bot_uuid, previous=previous)
+        return BotRuntime(
+            str(bot_uuid), row.content_version, row.system_prompt, knowledge_base, knowledge_index, knowledge_hash,
+            token_budget=row.prompt_token_budget
+        )
+
+
+bot_runtime_cache = BotRuntimeCache()
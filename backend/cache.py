@@ -0,0 +1,129 @@
+"""
+Caching helpers shared by the API.
+TTLCache is a per-worker LRU with expiry. TieredCache puts it in front of an
+optional Redis tier (REDIS_URL) so all gunicorn workers share warm entries.
+An invalidation clears the Redis entry and this worker's copy only; other
+workers may serve their local copy until its (short) ttl runs out.
+"""
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:
+    redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL")
+
+_redis = None
+
+def get_redis():
+    """Shared Redis client, or None when REDIS_URL is unset or redis is not installed."""
+    global _redis
+    if _redis is None and REDIS_URL and redis_asyncio is not None:
+        _redis = redis_asyncio.from_url(REDIS_URL)
+    return _redis
+
+
+class TTLCache:
+    """LRU cache with a per-entry time-to-live. Not thread-safe; one instance per event loop."""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl=None):
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize}
+
+
+class TieredCache:
+    """
+    In-process TTLCache backed by the shared Redis tier when available.
+    invalidate() is not broadcast: other workers' local entries stay until
+    `ttl` expires, so keep it as short as that staleness allows. Values must
+    be JSON-serialisable. Redis errors are logged and treated as
+    misses so the cache never takes a request down with it.
+    """
+
+    def __init__(self, namespace, maxsize=1024, ttl=30, shared_ttl=300):
+        self.namespace = namespace
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.shared_ttl = shared_ttl
+
+    def _shared_key(self, key):
+        return f"nimmi:{self.namespace}:{key}"
+
+    async def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        client = get_redis()
+        if client is None:
+            return None
+        try:
+            raw = await client.get(self._shared_key(key))
+        except Exception as e:
+            logger.warning(f"Shared cache read failed ({self.namespace}): {e}")
+            return None
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        self.local.set(key, value)
+        return value
+
+    async def set(self, key, value):
+        self.local.set(key, value)
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            await client.set(self._shared_key(key), json.dumps(value), ex=self.shared_ttl)
+        except Exception as e:
+            logger.warning(f"Shared cache write failed ({self.namespace}): {e}")
+
+    async def invalidate(self, key):
+        self.local.invalidate(key)
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            await client.delete(self._shared_key(key))
+        except Exception as e:
+            logger.warning(f"Shared cache invalidation failed ({self.namespace}): {e}")
+
+    def stats(self):
+        return self.local.stats()
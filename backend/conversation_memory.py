@@ -0,0 +1,187 @@
+"""
+Server-side conversation memory for the chat endpoints.
+Turns are written to the messages table through a BatchWriter. Each chat turn
+loads a bounded window (summary plus at most MEMORY_WINDOW + MEMORY_SUMMARY_BATCH
+unsummarized messages) in one round-trip. Once MEMORY_SUMMARY_BATCH messages
+have aged out of the window they are folded into conversations.summary in the
+background, so the prompt has a fixed ceiling however long the chat runs.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, or_, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.future import select
+
+import analytics
+from batching import BatchWriter, strip_nul
+from database import async_session
+from models import Conversation, Message
+from utils import generate_from_prompt_async
+
+logger = logging.getLogger(__name__)
+
+MEMORY_ENABLED = os.getenv("MEMORY_ENABLED", "true").lower() == "true"
+MEMORY_WINDOW = int(os.getenv("MEMORY_WINDOW", 10))
+MEMORY_SUMMARY_BATCH = int(os.getenv("MEMORY_SUMMARY_BATCH", 10))
+MEMORY_SUMMARY_MAX_CHARS = int(os.getenv("MEMORY_SUMMARY_MAX_CHARS", 1500))
+CONVERSATION_ID_CACHE_SIZE = int(os.getenv("CONVERSATION_ID_CACHE_SIZE", 10000))
+
+SUMMARY_PROMPT = (
+    "You maintain a short running summary of a customer support chat.\n"
+    "Update the summary with the new messages. Keep names, contact details, "
+    "requests and open questions; drop greetings and small talk. "
+    "Reply with the summary only, at most {max_chars} characters.\n\n"
+    "Current summary:\n{summary}\n\nNew messages:\n{messages}\n\nUpdated summary:"
+)
+
+# Summary and the newest unsummarized messages in a single round-trip
+WINDOW_SQL = text("""
+    SELECT c.summary, m.role, m.content, m.timestamp
+    FROM conversations c
+    LEFT JOIN LATERAL (
+        SELECT role, content, timestamp FROM messages
+        WHERE messages.conversation_id = c.conversation_id
+          AND (c.summarized_until IS NULL OR messages.timestamp > c.summarized_until)
+        ORDER BY timestamp DESC
+        LIMIT :limit
+    ) m ON TRUE
+    WHERE c.conversation_id = :conversation_id
+""")
+
+
+async def _insert_messages(rows):
+    # A rejected batch (e.g. its conversation was deleted with the bot) is retried row by row by the BatchWriter
+    async with async_session() as db:
+        await db.execute(insert(Message).values(rows))
+        await db.commit()
+
+
+message_writer = BatchWriter("messages", _insert_messages, max_batch=500, max_delay=0.5)
+
+# (bot_id, visitor_session_id) -> conversation_id; the mapping never changes once created
+_conversation_ids = OrderedDict()
+_summarizing = set()
+
+
+class ConversationMemory:
+    def __init__(self, conversation_id, summary, turns, overflow):
+        self.conversation_id = conversation_id
+        self.summary = summary or ""
+        self.turns = turns  # [(role, content, timestamp)] oldest first, at most MEMORY_WINDOW
+        self.overflow = overflow  # unsummarized messages that fell out of the window
+
+    def is_empty(self):
+        return not self.summary and not self.turns and not self.overflow
+
+
+async def get_conversation_id(db, bot_uuid: uuid.UUID, visitor_session_id: str):
+    key = (bot_uuid, visitor_session_id)
+    conversation_id = _conversation_ids.get(key)
+    if conversation_id is None:
+        result = await db.execute(
+            select(Conversation.conversation_id).where(
+                Conversation.bot_id == bot_uuid,
+                Conversation.visitor_session_id == visitor_session_id
+            )
+        )
+        conversation_id = result.scalar()
+        if conversation_id is None:
+            # A capture for the same session may be creating the row concurrently
+            result = await db.execute(
+                pg_insert(Conversation)
+                .values(conversation_id=uuid.uuid4(), bot_id=bot_uuid, visitor_session_id=visitor_session_id, captured_data={})
+                .on_conflict_do_nothing(index_elements=[Conversation.bot_id, Conversation.visitor_session_id])
+                .returning(Conversation.conversation_id)
+            )
+            conversation_id = result.scalar()
+            await db.commit()
+            if conversation_id is not None:
+                analytics.record(bot_uuid, conversations=1)
+            else:
+                result = await db.execute(
+                    select(Conversation.conversation_id).where(
+                        Conversation.bot_id == bot_uuid,
+                        Conversation.visitor_session_id == visitor_session_id
+                    )
+                )
+                conversation_id = result.scalar()
+    _conversation_ids[key] = conversation_id
+    _conversation_ids.move_to_end(key)
+    while len(_conversation_ids) > CONVERSATION_ID_CACHE_SIZE:
+        _conversation_ids.popitem(last=False)
+    return conversation_id
+
+
+async def load_memory(db, bot_uuid: uuid.UUID, visitor_session_id: str):
+    conversation_id = await get_conversation_id(db, bot_uuid, visitor_session_id)
+    result = await db.execute(WINDOW_SQL, {
+        "conversation_id": conversation_id,
+        "limit": MEMORY_WINDOW + MEMORY_SUMMARY_BATCH
+    })
+    rows = result.all()
+    summary = rows[0].summary if rows else ""
+    messages = [(row.role, row.content, row.timestamp) for row in reversed(rows) if row.role is not None]
+
+    # Turns this worker has accepted but not flushed yet
+    last_seen = messages[-1][2] if messages else None
+    for item in message_writer.pending_snapshot():
+        if item["conversation_id"] == conversation_id and (last_seen is None or item["timestamp"] > last_seen):
+            messages.append((item["role"], item["content"], item["timestamp"]))
+    messages = messages[-(MEMORY_WINDOW + MEMORY_SUMMARY_BATCH):]
+
+    split = max(len(messages) - MEMORY_WINDOW, 0)
+    return ConversationMemory(conversation_id, summary, messages[split:], messages[:split])
+
+
+def record_turn(memory: ConversationMemory, user_message: str, answer: str):
+    now = datetime.now(timezone.utc)
+    # Explicit timestamps keep the pair ordered even though both rows land in one INSERT
+    for offset, role, content in ((0, "user", user_message), (1, "assistant", answer)):
+        message_writer.submit({
+            "id": uuid.uuid4(),
+            "conversation_id": memory.conversation_id,
+            "role": role,
+            "content": strip_nul(content),
+            "timestamp": now + timedelta(microseconds=offset)
+        })
+    if len(memory.overflow) >= MEMORY_SUMMARY_BATCH and memory.conversation_id not in _summarizing:
+        _summarizing.add(memory.conversation_id)
+        asyncio.create_task(_summarize(memory.conversation_id, memory.summary, memory.overflow))
+
+
+def _format_messages(messages):
+    return "\n".join(f"{'User' if role == 'user' else 'Assistant'}: {content}" for role, content, _ in messages)
+
+
+async def _summarize(conversation_id, summary, overflow):
+    try:
+        try:
+            new_summary = await generate_from_prompt_async(SUMMARY_PROMPT.format(
+                max_chars=MEMORY_SUMMARY_MAX_CHARS,
+                summary=summary or "(none)",
+                messages=_format_messages(overflow)
+            ))
+        except Exception as e:
+            # Degrade to a plain transcript tail rather than losing the turns
+            logger.warning(f"Summary generation failed for {conversation_id}: {e}")
+            new_summary = f"{summary}\n{_format_messages(overflow)}".strip()[-MEMORY_SUMMARY_MAX_CHARS:]
+        summarized_until = overflow[-1][2]
+        async with async_session() as db:
+            await db.execute(
+                update(Conversation)
+                .where(
+                    Conversation.conversation_id == conversation_id,
+                    or_(Conversation.summarized_until.is_(None), Conversation.summarized_until < summarized_until)
+                )
+                .values(summary=strip_nul(new_summary.strip()[:MEMORY_SUMMARY_MAX_CHARS]), summarized_until=summarized_until)
+            )
+            await db.commit()
+    except Exception as e:
+        logger.error(f"Conversation summary update failed for {conversation_id}: {e}")
+    finally:
+        _summarizing.discard(conversation_id)
@@ -0,0 +1,286 @@
+"""
+Server-side execution of the builder's flow_data graphs.
+A flow is compiled once per bot content_version: nodes are indexed by id,
+outgoing edges become a per-node handle -> target map, conditions become
+closures and the graph is validated. Compiled flows are cached per worker
+like bot runtimes. Stepping is stateless: the client sends the node it is
+waiting on plus its variables, and each hop is a dict lookup.
+"""
+import logging
+import math
+import os
+import re
+import uuid
+from datetime import date
+
+from sqlalchemy.future import select
+
+from bot_runtime import VersionedBotCache
+from models import Bot
+
+logger = logging.getLogger(__name__)
+
+FLOW_CACHE_SIZE = int(os.getenv("FLOW_CACHE_SIZE", 256))
+# Upper bound on nodes visited in one step, so a cycle without input nodes can't spin
+FLOW_MAX_AUTO_STEPS = int(os.getenv("FLOW_MAX_AUTO_STEPS", 50))
+
+INPUT_TYPES = frozenset({"textInput", "emailInput", "numberInput", "datePicker", "multipleChoice"})
+NODE_TYPES = INPUT_TYPES | {"start", "message", "condition", "end"}
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+# The string forms JS Number() accepts: decimal (with Infinity) and unsigned hex/octal/binary integers
+_JS_DECIMAL_RE = re.compile(r"[+-]?(?:Infinity|(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?)")
+_JS_INTEGER_RE = re.compile(r"0[xX][0-9a-fA-F]+|0[oO][0-7]+|0[bB][01]+")
+
+
+class FlowError(Exception):
+    pass
+
+
+def _number(value):
+    """JS Number(value): blank is 0 and anything unparsable is NaN, which never compares true."""
+    if isinstance(value, bool):
+        return float(value)
+    value = str(value).strip().strip("\ufeff")
+    if not value:
+        return 0.0
+    if _JS_DECIMAL_RE.fullmatch(value):
+        return float(value)
+    if _JS_INTEGER_RE.fullmatch(value):
+        try:
+            return float(int(value, 0))
+        except OverflowError:
+            return math.inf
+    return math.nan
+
+
+def _compile_condition(data):
+    variable = data.get("variable") or ""
+    operator = data.get("operator") or "equals"
+    expected = str(data.get("value") if data.get("value") is not None else "")
+    if operator == "equals":
+        return lambda variables: str(variables.get(variable, "")) == expected
+    if operator == "contains":
+        return lambda variables: expected in str(variables.get(variable, ""))
+    if operator in ("greater_than", "less_than"):
+        target = _number(expected)
+        if math.isnan(target):
+            return None
+
+        def compare(variables):
+            actual = _number(variables.get(variable, ""))
+            return actual > target if operator == "greater_than" else actual < target
+        return compare
+    return None
+
+
+def _validate_input(node_type, value, options):
+    """Return (normalized value, error message)."""
+    value = value.strip()
+    if not value:
+        return None, "Please enter a value."
+    if node_type == "emailInput" and not _EMAIL_RE.match(value):
+        return None, "Please enter a valid email address."
+    if node_type == "numberInput" and math.isnan(_number(value)):
+        return None, "Please enter a number."
+    if node_type == "datePicker":
+        try:
+            value = date.fromisoformat(value).isoformat()
+        except ValueError:
+            return None, "Please enter a date as YYYY-MM-DD."
+    if node_type == "multipleChoice" and value not in options:
+        return None, "Please choose one of the options."
+    return value, None
+
+
+def _prompt(node_type, data):
+    # Same fallbacks the widget has always shown
+    message = data.get("message")
+    if node_type == "multipleChoice":
+        return message or "Please choose an option:"
+    if node_type in INPUT_TYPES:
+        return message or data.get("label") or "Please provide input:"
+    if node_type == "end":
+        return message or "Thank you!"
+    return message or "..."
+
+
+class FlowNode:
+    __slots__ = ("id", "type", "variable", "message", "placeholder", "options", "condition", "next", "branches")
+
+    def __init__(self, node_id, node_type, data):
+        self.id = node_id
+        self.type = node_type
+        self.variable = data.get("label") or node_id
+        self.message = _prompt(node_type, data)
+        self.placeholder = data.get("placeholder")
+        self.options = [str(option) for option in data.get("options") or []]
+        self.condition = None
+        self.next = None  # first outgoing edge, as the widget follows it
+        self.branches = {}  # sourceHandle -> target id
+
+    def describe(self):
+        """What the client needs to render this node while waiting for input."""
+        return {
+            "id": self.id,
+            "type": self.type,
+            "message": self.message,
+            "placeholder": self.placeholder,
+            "options": self.options if self.type == "multipleChoice" else None,
+            "variable": self.variable,
+        }
+
+
+class CompiledFlow:
+    def __init__(self, version, nodes, start_id, errors):
+        self.version = version
+        self.nodes = nodes
+        self.start_id = start_id
+        self.errors = errors
+
+    def step(self, node_id=None, user_input=None, variables=None):
+        """
+        Advance from `node_id` (None starts the flow) with the visitor's answer.
+        Returns messages to show, the node now awaiting input (None when the
+        flow ended), the variable captured on this step and any input error.
+        """
+        variables = dict(variables or {})
+        messages = []
+        captured = None
+        if node_id is None:
+            current = self.start_id
+        else:
+            node = self.nodes.get(node_id)
+            if node is None:
+                raise FlowError("Unknown node; the flow may have changed")
+            if node.type not in INPUT_TYPES:
+                raise FlowError("Node does not accept input")
+            value, error = _validate_input(node.type, user_input or "", node.options)
+            if error:
+                return {"messages": [error], "node": node.describe(), "variables": variables, "captured": None, "error": error}
+            variables[node.variable] = value
+            captured = {node.variable: value}
+            current = node.next
+
+        for _ in range(FLOW_MAX_AUTO_STEPS):
+            node = self.nodes.get(current)
+            if node is None:
+                return {"messages": messages, "node": None, "variables": variables, "captured": captured, "error": None}
+            if node.type in INPUT_TYPES:
+                messages.append(node.message)
+                return {"messages": messages, "node": node.describe(), "variables": variables, "captured": captured, "error": None}
+            if node.type == "message":
+                messages.append(node.message)
+                current = node.next
+            elif node.type == "condition":
+                result = node.condition(variables) if node.condition else False
+                current = node.branches.get("true" if result else "false")
+            elif node.type == "end":
+                messages.append(node.message)
+                return {"messages": messages, "node": None, "variables": variables, "captured": captured, "error": None}
+            else:
+                current = node.next
+        raise FlowError(f"Flow did not reach an input or end node within {FLOW_MAX_AUTO_STEPS} steps")
+
+
+def _shape_error(kind, raw):
+    if not isinstance(raw, dict):
+        return "must be an object"
+    if kind == "node":
+        data = raw.get("data")
+        if not isinstance(raw.get("id"), str) or not raw["id"]:
+            return "id must be a non-empty string"
+        if raw.get("type") is not None and not isinstance(raw["type"], str):
+            return "type must be a string"
+        if data is not None and not isinstance(data, dict):
+            return "data must be an object"
+        if data and data.get("label") is not None and not isinstance(data["label"], str):
+            return "data.label must be a string"
+        if data and data.get("options") is not None and not isinstance(data["options"], list):
+            return "data.options must be a list"
+    else:
+        if not isinstance(raw.get("source"), str) or not isinstance(raw.get("target"), str):
+            return "source and target must be strings"
+        if raw.get("sourceHandle") is not None and not isinstance(raw["sourceHandle"], str):
+            return "sourceHandle must be a string"
+    return None
+
+
+def flow_shape_errors(flow_data):
+    """JSON shape problems (wrong types for the graph, its nodes or edges) that make flow_data unusable."""
+    if flow_data is None:
+        return []
+    if not isinstance(flow_data, dict):
+        return ["flow_data must be an object"]
+    errors = []
+    for key, kind in (("nodes", "node"), ("edges", "edge")):
+        items = flow_data.get(key)
+        if items is None:
+            continue
+        if not isinstance(items, list):
+            errors.append(f"{key} must be a list")
+            continue
+        for index, raw in enumerate(items):
+            error = _shape_error(kind, raw)
+            if error:
+                errors.append(f"{kind.capitalize()} {index}: {error}")
+    return errors
+
+
+def compile_flow(flow_data, version=0):
+    """
+    Index and validate a flow_data graph. Problems are collected in .errors
+    rather than raised; a malformed graph compiles to an empty flow.
+    """
+    errors = flow_shape_errors(flow_data)
+    if errors:
+        return CompiledFlow(version, {}, None, errors)
+    flow_data = flow_data or {}
+    nodes = {}
+    for raw in flow_data.get("nodes") or []:
+        node_id = raw["id"]
+        node_type = raw.get("type")
+        if node_type not in NODE_TYPES:
+            errors.append(f"Node {node_id}: unknown type {node_type!r}")
+        node = FlowNode(node_id, node_type, raw.get("data") or {})
+        if node_type == "condition":
+            node.condition = _compile_condition(raw.get("data") or {})
+            if node.condition is None:
+                errors.append(f"Node {node_id}: unsupported condition")
+        if node_type == "multipleChoice" and not node.options:
+            errors.append(f"Node {node_id}: multiple choice without options")
+        nodes[node_id] = node
+
+    for edge in flow_data.get("edges") or []:
+        source, target = nodes.get(edge.get("source")), edge.get("target")
+        if source is None or target not in nodes:
+            errors.append(f"Edge {edge.get('id')}: references a missing node")
+            continue
+        if source.next is None:
+            source.next = target
+        handle = edge.get("sourceHandle")
+        if handle and handle not in source.branches:
+            source.branches[handle] = target
+
+    for node in nodes.values():
+        if node.type == "condition" and not node.branches:
+            errors.append(f"Node {node.id}: condition without true/false branches")
+
+    start = next((node.id for node in nodes.values() if node.type == "start"), None)
+    if start is None and nodes:
+        start = next(iter(nodes))
+    return CompiledFlow(version, nodes, start, errors)
+
+
+class FlowCache(VersionedBotCache):
+    async def load(self, bot_uuid: uuid.UUID, db):
+        result = await db.execute(select(Bot.content_version, Bot.flow_data).where(Bot.bot_id == bot_uuid))
+        row = result.first()
+        if not row:
+            return None
+        flow = compile_flow(row.flow_data, row.content_version)
+        if flow.errors:
+            logger.warning(f"Flow for bot {bot_uuid} has {len(flow.errors)} problem(s): {flow.errors[:3]}")
+        return flow
+
+
+flow_cache = FlowCache(maxsize=FLOW_CACHE_SIZE)
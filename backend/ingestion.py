@@ -0,0 +1,243 @@
+"""
+Background ingestion of uploaded knowledge files.
+The upload is copied to a temp file in bounded reads and a knowledge_jobs row
+and knowledge document are created straight away. PDF pages are extracted in
+a process pool, in ranges of INGEST_PAGES_PER_TASK pages that run in
+parallel. Each range is chunked into the document once it and all earlier
+ranges are done, so page order is kept, progress is visible while the job
+runs, and the event loop never parses a PDF.
+A running job refreshes its updated_at every INGEST_HEARTBEAT_SECONDS; a
+queued or processing job that goes INGEST_STALE_SECONDS without one lost
+its worker and is marked failed when it is next polled.
+"""
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, update
+
+import knowledge_store
+from answer_cache import answer_cache
+from bot_runtime import bot_runtime_cache
+from database import async_session
+from models import KnowledgeJob
+from utils import count_pdf_pages, extract_pdf_pages
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+INGEST_PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", 20))
+INGEST_MAX_UPLOAD_MB = int(os.getenv("INGEST_MAX_UPLOAD_MB", 50))
+INGEST_HEARTBEAT_SECONDS = float(os.getenv("INGEST_HEARTBEAT_SECONDS", 30))
+INGEST_STALE_SECONDS = float(os.getenv("INGEST_STALE_SECONDS", 300))
+ACTIVE_STATUSES = ("queued", "processing")
+UPLOAD_READ_SIZE = 1024 * 1024
+SUPPORTED_EXTENSIONS = (".pdf", ".txt")
+
+_pool = None
+_tasks = set()
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the server process runs threads (log listener, bcrypt pool) whose held locks a fork would copy
+        _pool = ProcessPoolExecutor(max_workers=INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+async def save_upload(file, suffix, max_mb=INGEST_MAX_UPLOAD_MB, prefix="knowledge-"):
+    """
+    Copy an UploadFile to a temp file without holding it in memory.
+    Returns (path, sha256 of the bytes); the hash dedups documents.
+    """
+    limit = max_mb * 1024 * 1024
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix=suffix)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await file.read(UPLOAD_READ_SIZE):
+                size += len(chunk)
+                if size > limit:
+                    raise UploadTooLarge(f"File exceeds {max_mb} MB")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest()
+
+
+def start_job(job_id: uuid.UUID, bot_uuid: uuid.UUID, document_id: uuid.UUID, path: str, replaces=None):
+    task = asyncio.create_task(_run_job(job_id, bot_uuid, document_id, path, replaces))
+    # Keep a reference so the task isn't garbage collected mid-run
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def stop():
+    """Cancel running jobs (they are marked failed) and shut the process pool down."""
+    for task in list(_tasks):
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+
+def serialize_job(job: KnowledgeJob):
+    return {
+        "job_id": str(job.job_id),
+        "bot_id": str(job.bot_id),
+        "document_id": str(job.document_id) if job.document_id else None,
+        "filename": job.filename,
+        "status": job.status,
+        "pages_total": job.pages_total,
+        "pages_done": job.pages_done,
+        "chars_added": job.chars_added,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
+
+
+async def _update_job(job_id, **values):
+    async with async_session() as db:
+        await db.execute(update(KnowledgeJob).where(KnowledgeJob.job_id == job_id).values(**values))
+        await db.commit()
+
+
+async def _heartbeat(job_id):
+    while True:
+        await asyncio.sleep(INGEST_HEARTBEAT_SECONDS)
+        try:
+            await _update_job(job_id, updated_at=func.now())
+        except Exception as e:
+            logger.warning(f"Knowledge job {job_id} heartbeat failed: {e}")
+
+
+def is_stale(job: KnowledgeJob):
+    """True if the job should be running but its worker stopped updating it."""
+    return (
+        job.status in ACTIVE_STATUSES and job.updated_at is not None
+        and datetime.now(timezone.utc) - job.updated_at > timedelta(seconds=INGEST_STALE_SECONDS)
+    )
+
+
+async def fail_stale_jobs(db, bot_uuid: uuid.UUID):
+    """Mark the bot's stale jobs failed and drop their partial documents. Commits; returns how many failed."""
+    result = await db.execute(
+        update(KnowledgeJob)
+        .where(
+            KnowledgeJob.bot_id == bot_uuid, KnowledgeJob.status.in_(ACTIVE_STATUSES),
+            KnowledgeJob.updated_at < func.now() - timedelta(seconds=INGEST_STALE_SECONDS)
+        )
+        .values(status="failed", error="Processing stopped unexpectedly; please upload the file again")
+        .returning(KnowledgeJob.job_id, KnowledgeJob.document_id)
+    )
+    stale = result.all()
+    for job_id, document_id in stale:
+        logger.warning(f"Knowledge job {job_id} of bot {bot_uuid} stopped heartbeating, marked failed")
+        if document_id is not None:
+            await knowledge_store.delete_document(db, bot_uuid, document_id)
+    await db.commit()
+    if stale:
+        _invalidate(bot_uuid)
+    return len(stale)
+
+
+def _invalidate(bot_uuid):
+    answer_cache.invalidate_bot(bot_uuid)
+    bot_runtime_cache.invalidate(bot_uuid)
+
+
+async def _append_text(job_id, bot_uuid, document_id, text, pages_done):
+    async with async_session() as db:
+        if text:
+            await knowledge_store.append_to_document(db, document_id, bot_uuid, text)
+        await db.execute(
+            update(KnowledgeJob).where(KnowledgeJob.job_id == job_id)
+            .values(pages_done=pages_done, chars_added=KnowledgeJob.chars_added + len(text))
+        )
+        await db.commit()
+    if text:
+        _invalidate(bot_uuid)
+
+
+async def _delete_document(bot_uuid, document_id):
+    async with async_session() as db:
+        await knowledge_store.delete_document(db, bot_uuid, document_id)
+        await db.commit()
+    _invalidate(bot_uuid)
+
+
+def _read_text(path):
+    with open(path, "rb") as f:
+        return f.read().decode("utf-8")
+
+
+async def _ingest_txt(job_id, bot_uuid, document_id, path):
+    await _update_job(job_id, status="processing", pages_total=1)
+    text = await asyncio.to_thread(_read_text, path)
+    await _append_text(job_id, bot_uuid, document_id, text, pages_done=1)
+    return len(text)
+
+
+async def _ingest_pdf(job_id, bot_uuid, document_id, path):
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    total = await loop.run_in_executor(pool, count_pdf_pages, path)
+    await _update_job(job_id, status="processing", pages_total=total)
+
+    ranges = [(start, min(start + INGEST_PAGES_PER_TASK, total)) for start in range(0, total, INGEST_PAGES_PER_TASK)]
+    futures = [loop.run_in_executor(pool, extract_pdf_pages, path, start, stop) for start, stop in ranges]
+    chars = 0
+    try:
+        for (_, stop), future in zip(ranges, futures):
+            text = "\n".join(await future)
+            await _append_text(job_id, bot_uuid, document_id, text, pages_done=stop)
+            chars += len(text)
+    finally:
+        for future in futures:
+            future.cancel()
+    return chars
+
+
+async def _run_job(job_id, bot_uuid, document_id, path, replaces):
+    heartbeat = asyncio.create_task(_heartbeat(job_id))
+    try:
+        if path.endswith(".pdf"):
+            chars = await _ingest_pdf(job_id, bot_uuid, document_id, path)
+        else:
+            chars = await _ingest_txt(job_id, bot_uuid, document_id, path)
+        if not chars:
+            raise ValueError("Could not extract text from file")
+        if replaces is not None:
+            await _delete_document(bot_uuid, replaces)
+        await _update_job(job_id, status="done")
+        logger.info(f"Knowledge job {job_id} done: {chars} chars added to bot {bot_uuid}")
+    except asyncio.CancelledError:
+        # Drop the partial document so the same file can be uploaded again
+        await _delete_document(bot_uuid, document_id)
+        await _update_job(job_id, status="failed", error="Interrupted by server shutdown")
+        raise
+    except Exception as e:
+        logger.error(f"Knowledge job {job_id} failed: {e}")
+        await _delete_document(bot_uuid, document_id)
+        await _update_job(job_id, status="failed", error=str(e))
+    finally:
+        heartbeat.cancel()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
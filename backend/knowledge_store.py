@@ -0,0 +1,222 @@
+"""
+Knowledge storage: documents and their retrieval chunks.
+Each upload or editor save is a knowledge_documents row, deduplicated per
+bot by a hash of its content, with its chunks in knowledge_chunks. Documents
+can be deleted or replaced on their own, and the chat runtime loads only the
+chunks. Bots that still have text in the legacy bots.knowledge_base column
+are moved over the first time their knowledge is touched.
+"""
+import asyncio
+import hashlib
+import logging
+import uuid
+
+from sqlalchemy import delete, func, text, update
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert as pg_insert
+from sqlalchemy.future import select
+
+from models import Bot, KnowledgeChunk, KnowledgeDocument
+from retrieval import KNOWLEDGE_MODE, add_chunks, chunk_text, empty_index
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_SEPARATOR = "\n\n"
+# Rows per chunk INSERT; each row binds 5 parameters and asyncpg allows 32767 per statement
+CHUNK_INSERT_BATCH = 1000
+DOCUMENT_ORDER = (KnowledgeDocument.created_at, KnowledgeDocument.document_id)
+
+# Row lock so concurrent callers migrate a bot once; the loser sees NULL and matches nothing
+TAKE_LEGACY_KNOWLEDGE = text("""
+    WITH legacy AS (
+        SELECT bot_id, knowledge_base FROM bots
+        WHERE bot_id = :bot_id AND knowledge_base IS NOT NULL
+        FOR UPDATE
+    )
+    UPDATE bots SET knowledge_base = NULL, knowledge_index = NULL
+    FROM legacy WHERE bots.bot_id = legacy.bot_id
+    RETURNING legacy.knowledge_base
+""")
+
+
+def content_hash(data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def bump_version(bot_uuid):
+    return update(Bot).where(Bot.bot_id == bot_uuid).values(content_version=Bot.content_version + 1)
+
+
+async def migrate_legacy_knowledge(db, bot_uuid: uuid.UUID):
+    """Move text from bots.knowledge_base into a document. Commits; returns True if anything moved."""
+    result = await db.execute(TAKE_LEGACY_KNOWLEDGE, {"bot_id": bot_uuid})
+    legacy = result.scalar()
+    if legacy is None:
+        return False
+    if legacy.strip():
+        await add_document(db, bot_uuid, "legacy", legacy, content_hash(legacy))
+    await db.commit()
+    logger.info(f"Migrated legacy knowledge base of bot {bot_uuid} ({len(legacy)} chars)")
+    return True
+
+
+async def create_document(db, bot_uuid: uuid.UUID, source: str, digest: str):
+    """Insert an empty document; returns its id, or None if the bot already has this content."""
+    result = await db.execute(
+        pg_insert(KnowledgeDocument)
+        .values(document_id=uuid.uuid4(), bot_id=bot_uuid, source=source, content_hash=digest, content="")
+        .on_conflict_do_nothing(index_elements=[KnowledgeDocument.bot_id, KnowledgeDocument.content_hash])
+        .returning(KnowledgeDocument.document_id)
+    )
+    return result.scalar()
+
+
+async def append_to_document(db, document_id: uuid.UUID, bot_uuid: uuid.UUID, content: str, separator="\n"):
+    """Chunk `content` and append it to a document. Does not commit."""
+    result = await db.execute(
+        select(KnowledgeDocument.char_count, KnowledgeDocument.chunk_count)
+        .where(KnowledgeDocument.document_id == document_id)
+        .with_for_update()
+    )
+    row = result.first()
+    if row is None:
+        raise ValueError("Document not found")
+    chunks = chunk_text(content)
+    for start in range(0, len(chunks), CHUNK_INSERT_BATCH):
+        await db.execute(pg_insert(KnowledgeChunk).values([
+            {
+                "chunk_id": uuid.uuid4(),
+                "document_id": document_id,
+                "bot_id": bot_uuid,
+                "position": row.chunk_count + offset,
+                "content": chunk
+            }
+            for offset, chunk in enumerate(chunks[start:start + CHUNK_INSERT_BATCH], start)
+        ]))
+    if not row.char_count:
+        separator = ""
+    await db.execute(
+        update(KnowledgeDocument).where(KnowledgeDocument.document_id == document_id).values(
+            content=KnowledgeDocument.content + separator + content,
+            char_count=KnowledgeDocument.char_count + len(separator) + len(content),
+            chunk_count=KnowledgeDocument.chunk_count + len(chunks)
+        )
+    )
+    await db.execute(bump_version(bot_uuid))
+
+
+async def add_document(db, bot_uuid: uuid.UUID, source: str, content: str, digest: str):
+    document_id = await create_document(db, bot_uuid, source, digest)
+    if document_id is not None:
+        await append_to_document(db, document_id, bot_uuid, content)
+    return document_id
+
+
+async def delete_document(db, bot_uuid: uuid.UUID, document_id: uuid.UUID):
+    """Delete a document and its chunks. Does not commit; returns False if it didn't exist."""
+    result = await db.execute(
+        delete(KnowledgeDocument)
+        .where(KnowledgeDocument.document_id == document_id, KnowledgeDocument.bot_id == bot_uuid)
+        .returning(KnowledgeDocument.document_id)
+    )
+    if result.scalar() is None:
+        return False
+    await db.execute(bump_version(bot_uuid))
+    return True
+
+
+async def list_documents(db, bot_uuid: uuid.UUID):
+    result = await db.execute(
+        select(KnowledgeDocument).where(KnowledgeDocument.bot_id == bot_uuid).order_by(*DOCUMENT_ORDER)
+    )
+    return result.scalars().all()
+
+
+def serialize_document(document: KnowledgeDocument):
+    return {
+        "document_id": str(document.document_id),
+        "source": document.source,
+        "content_hash": document.content_hash,
+        "char_count": document.char_count,
+        "chunk_count": document.chunk_count,
+        "created_at": document.created_at.isoformat() if document.created_at else None,
+    }
+
+
+async def knowledge_text(db, bot_uuid: uuid.UUID):
+    """All documents joined in upload order, as the dashboard editor shows them."""
+    result = await db.execute(
+        select(KnowledgeDocument.content).where(KnowledgeDocument.bot_id == bot_uuid).order_by(*DOCUMENT_ORDER)
+    )
+    return DOCUMENT_SEPARATOR.join(result.scalars().all())
+
+
+async def knowledge_texts(db, bot_ids):
+    """knowledge_text for many bots in one grouped query; bots without documents are omitted."""
+    if not bot_ids:
+        return {}
+    result = await db.execute(
+        select(
+            KnowledgeDocument.bot_id,
+            func.string_agg(KnowledgeDocument.content, aggregate_order_by(DOCUMENT_SEPARATOR, *DOCUMENT_ORDER))
+        ).where(KnowledgeDocument.bot_id.in_(bot_ids)).group_by(KnowledgeDocument.bot_id)
+    )
+    return {bot_id: text for bot_id, text in result.all()}
+
+
+async def knowledge_length(db, bot_uuid: uuid.UUID):
+    result = await db.execute(
+        select(func.coalesce(func.sum(KnowledgeDocument.char_count), 0), func.count())
+        .where(KnowledgeDocument.bot_id == bot_uuid)
+    )
+    chars, documents = result.first()
+    return chars + len(DOCUMENT_SEPARATOR) * max(documents - 1, 0)
+
+
+async def replace_knowledge(db, bot_uuid: uuid.UUID, content: str):
+    """
+    Editor save: replace every document with one holding `content`.
+    Returns False without writing if the text is unchanged. Only the legacy
+    migration is committed here; the replacement is left to the caller.
+    """
+    await migrate_legacy_knowledge(db, bot_uuid)
+    # Lengths are summed in SQL, so the full text is only loaded when they match
+    if await knowledge_length(db, bot_uuid) == len(content) and await knowledge_text(db, bot_uuid) == content:
+        return False
+    await db.execute(delete(KnowledgeDocument).where(KnowledgeDocument.bot_id == bot_uuid))
+    if content.strip():
+        await add_document(db, bot_uuid, "editor", content, content_hash(content))
+    else:
+        await db.execute(bump_version(bot_uuid))
+    return True
+
+
+async def load_runtime_knowledge(db, bot_uuid: uuid.UUID, full_context=None, previous=None):
+    """
+    Knowledge for a BotRuntime: (knowledge_base, knowledge_index, fingerprint source).
+    Retrieval mode loads only the chunks and indexes them (in a thread, off
+    the event loop); the fingerprint is built from document hashes so the
+    text never has to be joined. `previous` is the same tuple from the
+    runtime being replaced, reused when the documents haven't changed.
+    """
+    if full_context is None:
+        full_context = KNOWLEDGE_MODE == "full"
+    await migrate_legacy_knowledge(db, bot_uuid)
+    # A document's hash is set when it is created; chunk_count moves as ingestion appends page ranges
+    result = await db.execute(
+        select(KnowledgeDocument.content_hash, KnowledgeDocument.chunk_count)
+        .where(KnowledgeDocument.bot_id == bot_uuid).order_by(*DOCUMENT_ORDER)
+    )
+    knowledge_hash = content_hash(",".join(f"{digest}:{chunks}" for digest, chunks in result.all()))
+    if previous is not None and previous[2] == knowledge_hash:
+        return previous
+    if full_context:
+        return await knowledge_text(db, bot_uuid), None, knowledge_hash
+    result = await db.execute(
+        select(KnowledgeChunk.content)
+        .join(KnowledgeDocument, KnowledgeDocument.document_id == KnowledgeChunk.document_id)
+        .where(KnowledgeChunk.bot_id == bot_uuid)
+        .order_by(*DOCUMENT_ORDER, KnowledgeChunk.position)
+    )
+    return "", await asyncio.to_thread(add_chunks, empty_index(), result.scalars().all()), knowledge_hash
@@ -0,0 +1,86 @@
+"""
+Write-behind ingestion for variables captured by the widget.
+Captures are queued per worker and flushed in batches. Each flush merges
+captures for the same (bot_id, visitor_session_id) in arrival order, then
+writes them with a single INSERT ... ON CONFLICT that merges into the
+existing captured_data. Concurrent captures for one session therefore can't
+overwrite each other. The first non-empty capture stamps lead_captured_at,
+which the RETURNING clause uses to count new conversations and new leads
+for the analytics rollups. NUL characters are stripped on the way in, since
+jsonb rejects them and they would fail the whole batch.
+"""
+import logging
+import os
+import uuid
+
+from sqlalchemy import cast, func, literal_column
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+
+import analytics
+from batching import BatchWriter, strip_nul
+from database import async_session
+from models import Conversation
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_FLUSH_INTERVAL = float(os.getenv("CAPTURE_FLUSH_INTERVAL", 0.25))
+CAPTURE_BATCH_SIZE = int(os.getenv("CAPTURE_BATCH_SIZE", 1000))
+
+
+def merge_captures(items):
+    """Collapse (bot_uuid, visitor_session_id, variables) items into one dict per session."""
+    merged = {}
+    for bot_uuid, visitor_session_id, variables in items:
+        merged.setdefault((bot_uuid, visitor_session_id), {}).update(variables)
+    return merged
+
+
+def upsert_captures_stmt(merged):
+    rows = [
+        {
+            "conversation_id": uuid.uuid4(),
+            "bot_id": bot_uuid,
+            "visitor_session_id": visitor_session_id,
+            "captured_data": variables,
+            "lead_captured_at": func.now() if variables else None
+        }
+        for (bot_uuid, visitor_session_id), variables in merged.items()
+    ]
+    stmt = pg_insert(Conversation).values(rows)
+    existing = func.coalesce(cast(Conversation.captured_data, JSONB), literal_column("'{}'::jsonb"))
+    return stmt.on_conflict_do_update(
+        index_elements=[Conversation.bot_id, Conversation.visitor_session_id],
+        set_={
+            "captured_data": existing.op("||")(cast(stmt.excluded.captured_data, JSONB)),
+            "lead_captured_at": func.coalesce(Conversation.lead_captured_at, stmt.excluded.lead_captured_at)
+        }
+    ).returning(
+        Conversation.bot_id,
+        # xmax is 0 only for rows this statement inserted rather than updated
+        literal_column("xmax = 0").label("inserted"),
+        # now() is the transaction start, so only leads stamped by this statement match
+        (Conversation.lead_captured_at == func.now()).label("new_lead")
+    )
+
+
+def _record_stats(result):
+    for row in result:
+        analytics.record(row.bot_id, conversations=row.inserted, leads=bool(row.new_lead))
+
+
+async def _flush_captures(items):
+    # A rejected batch is retried item by item by the BatchWriter
+    async with async_session() as db:
+        result = await db.execute(upsert_captures_stmt(merge_captures(items)))
+        rows = result.all()
+        await db.commit()
+    _record_stats(rows)
+
+
+capture_writer = BatchWriter(
+    "captures", _flush_captures, max_batch=CAPTURE_BATCH_SIZE, max_delay=CAPTURE_FLUSH_INTERVAL
+)
+
+
+def queue_capture(bot_uuid: uuid.UUID, visitor_session_id: str, variables: dict):
+    capture_writer.submit((bot_uuid, strip_nul(visitor_session_id), strip_nul(dict(variables))))
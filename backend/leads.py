@@ -0,0 +1,123 @@
+"""
+Leads queries: conversations with non-empty captured_data.
+The emptiness filter runs in SQL and matches the predicate of the partial
+index ix_conversations_bot_leads. Pages use keyset pagination on
+(created_at, conversation_id), and exports stream from a server-side cursor
+so memory stays flat however many leads a bot has.
+"""
+import base64
+import csv
+import io
+import json
+import uuid
+from datetime import datetime
+
+from sqlalchemy import cast, literal_column, tuple_
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.future import select
+
+from database import async_session
+from models import Conversation
+
+LEAD_COLUMNS = {
+    "id": Conversation.conversation_id,
+    "session_id": Conversation.visitor_session_id,
+    "data": Conversation.captured_data,
+    "created_at": Conversation.created_at,
+}
+# Same text as migrate_conversations.LEADS_PREDICATE so the planner can use the partial index
+HAS_CAPTURED_DATA = cast(Conversation.captured_data, JSONB) != literal_column("'{}'::jsonb")
+EXPORT_BATCH_SIZE = 1000
+# Leading characters that make Excel and Sheets evaluate a cell as a formula
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def csv_cell(value):
+    """Quote a visitor-supplied value so spreadsheets show it as text, never run it."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def parse_fields(fields):
+    if not fields:
+        return list(LEAD_COLUMNS)
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in LEAD_COLUMNS]
+    if unknown or not selected:
+        raise ValueError(f"Unknown lead field(s): {', '.join(unknown)}. Allowed: {', '.join(LEAD_COLUMNS)}")
+    return selected
+
+
+def encode_cursor(created_at, conversation_id):
+    raw = f"{created_at.isoformat()}|{conversation_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    created_at, conversation_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+    return datetime.fromisoformat(created_at), uuid.UUID(conversation_id)
+
+
+def leads_query(bot_uuid, fields, since=None, until=None, after=None, limit=None):
+    # The cursor columns are always selected, even if not projected in the response
+    columns = {name: LEAD_COLUMNS[name] for name in fields}
+    columns.setdefault("id", Conversation.conversation_id)
+    columns.setdefault("created_at", Conversation.created_at)
+    stmt = select(*(column.label(name) for name, column in columns.items())).where(
+        Conversation.bot_id == bot_uuid,
+        HAS_CAPTURED_DATA
+    )
+    if since is not None:
+        stmt = stmt.where(Conversation.created_at >= since)
+    if until is not None:
+        stmt = stmt.where(Conversation.created_at < until)
+    if after is not None:
+        stmt = stmt.where(tuple_(Conversation.created_at, Conversation.conversation_id) < tuple_(*after))
+    stmt = stmt.order_by(Conversation.created_at.desc(), Conversation.conversation_id.desc())
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def serialize_lead(row, fields):
+    lead = {}
+    for name in fields:
+        value = getattr(row, name)
+        if name == "id":
+            value = str(value)
+        elif name == "created_at" and value is not None:
+            value = value.isoformat()
+        lead[name] = value
+    return lead
+
+
+async def stream_leads_export(bot_uuid, fmt, since=None, until=None, columns=None):
+    """
+    Yield an NDJSON or CSV export. For CSV, `columns` lists captured variables
+    to flatten into their own columns; otherwise captured data is one JSON column.
+    """
+    fields = list(LEAD_COLUMNS)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow([csv_cell(name) for name in ["id", "session_id", "created_at"] + (columns or ["data"])])
+        yield buffer.getvalue()
+
+    # Own session: the request-scoped one may be closed before a streaming body finishes
+    async with async_session() as db:
+        stmt = leads_query(bot_uuid, fields, since, until).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        result = await db.stream(stmt)
+        async for partition in result.partitions(EXPORT_BATCH_SIZE):
+            buffer.seek(0)
+            buffer.truncate()
+            for row in partition:
+                lead = serialize_lead(row, fields)
+                if fmt == "csv":
+                    data = lead["data"] or {}
+                    values = [data.get(name, "") for name in columns] if columns else [json.dumps(data)]
+                    writer.writerow([csv_cell(value) for value in [lead["id"], lead["session_id"], lead["created_at"]] + values])
+                else:
+                    buffer.write(json.dumps(lead) + "\n")
+            yield buffer.getvalue()
@@ -0,0 +1,332 @@
+"""
+Long-lived client for model calls.
+One LLMClient per worker wraps a provider (Gemini, or FakeProvider for local
+load and failure testing) with a per-attempt timeout inside an overall
+deadline, retries with full-jitter backoff, optional hedging (a second
+request when the first is slower than LLM_HEDGE_AFTER_SECONDS), a circuit
+breaker per model that fails fast while it keeps erroring, and a fallback
+chain of models. Streams are only retried or moved to a fallback model
+before their first chunk has been passed on.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from types import SimpleNamespace
+
+import google.generativeai as genai
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:
+    google_exceptions = None
+
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "models/gemini-3-flash-preview")
+# Comma-separated models tried in order when the primary fails or its circuit is open
+LLM_FALLBACK_MODELS = [m.strip() for m in os.getenv("LLM_FALLBACK_MODELS", "").split(",") if m.strip()]
+# Per attempt (and per stream chunk), and for the whole call including retries and fallbacks
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 30))
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", 45))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", 0.25))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", 2))
+# 0 disables hedging; otherwise roughly the provider's p95 latency
+LLM_HEDGE_AFTER_SECONDS = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", 0))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", 30))
+# "fake" serves every call from FakeProvider, to run the API locally against a slow or failing upstream
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+
+
+class LLMUnavailable(Exception):
+    """Every model in the chain failed, or their circuits are open."""
+
+
+def is_retryable(exc):
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if google_exceptions is not None:
+        return isinstance(exc, (google_exceptions.ServerError, google_exceptions.TooManyRequests))
+    return False
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive failures -> one probe after `reset_timeout`."""
+
+    def __init__(self, name, failure_threshold=LLM_BREAKER_FAILURES, reset_timeout=LLM_BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_started = None
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        if self.state == "open":
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            self.state = "half_open"
+            self._probe_started = None
+        # A probe that never reported back (e.g. cancelled) must not wedge the breaker
+        if self._probe_started is None or now - self._probe_started >= self.reset_timeout:
+            self._probe_started = now
+            return True
+        return False
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"Circuit for {self.name} closed")
+        self.state = "closed"
+        self.failures = 0
+        self._probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Circuit for {self.name} opened after {self.failures} failure(s)")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self._probe_started = None
+
+
+class GeminiProvider:
+    def __init__(self):
+        self._models = {}
+
+    def model(self, name):
+        # GenerativeModel objects are reusable; build each once per worker
+        model = self._models.get(name)
+        if model is None:
+            model = self._models[name] = genai.GenerativeModel(name)
+        return model
+
+    async def generate(self, model, prompt):
+        return await self.model(model).generate_content_async(prompt)
+
+    async def stream(self, model, prompt):
+        return await self.model(model).generate_content_async(prompt, stream=True)
+
+
+class FakeResponse:
+    def __init__(self, text, prompt):
+        self.text = text
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=len(prompt) // 4, candidates_token_count=max(len(text) // 4, 1)
+        )
+
+
+class FakeProvider:
+    """
+    Stand-in upstream for benchmarks and failure drills. Latency is `latency`
+    plus up to `jitter`, with `slow_rate` of calls taking `slow_latency`
+    instead; `failure_rate` of calls raise `error`; models in `down_models`
+    always fail. Seeded, so runs are reproducible.
+    """
+
+    def __init__(self, latency=0.2, jitter=0.05, slow_rate=0.0, slow_latency=5.0, failure_rate=0.0,
+                 down_models=(), error=ConnectionError, answer="This is a stub answer.", chunks=5, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.failure_rate = failure_rate
+        self.down_models = set(down_models)
+        self.error = error
+        self.answer = answer
+        self.chunks = chunks
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    async def _upstream(self, model):
+        self.calls += 1
+        slow = self.random.random() < self.slow_rate
+        delay = self.slow_latency if slow else self.latency + self.random.random() * self.jitter
+        fail = model in self.down_models or self.random.random() < self.failure_rate
+        await asyncio.sleep(delay)
+        if fail:
+            raise self.error(f"fake upstream error from {model}")
+
+    async def generate(self, model, prompt):
+        await self._upstream(model)
+        return FakeResponse(self.answer, prompt)
+
+    async def stream(self, model, prompt):
+        await self._upstream(model)
+        size = max(len(self.answer) // self.chunks, 1)
+        parts = [self.answer[i:i + size] for i in range(0, len(self.answer), size)]
+
+        async def chunks():
+            for part in parts:
+                await asyncio.sleep(self.latency / max(len(parts), 1))
+                yield FakeResponse(part, prompt)
+        return chunks()
+
+
+class LLMClient:
+    def __init__(self, provider=None, models=None, timeout=LLM_TIMEOUT_SECONDS, deadline=LLM_DEADLINE_SECONDS,
+                 max_retries=LLM_MAX_RETRIES, hedge_after=LLM_HEDGE_AFTER_SECONDS):
+        self.provider = provider or GeminiProvider()
+        self.models = list(models or [GEMINI_MODEL, *LLM_FALLBACK_MODELS])
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.hedge_after = hedge_after
+        self.breakers = {model: CircuitBreaker(model) for model in self.models}
+        self.retries = 0
+        self.hedges = 0
+        self.fallbacks = 0
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+
+    async def _hedged(self, model, prompt, timeout):
+        async def attempt():
+            return await asyncio.wait_for(self.provider.generate(model, prompt), timeout=timeout)
+
+        if not self.hedge_after or self.hedge_after >= timeout:
+            return await attempt()
+        tasks = {asyncio.ensure_future(attempt())}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if not done:
+                self.hedges += 1
+                tasks.add(asyncio.ensure_future(attempt()))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def generate(self, prompt, stats=None):
+        plan = _AttemptPlan(self, stats)
+        async for model, timeout in plan:
+            try:
+                response = await self._hedged(model, prompt, timeout)
+            except Exception as e:
+                plan.failed(e)
+                continue
+            plan.succeeded()
+            return response
+        raise plan.unavailable()
+
+    async def stream(self, prompt, stats=None):
+        """Yield response chunks; failures after the first chunk are raised, not retried."""
+        plan = _AttemptPlan(self, stats)
+        async for model, timeout in plan:
+            started = False
+            try:
+                response = await asyncio.wait_for(self.provider.stream(model, prompt), timeout=timeout)
+                chunks = response.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=self.timeout)
+                    except StopAsyncIteration:
+                        break
+                    started = True
+                    yield chunk
+            except Exception as e:
+                if started:
+                    self.breakers[model].record_failure()
+                    raise
+                plan.failed(e)
+                continue
+            plan.succeeded()
+            return
+        raise plan.unavailable()
+
+    def breaker_states(self):
+        return {model: breaker.state for model, breaker in self.breakers.items()}
+
+
+class _AttemptPlan:
+    """
+    Yields (model, attempt timeout) in retry and fallback order, sleeping
+    between retries; the caller reports each attempt with failed() or
+    succeeded() before asking for the next one.
+    """
+
+    def __init__(self, client, stats):
+        self.client = client
+        self.stats = stats
+        self.deadline = time.monotonic() + client.deadline
+        self.model = None
+        self.last_error = None
+        self.fatal = False
+        self._error = None
+
+    async def __aiter__(self):
+        client = self.client
+        for index, model in enumerate(client.models):
+            if self.fatal:
+                return
+            breaker = client.breakers[model]
+            if not breaker.allow():
+                continue
+            if index:
+                client.fallbacks += 1
+                if self.last_error is not None:
+                    logger.warning(f"Falling back to {model}: {self.last_error!r}")
+            for attempt in range(client.max_retries + 1):
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                self.model = model
+                self._error = None
+                if self.stats is not None:
+                    self.stats["model"] = model
+                    self.stats["attempts"] = self.stats.get("attempts", 0) + 1
+                yield model, min(client.timeout, remaining)
+                if self._error is None:
+                    return
+                if self.fatal or attempt == client.max_retries or not breaker.allow():
+                    break
+                client.retries += 1
+                await asyncio.sleep(min(client._backoff(attempt), max(self.deadline - time.monotonic(), 0)))
+
+    def failed(self, error):
+        self._error = self.last_error = error
+        if is_retryable(error):
+            self.client.breakers[self.model].record_failure()
+        else:
+            # Bad requests fail the same way on every model; don't retry or trip the breaker
+            self.fatal = True
+
+    def succeeded(self):
+        self._error = None
+        self.client.breakers[self.model].record_success()
+
+    def unavailable(self):
+        if self.fatal:
+            return self.last_error
+        if self.last_error is None:
+            return LLMUnavailable("All models are failing fast (circuits open)")
+        return LLMUnavailable(f"All models failed: {self.last_error!r}")
+
+
+def make_provider():
+    if LLM_PROVIDER == "fake":
+        logger.warning("LLM_PROVIDER=fake: answers come from the fake provider")
+        return FakeProvider(
+            latency=float(os.getenv("LLM_FAKE_LATENCY", 0.2)),
+            slow_rate=float(os.getenv("LLM_FAKE_SLOW_RATE", 0)),
+            failure_rate=float(os.getenv("LLM_FAKE_FAILURE_RATE", 0)),
+            seed=None,
+        )
+    return GeminiProvider()
+
+
+llm_client = LLMClient(make_provider())
@@ -0,0 +1,70 @@
+"""
+Failure drills for llm_client against the fake provider.
+Runs each scenario (healthy, slow tail with and without hedging, flaky
+upstream, primary model down, full outage) with the same seeded upstream
+and prints success rate, latency percentiles and how many upstream calls
+were made. No network or API key needed.
+
+Usage: python llm_harness.py [requests] [concurrency]
+"""
+import asyncio
+import sys
+import time
+
+from llm_client import FakeProvider, LLMClient
+
+PRIMARY, FALLBACK = "primary", "fallback"
+
+SCENARIOS = [
+    ("healthy", dict(), dict()),
+    ("slow tail, no hedging", dict(slow_rate=0.05, slow_latency=3.0), dict()),
+    ("slow tail, hedged at 0.5s", dict(slow_rate=0.05, slow_latency=3.0), dict(hedge_after=0.5)),
+    ("20% failures, retried", dict(failure_rate=0.2), dict()),
+    ("primary down, fallback chain", dict(down_models=[PRIMARY]), dict()),
+    ("full outage, circuit breaker", dict(down_models=[PRIMARY, FALLBACK]), dict(max_retries=1)),
+]
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+async def run(name, provider_args, client_args, total, concurrency):
+    provider = FakeProvider(latency=0.2, jitter=0.05, **provider_args)
+    client = LLMClient(provider, models=[PRIMARY, FALLBACK], timeout=5, deadline=10, **client_args)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, ok = [], 0
+
+    async def one():
+        nonlocal ok
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await client.generate("What are your opening hours?")
+                ok += 1
+            except Exception:
+                pass
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one() for _ in range(total)))
+    print(
+        f"{name:32} ok {ok / total:6.1%} | p50 {percentile(latencies, 0.5):5.2f}s "
+        f"p95 {percentile(latencies, 0.95):5.2f}s p99 {percentile(latencies, 0.99):5.2f}s | "
+        f"upstream calls {provider.calls:4} retries {client.retries:3} hedges {client.hedges:3} "
+        f"fallbacks {client.fallbacks:3} | circuits {client.breaker_states()}"
+    )
+
+
+async def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    print(f"{total} requests per scenario, {concurrency} concurrent")
+    for name, provider_args, client_args in SCENARIOS:
+        await run(name, provider_args, client_args, total, concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+"""
+Load test for the chat generation path against the fake LLM provider.
+Compares a blocking model call inside an async handler (how chat used to call
+Gemini) with generate_from_prompt_async on a single event loop, i.e. one
+worker. Both wait the same stubbed upstream latency; no network or API key
+needed.
+
+Usage: python load_test_llm.py [requests] [latency_seconds]
+"""
+import asyncio
+import sys
+import time
+
+import utils
+from llm_client import FakeProvider, llm_client
+
+
+async def blocking_handler(latency):
+    # Stand-in for the removed synchronous generate_content call: holds the event loop for the round-trip
+    time.sleep(latency)
+    return "stub answer"
+
+
+async def async_handler(latency):
+    return await utils.generate_from_prompt_async("You are a helpful assistant.\n\nUser Question: question\n\nAnswer:")
+
+
+async def run(handler, total, latency):
+    start = time.perf_counter()
+    results = await asyncio.gather(*(handler(latency) for _ in range(total)), return_exceptions=True)
+    failed = sum(isinstance(result, Exception) for result in results)
+    return time.perf_counter() - start, failed
+
+
+async def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    llm_client.provider = FakeProvider(latency=latency, jitter=0, answer="stub answer")
+
+    # The blocking path is serial, so keep its sample small and extrapolate throughput
+    blocking_total = min(total, 10)
+    blocking_elapsed, _ = await run(blocking_handler, blocking_total, latency)
+    async_elapsed, failed = await run(async_handler, total, latency)
+
+    blocking_rps = blocking_total / blocking_elapsed
+    async_rps = (total - failed) / async_elapsed
+    print(f"Stub latency: {latency:.2f}s | concurrency limit: {utils.LLM_MAX_CONCURRENCY} (queue {utils.LLM_MAX_QUEUE})")
+    print(f"Blocking path: {blocking_total} requests in {blocking_elapsed:.2f}s -> {blocking_rps:.1f} req/s")
+    print(f"Async path:    {total} requests in {async_elapsed:.2f}s -> {async_rps:.1f} req/s ({failed} rejected)")
+    print(f"Speedup: {async_rps / blocking_rps:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
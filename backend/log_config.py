@@ -0,0 +1,188 @@
+"""
+Logging setup for the API workers.
+Handlers only put records on a bounded queue; a QueueListener thread formats
+and writes them, so request handlers never wait on stream I/O. Levels are set
+per subsystem (LOG_LEVELS), chatty INFO loggers are sampled (LOG_SAMPLE), and
+SQL echo stays off unless SQL_ECHO is set or it is switched on at runtime.
+Runtime overrides are shared through Redis when REDIS_URL is set, otherwise
+they apply to the worker that received them.
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" (key=value extras) or "json" (one object per line)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Comma-separated logger=LEVEL pairs, e.g. "lead_capture=DEBUG,ratelimit=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# Comma-separated logger=rate pairs; records below WARNING from these loggers are kept with that probability
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "access=0.01,uvicorn.access=0.01")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() == "true"
+LOG_OVERRIDES_POLL_SECONDS = float(os.getenv("LOG_OVERRIDES_POLL_SECONDS", 10))
+OVERRIDES_KEY = "logging:overrides"
+
+# Attributes every LogRecord has; anything else came from `extra=` and is emitted as a field
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener = None
+_applied_overrides = None
+
+
+def _pairs(spec):
+    for item in spec.split(","):
+        name, sep, value = item.strip().partition("=")
+        if sep and name:
+            yield name.strip(), value.strip()
+
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, fmt="text"):
+        super().__init__()
+        self.fmt = fmt
+
+    def format(self, record):
+        fields = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields.update((k, v) for k, v in vars(record).items() if k not in _RECORD_ATTRS)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            fields["exc"] = record.exc_text
+        if self.fmt == "json":
+            return json.dumps(fields, default=str)
+        extras = " ".join(f"{k}={v}" for k, v in fields.items() if k not in ("ts", "level", "logger", "msg", "exc"))
+        line = f"{fields['ts']} {fields['level']} {fields['logger']}: {fields['msg']}"
+        if extras:
+            line += f" | {extras}"
+        if "exc" in fields:
+            line += "\n" + fields["exc"]
+        return line
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: when the writer thread falls behind, records are dropped and counted."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SampleFilter(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+_queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+
+
+def dropped():
+    return _queue_handler.dropped
+
+
+def set_sql_echo(enabled):
+    # With echo=False on the engine, statement logging follows this logger's level
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO if enabled else logging.WARNING)
+
+
+def configure_logging():
+    """Route the root logger through the queue. Safe to call more than once."""
+    global _listener
+    root = logging.getLogger()
+    if _listener is None:
+        stream = logging.StreamHandler(sys.stderr)
+        stream.setFormatter(StructuredFormatter(LOG_FORMAT))
+        _listener = QueueListener(_queue_handler.queue, stream, respect_handler_level=True)
+        _listener.start()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+    root.setLevel(LOG_LEVEL)
+    set_sql_echo(SQL_ECHO)
+    for name, level in _pairs(LOG_LEVELS):
+        logging.getLogger(name).setLevel(level.upper())
+    for name, rate in _pairs(LOG_SAMPLE):
+        target = logging.getLogger(name)
+        for existing in [f for f in target.filters if isinstance(f, SampleFilter)]:
+            target.removeFilter(existing)
+        target.addFilter(SampleFilter(float(rate)))
+
+
+def stop():
+    """Flush queued records; call last on shutdown."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def apply_overrides(overrides):
+    """Apply {"sql_echo": bool, "levels": {logger: level}}; raises ValueError on an unknown level."""
+    levels = {name: str(level).upper() for name, level in (overrides.get("levels") or {}).items()}
+    for level in levels.values():
+        if not isinstance(logging.getLevelName(level), int):
+            raise ValueError(f"Unknown log level {level!r}")
+    if "sql_echo" in overrides:
+        set_sql_echo(bool(overrides["sql_echo"]))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+
+async def publish_overrides(overrides):
+    """Apply locally and share with the other workers; returns False if only this worker changed."""
+    global _applied_overrides
+    apply_overrides(overrides)
+    _applied_overrides = json.dumps(overrides, sort_keys=True)
+    client = get_redis()
+    if client is None:
+        return False
+    try:
+        await client.set(OVERRIDES_KEY, _applied_overrides)
+        return True
+    except Exception as e:
+        logger.warning(f"Could not share logging overrides: {e}")
+        return False
+
+
+async def watch_overrides():
+    """Background task: pick up overrides published by other workers."""
+    global _applied_overrides
+    client = get_redis()
+    if client is None:
+        return
+    while True:
+        try:
+            raw = await client.get(OVERRIDES_KEY)
+            if raw is not None:
+                raw = raw.decode() if isinstance(raw, bytes) else raw
+                if raw != _applied_overrides:
+                    apply_overrides(json.loads(raw))
+                    _applied_overrides = raw
+        except Exception as e:
+            logger.warning(f"Could not read logging overrides: {e}")
+        await asyncio.sleep(LOG_OVERRIDES_POLL_SECONDS)
@@ -1,23 +1,49 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Request
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
-import shutil
+from typing import Dict, List, Optional
+from datetime import datetime
 import uuid
+import json
+import asyncio
+import hashlib
 import os
+import time
 from dotenv import load_dotenv
+from sqlalchemy import Boolean, case, cast, column, insert, update, values
 from sqlalchemy.future import select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from database import get_db
-from models import Bot, User, Message, Conversation
+from database import engine, get_db
+from models import Bot, User, Message, Conversation, KnowledgeDocument, KnowledgeJob
+from cache import TieredCache
+from bot_runtime import bot_runtime_cache
+from flow_engine import FlowError, flow_cache, flow_shape_errors
+from answer_cache import answer_cache
+from conversation_memory import MEMORY_ENABLED, load_memory, message_writer, record_turn
+from lead_capture import capture_writer, queue_capture
+import analytics
+import ingestion
+import media
+import metrics
+import knowledge_store
+import widget_bundle
+from passwords import hash_password, needs_rehash, verify_password
+import passwords
+from ratelimit import FixedWindowLimiter, Overloaded, TokenBucketLimiter, client_ip
+from leads import decode_cursor, encode_cursor, leads_query, parse_fields, serialize_lead, stream_leads_export
 import logging
+import log_config
 
 load_dotenv()
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+log_config.configure_logging()
 logger = logging.getLogger(__name__)
+# Per-request lines go to their own logger so they can be sampled (LOG_SAMPLE)
+access_logger = logging.getLogger("access")
 
 app = FastAPI(title="Nimmi AI Backend")
 
@@ -26,11 +52,29 @@ app.include_router(payments_router)
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    origin = request.headers.get("origin")
-    logger.info(f"Incoming request: {request.method} {request.url} | Origin: {origin}")
+    if access_logger.isEnabledFor(logging.INFO):
+        # Path only: query strings can carry visitor data
+        access_logger.info(
+            "Incoming request",
+            extra={"method": request.method, "path": request.url.path, "origin": request.headers.get("origin")}
+        )
     response = await call_next(request)
     return response
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    token = metrics.start_request()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template so ids in the path don't explode cardinality
+        route = request.scope.get("route")
+        metrics.finish_request(token, request.method, getattr(route, "path", "unmatched"), status, started)
+
 # CORS Configuration
 app.add_middleware(
     CORSMiddleware,
@@ -38,12 +82,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # Static Files
 os.makedirs("static/uploads", exist_ok=True)
+os.makedirs(media.MEDIA_DIR, exist_ok=True)
+# Content-addressed logo variants; mounted before /static so they get the immutable cache headers
+app.mount(media.MEDIA_URL_PATH, media.ImmutableStaticFiles(directory=media.MEDIA_DIR), name="media")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+log_overrides_task = None
+
 @app.on_event("startup")
 async def on_startup():
     from database import init_db
@@ -53,6 +103,26 @@ async def on_startup():
     except Exception as e:
         logger.error(f"Warning: Database initialization failed: {e}")
         # The app will still run, allowing the frontend to connect and see errors
+    message_writer.start()
+    capture_writer.start()
+    analytics.stats_writer.start()
+    global log_overrides_task
+    log_overrides_task = asyncio.create_task(log_config.watch_overrides())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    from database import engine
+    # Drain write-behind queues before the pool goes away
+    await message_writer.stop()
+    await capture_writer.stop()
+    await analytics.stats_writer.stop()
+    await ingestion.stop()
+    passwords.shutdown()
+    # Close pooled connections cleanly instead of leaving them to the server's idle timeout
+    await engine.dispose()
+    if log_overrides_task is not None:
+        log_overrides_task.cancel()
+    log_config.stop()
 
 # Models
 class BotCreate(BaseModel):
@@ -61,6 +131,22 @@ class BotCreate(BaseModel):
     system_prompt: Optional[str] = "You are a helpful assistant."
     visual_config: Optional[dict] = {"color": "#3b82f6", "logo_url": "", "position": "right"}
 
+class BotSpec(BaseModel):
+    bot_name: str
+    system_prompt: Optional[str] = "You are a helpful assistant."
+    visual_config: Optional[dict] = {"color": "#3b82f6", "logo_url": "", "position": "right"}
+
+class BotBatchCreate(BaseModel):
+    user_id: str
+    bots: List[BotSpec]
+
+class BotBatchUpdate(BaseModel):
+    updates: List[dict] # each {"bot_id": ..., <field>: <value>, ...}
+
+class BotBatchConfig(BaseModel):
+    bot_ids: List[str]
+    include_knowledge: bool = False
+
 class ChatMessage(BaseModel):
     bot_id: str
     message: str
@@ -73,6 +159,18 @@ class VariableCapture(BaseModel):
     variable_name: str
     variable_value: str
 
+class VariableBatchCapture(BaseModel):
+    bot_id: str
+    visitor_session_id: str
+    variables: Dict[str, str]
+
+class FlowStep(BaseModel):
+    bot_id: str
+    visitor_session_id: Optional[str] = None
+    node_id: Optional[str] = None # node awaiting input; omit to start the flow
+    input: Optional[str] = None
+    variables: Dict[str, str] = {}
+
 # Auth Models
 class UserSignup(BaseModel):
     email: str
@@ -87,14 +185,10 @@ class ProfileUpdate(BaseModel):
     name: Optional[str] = None
     email: Optional[str] = None
 
-# Password hashing
-import bcrypt as bcrypt_lib
-
-def hash_password(password: str) -> str:
-    return bcrypt_lib.hashpw(password.encode('utf-8'), bcrypt_lib.gensalt()).decode('utf-8')
-
-def verify_password(password: str, password_hash: str) -> bool:
-    return bcrypt_lib.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+# Password hashing runs on its own bounded pool; logins are throttled per client IP
+LOGIN_MAX_ATTEMPTS = int(os.getenv("LOGIN_MAX_ATTEMPTS", 10))
+LOGIN_WINDOW_SECONDS = int(os.getenv("LOGIN_WINDOW_SECONDS", 60))
+login_limiter = FixedWindowLimiter("login", LOGIN_MAX_ATTEMPTS, LOGIN_WINDOW_SECONDS)
 
 @app.get("/")
 async def root():
@@ -113,7 +207,7 @@ async def signup(user_data: UserSignup, db: AsyncSession = Depends(get_db)):
     new_user = User(
         email=user_data.email,
         name=user_data.name,
-        password_hash=hash_password(user_data.password)
+        password_hash=await hash_password(user_data.password)
     )
     db.add(new_user)
     await db.commit()
@@ -121,7 +215,16 @@ async def signup(user_data: UserSignup, db: AsyncSession = Depends(get_db)):
     return {"message": "Signup successful", "user_id": str(new_user.id), "name": new_user.name}
 
 @app.post("/api/auth/login")
-async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
+async def login(user_data: UserLogin, request: Request, db: AsyncSession = Depends(get_db)):
+    # Throttle before any bcrypt work so a burst can't tie up the hashing pool
+    allowed, retry_after = await login_limiter.hit(client_ip(request))
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many login attempts, please try again later",
+            headers={"Retry-After": str(retry_after)}
+        )
+    
     # Find user by email
     result = await db.execute(select(User).where(User.email == user_data.email))
     user = result.scalars().first()
@@ -134,9 +237,14 @@ async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=401, detail="Please sign up again to set a password")
     
     # Verify password
-    if not verify_password(user_data.password, user.password_hash):
+    if not await verify_password(user_data.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
+    # Upgrade hashes made with a different BCRYPT_ROUNDS while we have the plaintext
+    if needs_rehash(user.password_hash):
+        user.password_hash = await hash_password(user_data.password)
+        await db.commit()
+    
     return {"message": "Login successful", "user_id": str(user.id), "name": user.name or ""}
 
 @app.get("/api/auth/profile")
@@ -188,193 +296,791 @@ async def create_bot(bot_data: BotCreate, db: AsyncSession = Depends(get_db)):
     await db.refresh(new_bot)
     return {"message": "Bot created", "bot_id": str(new_bot.bot_id)}
 
+def parse_path_ids(*ids: str):
+    try:
+        return [uuid.UUID(value) for value in ids]
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Not found")
+
+# Columns PATCH may set directly; knowledge_base goes through knowledge_store
+BOT_UPDATABLE_FIELDS = ("bot_name", "system_prompt", "visual_config", "flow_data", "prompt_token_budget")
+BOTS_BATCH_MAX = int(os.getenv("BOTS_BATCH_MAX", 500))
+PROMPT_TOKEN_BUDGET_MIN, PROMPT_TOKEN_BUDGET_MAX = 256, 1_000_000
+
+def check_bot_fields(fields: dict):
+    budget = fields.get("prompt_token_budget")
+    if budget is not None and (
+        not isinstance(budget, int) or isinstance(budget, bool)
+        or not PROMPT_TOKEN_BUDGET_MIN <= budget <= PROMPT_TOKEN_BUDGET_MAX
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail=f"prompt_token_budget must be an integer from {PROMPT_TOKEN_BUDGET_MIN} to {PROMPT_TOKEN_BUDGET_MAX}"
+        )
+    # Shape only: incomplete flows are saved while being built and reported by /flow/validate
+    flow_errors = flow_shape_errors(fields.get("flow_data"))
+    if flow_errors:
+        raise HTTPException(status_code=400, detail=f"Invalid flow_data: {'; '.join(flow_errors[:5])}")
+
+def batch_update_statement(updates: Dict[uuid.UUID, dict]):
+    """
+    UPDATE bots ... FROM (VALUES ...) for every bot in `updates`, bumping its
+    version and returning the ids that matched. Each row carries a set_<field>
+    flag so fields a bot didn't send keep their value (and None can be set).
+    """
+    columns = Bot.__table__.c
+    fields = [field for field in BOT_UPDATABLE_FIELDS if any(field in changes for changes in updates.values())]
+    changes = values(
+        column("bot_id", Bot.bot_id.type),
+        *(column(field, columns[field].type) for field in fields),
+        *(column(f"set_{field}", Boolean) for field in fields),
+        name="changes"
+    ).data([
+        (bot_uuid, *(bot_changes.get(field) for field in fields), *(field in bot_changes for field in fields))
+        for bot_uuid, bot_changes in updates.items()
+    ])
+    return (
+        update(Bot).where(Bot.bot_id == changes.c.bot_id)
+        .values(
+            content_version=Bot.content_version + 1,
+            # None is sent as a bare NULL, so a column of only NULLs would otherwise come back as text
+            **{
+                field: case((changes.c[f"set_{field}"], cast(changes.c[field], columns[field].type)), else_=columns[field])
+                for field in fields
+            }
+        )
+        .returning(Bot.bot_id)
+    )
+
+def parse_bot_ids(bot_ids: List[str]) -> List[uuid.UUID]:
+    if len(bot_ids) > BOTS_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {BOTS_BATCH_MAX} bots per request")
+    try:
+        return [uuid.UUID(str(bot_id)) for bot_id in bot_ids]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid bot_id")
+
+@app.post("/api/bots/batch")
+async def create_bots(batch: BotBatchCreate, db: AsyncSession = Depends(get_db)):
+    """Create many bots with one multi-row INSERT."""
+    try:
+        user_uuid = uuid.UUID(str(batch.user_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid user_id")
+    if not batch.bots or len(batch.bots) > BOTS_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {BOTS_BATCH_MAX} bots")
+    result = await db.execute(select(User.id).where(User.id == user_uuid))
+    if result.scalar() is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    rows = [
+        {
+            "bot_id": uuid.uuid4(),
+            "user_id": user_uuid,
+            "bot_name": spec.bot_name,
+            "system_prompt": spec.system_prompt,
+            "visual_config": spec.visual_config
+        }
+        for spec in batch.bots
+    ]
+    try:
+        await db.execute(insert(Bot), rows)
+        await db.commit()
+    except IntegrityError:
+        # The user was deleted after the check above
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="User not found")
+    return {"message": f"{len(rows)} bots created", "bot_ids": [str(row["bot_id"]) for row in rows]}
+
+@app.patch("/api/bots/batch")
+async def update_bots(batch: BotBatchUpdate, db: AsyncSession = Depends(get_db)):
+    """Patch many bots with a single UPDATE ... FROM (VALUES ...) that also reports which bots exist."""
+    updates = {}
+    for item in batch.updates:
+        unknown = set(item) - {"bot_id", *BOT_UPDATABLE_FIELDS}
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unsupported field(s): {', '.join(sorted(unknown))}")
+        [bot_uuid] = parse_bot_ids([item.get("bot_id", "")])
+        check_bot_fields(item)
+        updates.setdefault(bot_uuid, {}).update({k: v for k, v in item.items() if k != "bot_id"})
+    parse_bot_ids(list(updates))
+    if not updates:
+        return {"message": "Bots updated", "updated": [], "not_found": []}
+
+    result = await db.execute(batch_update_statement(updates))
+    found = set(result.scalars().all())
+    await db.commit()
+
+    for bot_uuid in found:
+        if "system_prompt" in updates[bot_uuid]:
+            answer_cache.invalidate_bot(bot_uuid)
+        await invalidate_bot_caches(bot_uuid)
+    return {
+        "message": "Bots updated",
+        "updated": [str(bot_uuid) for bot_uuid in updates if bot_uuid in found],
+        "not_found": [str(bot_uuid) for bot_uuid in updates if bot_uuid not in found]
+    }
+
+@app.post("/api/bots/batch/config")
+async def get_bots_config(batch: BotBatchConfig, db: AsyncSession = Depends(get_db)):
+    """Config for many bots in one SELECT (plus one grouped knowledge query when asked for)."""
+    bot_ids = parse_bot_ids(batch.bot_ids)
+    result = await db.execute(
+        select(*BOT_CONFIG_COLUMNS, Bot.knowledge_base.is_not(None).label("has_legacy_knowledge"))
+        .where(Bot.bot_id.in_(bot_ids))
+    )
+    rows = result.all()
+    knowledge = {}
+    if batch.include_knowledge:
+        for row in rows:
+            if row.has_legacy_knowledge:
+                await knowledge_store.migrate_legacy_knowledge(db, row.bot_id)
+        knowledge = await knowledge_store.knowledge_texts(db, [row.bot_id for row in rows])
+    found = {row.bot_id for row in rows}
+    return {
+        "bots": [
+            serialize_bot_config(row, knowledge.get(row.bot_id, "") if batch.include_knowledge else None)
+            for row in rows
+        ],
+        "not_found": [str(bot_uuid) for bot_uuid in bot_ids if bot_uuid not in found]
+    }
+
 @app.get("/api/bots")
 async def list_bots(user_id: str, db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(Bot).where(Bot.user_id == user_id))
     bots = result.scalars().all()
+    totals = await analytics.bot_totals(db, [bot.bot_id for bot in bots])
     return [
         {
             "id": str(bot.bot_id),
             "name": bot.bot_name,
             "status": "Active" if bot.is_active else "Inactive",
-            "conversations": 0, # Placeholder
-            "lastActive": "Just now"
+            "conversations": totals.get(bot.bot_id, {}).get("conversations", 0),
+            "leads": totals.get(bot.bot_id, {}).get("leads", 0),
+            "lastActive": analytics.humanize_last_active(totals.get(bot.bot_id, {}).get("last_active"))
         }
         for bot in bots
     ]
 
+@app.get("/api/bots/{bot_id}/analytics")
+async def get_bot_analytics(
+    bot_id: str,
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Per-bucket counters read from the bot_stats_hourly / bot_stats_daily rollups."""
+    try:
+        bot_uuid = uuid.UUID(bot_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    series = await analytics.bot_series(db, bot_uuid, granularity, since, until)
+    return {"bot_id": bot_id, "granularity": granularity, "series": series}
+
+BOT_CONFIG_COLUMNS = (
+    Bot.bot_id, Bot.bot_name, Bot.system_prompt, Bot.visual_config, Bot.flow_data,
+    Bot.prompt_token_budget, Bot.is_active, Bot.export_unlocked, Bot.created_at
+)
+
+def serialize_bot_config(row, knowledge_base=None):
+    config = {
+        "bot_id": str(row.bot_id),
+        "bot_name": row.bot_name,
+        "system_prompt": row.system_prompt,
+        "visual_config": row.visual_config,
+        "flow_data": row.flow_data,
+        "prompt_token_budget": row.prompt_token_budget,
+        "is_active": row.is_active,
+        "export_unlocked": row.export_unlocked,
+        "created_at": row.created_at
+    }
+    if knowledge_base is not None:
+        config["knowledge_base"] = knowledge_base
+    return config
+
 @app.get("/api/bots/{bot_id}/config")
 async def get_bot_config(bot_id: str, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Bot).where(Bot.bot_id == bot_id))
-    bot = result.scalars().first()
-    if not bot:
+    [bot_uuid] = parse_path_ids(bot_id)
+    result = await db.execute(select(*BOT_CONFIG_COLUMNS).where(Bot.bot_id == bot_uuid))
+    row = result.first()
+    if not row:
         raise HTTPException(status_code=404, detail="Bot not found")
     
-    return {
-        "bot_id": str(bot.bot_id),
-        "bot_name": bot.bot_name,
-        "system_prompt": bot.system_prompt,
-        "visual_config": bot.visual_config,
-        "flow_data": bot.flow_data,
-        "knowledge_base": bot.knowledge_base,
-        "is_active": bot.is_active,
-        "export_unlocked": bot.export_unlocked,
-        "created_at": bot.created_at
+    await knowledge_store.migrate_legacy_knowledge(db, bot_uuid)
+    return serialize_bot_config(row, await knowledge_store.knowledge_text(db, bot_uuid))
+
+# Widget-facing view of a bot: only what the embed needs, cached per worker (and in Redis when configured).
+# An edit reaches other workers once their local entry expires, so the local ttl stays short.
+WIDGET_CONFIG_MAX_AGE = int(os.getenv("WIDGET_CONFIG_MAX_AGE", 60))
+widget_config_cache = TieredCache(
+    "widget-config",
+    maxsize=int(os.getenv("WIDGET_CONFIG_CACHE_SIZE", 2048)),
+    ttl=int(os.getenv("WIDGET_CONFIG_CACHE_TTL", 30))
+)
+
+async def load_widget_config(bot_uuid: uuid.UUID, db: AsyncSession):
+    key = str(bot_uuid)
+    entry = await widget_config_cache.get(key)
+    if entry is not None:
+        return entry
+    
+    result = await db.execute(
+        select(Bot.bot_id, Bot.bot_name, Bot.visual_config, Bot.flow_data, Bot.is_active)
+        .where(Bot.bot_id == bot_uuid)
+    )
+    row = result.first()
+    if not row:
+        return None
+    
+    body = json.dumps({
+        "bot_id": str(row.bot_id),
+        "bot_name": row.bot_name,
+        "visual_config": row.visual_config,
+        "flow_data": row.flow_data,
+        "is_active": row.is_active
+    }, separators=(",", ":"))
+    entry = {"body": body, "etag": f'"{hashlib.sha256(body.encode()).hexdigest()[:32]}"'}
+    await widget_config_cache.set(key, entry)
+    return entry
+
+@app.get("/api/bots/{bot_id}/widget-config")
+async def get_widget_config(bot_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    try:
+        bot_uuid = uuid.UUID(bot_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    
+    entry = await load_widget_config(bot_uuid, db)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    
+    headers = {
+        "ETag": entry["etag"],
+        "Cache-Control": f"public, max-age={WIDGET_CONFIG_MAX_AGE}, stale-while-revalidate={WIDGET_CONFIG_MAX_AGE * 5}"
     }
+    if request.headers.get("if-none-match") == entry["etag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+WIDGET_BUNDLE_MAX_AGE = int(os.getenv("WIDGET_BUNDLE_MAX_AGE", WIDGET_CONFIG_MAX_AGE))
+
+@app.get("/api/bots/{bot_id}/widget.js")
+async def get_widget_bundle(bot_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    """Minified widget with the bot's widget config inlined: one request instead of script + config fetch."""
+    try:
+        bot_uuid = uuid.UUID(bot_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    
+    entry = await load_widget_config(bot_uuid, db)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    try:
+        bundle = await widget_bundle.get(str(bot_uuid), entry["body"], entry["etag"])
+    except widget_bundle.WidgetUnavailable as e:
+        logger.error(str(e))
+        raise HTTPException(status_code=503, detail="Widget bundle unavailable")
+    
+    encoding = widget_bundle.negotiate(request.headers.get("accept-encoding"))
+    headers = {
+        "ETag": f'"{bundle["version"]}-{encoding}"',
+        "Cache-Control": f"public, max-age={WIDGET_BUNDLE_MAX_AGE}, stale-while-revalidate={WIDGET_BUNDLE_MAX_AGE * 5}",
+        "Vary": "Accept-Encoding"
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=bundle[encoding], media_type="application/javascript; charset=utf-8", headers=headers)
+
+async def invalidate_bot_caches(bot_id):
+    bot_runtime_cache.invalidate(bot_id)
+    flow_cache.invalidate(bot_id)
+    await widget_config_cache.invalidate(str(bot_id))
+    widget_bundle.bundle_cache.invalidate(str(bot_id))
 
 @app.patch("/api/bots/{bot_id}")
 async def update_bot(bot_id: str, bot_data: dict, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Bot).where(Bot.bot_id == bot_id))
-    bot = result.scalars().first()
-    if not bot:
+    """Partial update: only the fields sent are written, in a single UPDATE without loading the bot."""
+    [bot_uuid] = parse_path_ids(bot_id)
+    changes = {field: bot_data[field] for field in BOT_UPDATABLE_FIELDS if field in bot_data}
+    check_bot_fields(changes)
+    # The locked pre-image lets RETURNING report whether the prompt really changed
+    before = select(Bot.bot_id, Bot.system_prompt).where(Bot.bot_id == bot_uuid).with_for_update().cte("before")
+    result = await db.execute(
+        update(Bot).where(Bot.bot_id == before.c.bot_id)
+        .values(**changes, content_version=Bot.content_version + 1)
+        .returning(before.c.system_prompt.is_distinct_from(Bot.system_prompt).label("prompt_changed"))
+    )
+    row = result.first()
+    if not row:
         raise HTTPException(status_code=404, detail="Bot not found")
-    
-    if "bot_name" in bot_data:
-        bot.bot_name = bot_data["bot_name"]
-    if "system_prompt" in bot_data:
-        bot.system_prompt = bot_data["system_prompt"]
-    if "visual_config" in bot_data:
-        bot.visual_config = bot_data["visual_config"]
-    if "flow_data" in bot_data:
-        bot.flow_data = bot_data["flow_data"]
-    if "knowledge_base" in bot_data:
-        bot.knowledge_base = bot_data["knowledge_base"]
+    if row.prompt_changed:
+        answer_cache.invalidate_bot(bot_uuid)
+    if "knowledge_base" in bot_data and await knowledge_store.replace_knowledge(db, bot_uuid, bot_data["knowledge_base"] or ""):
+        answer_cache.invalidate_bot(bot_uuid)
     
     await db.commit()
+    await invalidate_bot_caches(bot_uuid)
     return {"message": "Bot updated"}
 
-from utils import extract_text_from_pdf, extract_text_from_txt, generate_ai_response
+from llm_client import llm_client
+from prompt_builder import token_counter
+from utils import generate_from_prompt_async, llm_slots, stream_from_prompt_async
 
 @app.post("/api/bots/{bot_id}/logo")
 async def upload_logo(bot_id: str, file: UploadFile = File(...)):
-    # Validate file type
-    if not file.content_type.startswith("image/"):
+    """Store resized WebP/PNG variants of a logo; `logo_url` is the default-size WebP."""
+    if not (file.content_type or "").startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
     
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join("static/uploads", unique_filename)
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Return the URL for the logo
-    logo_url = f"{os.getenv('BACKEND_URL', 'http://localhost:8000')}/static/uploads/{unique_filename}"
-    return {"logo_url": logo_url}
+    try:
+        logo_url, variants = await media.store_image(file)
+    except ingestion.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except media.InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except media.MediaUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"logo_url": logo_url, "variants": variants}
 
-@app.post("/api/bots/{bot_id}/knowledge/upload")
-async def upload_knowledge(bot_id: str, file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Bot).where(Bot.bot_id == bot_id))
-    bot = result.scalars().first()
-    if not bot:
+@app.post("/api/bots/{bot_id}/knowledge/upload", status_code=202)
+async def upload_knowledge(
+    bot_id: str,
+    file: UploadFile = File(...),
+    replace: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Queue a knowledge file for background ingestion; poll the returned job for progress.
+    With `replace`, that document is deleted once the new one is fully ingested.
+    """
+    [bot_uuid] = parse_path_ids(bot_id)
+    result = await db.execute(select(Bot.bot_id).where(Bot.bot_id == bot_uuid))
+    if result.scalar() is None:
         raise HTTPException(status_code=404, detail="Bot not found")
+    replaces = None
+    if replace:
+        [replaces] = parse_path_ids(replace)
+        result = await db.execute(
+            select(KnowledgeDocument.document_id).where(
+                KnowledgeDocument.document_id == replaces, KnowledgeDocument.bot_id == bot_uuid
+            )
+        )
+        if result.scalar() is None:
+            raise HTTPException(status_code=404, detail="Document not found")
     
-    extracted_text = ""
-    if file.filename.endswith(".pdf"):
-        extracted_text = extract_text_from_pdf(file.file)
-    elif file.filename.endswith(".txt"):
-        extracted_text = extract_text_from_txt(file.file)
-    else:
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    if suffix not in ingestion.SUPPORTED_EXTENSIONS:
         raise HTTPException(status_code=400, detail="Only PDF and TXT files are supported")
     
-    if not extracted_text:
-        raise HTTPException(status_code=400, detail="Could not extract text from file")
+    try:
+        path, digest = await ingestion.save_upload(file, suffix)
+    except ingestion.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     
-    # Append to existing knowledge base
-    if bot.knowledge_base:
-        bot.knowledge_base += "\n\n" + extracted_text
-    else:
-        bot.knowledge_base = extracted_text
+    await knowledge_store.migrate_legacy_knowledge(db, bot_uuid)
+    document_id = await knowledge_store.create_document(db, bot_uuid, file.filename, digest)
+    if document_id is None:
+        os.remove(path)
+        result = await db.execute(
+            select(KnowledgeDocument.document_id).where(
+                KnowledgeDocument.bot_id == bot_uuid, KnowledgeDocument.content_hash == digest
+            )
+        )
+        return {"message": "Document already uploaded", "bot_id": bot_id, "filename": file.filename, "document_id": str(result.scalar()), "status": "duplicate"}
     
+    job_id = uuid.uuid4()
+    db.add(KnowledgeJob(
+        job_id=job_id, bot_id=bot_uuid, document_id=document_id, replaces_document_id=replaces,
+        filename=file.filename, status="queued"
+    ))
     await db.commit()
-    return {"message": "Knowledge updated", "bot_id": bot_id, "filename": file.filename, "knowledge_base": bot.knowledge_base}
+    ingestion.start_job(job_id, bot_uuid, document_id, path, replaces)
+    return {"message": "Knowledge upload queued", "bot_id": bot_id, "filename": file.filename, "document_id": str(document_id), "job_id": str(job_id), "status": "queued"}
 
-@app.post("/api/chat/message")
-async def chat_message(chat: ChatMessage, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Bot).where(Bot.bot_id == chat.bot_id))
-    bot = result.scalars().first()
-    if not bot:
+@app.get("/api/bots/{bot_id}/knowledge/documents")
+async def list_knowledge_documents(bot_id: str, db: AsyncSession = Depends(get_db)):
+    [bot_uuid] = parse_path_ids(bot_id)
+    await knowledge_store.migrate_legacy_knowledge(db, bot_uuid)
+    documents = await knowledge_store.list_documents(db, bot_uuid)
+    return [knowledge_store.serialize_document(document) for document in documents]
+
+@app.delete("/api/bots/{bot_id}/knowledge/documents/{document_id}")
+async def delete_knowledge_document(bot_id: str, document_id: str, db: AsyncSession = Depends(get_db)):
+    bot_uuid, document_uuid = parse_path_ids(bot_id, document_id)
+    if not await knowledge_store.delete_document(db, bot_uuid, document_uuid):
+        raise HTTPException(status_code=404, detail="Document not found")
+    await db.commit()
+    answer_cache.invalidate_bot(bot_uuid)
+    bot_runtime_cache.invalidate(bot_uuid)
+    return {"message": "Document deleted", "document_id": document_id}
+
+@app.get("/api/bots/{bot_id}/knowledge/jobs/{job_id}")
+async def get_knowledge_job(bot_id: str, job_id: str, db: AsyncSession = Depends(get_db)):
+    bot_uuid, job_uuid = parse_path_ids(bot_id, job_id)
+    result = await db.execute(
+        select(KnowledgeJob).where(KnowledgeJob.job_id == job_uuid, KnowledgeJob.bot_id == bot_uuid)
+    )
+    job = result.scalars().first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if ingestion.is_stale(job):
+        await ingestion.fail_stale_jobs(db, bot_uuid)
+        await db.refresh(job)
+    return ingestion.serialize_job(job)
+
+CHAT_FALLBACK_ANSWER = "Sorry, I'm having trouble thinking right now. Please try again."
+
+async def get_chat_runtime(chat: ChatMessage, db: AsyncSession):
+    try:
+        bot_uuid = uuid.UUID(chat.bot_id)
+    except ValueError:
         raise HTTPException(status_code=404, detail="Bot not found")
     
-    system_prompt = bot.system_prompt or "You are a helpful assistant."
-    knowledge_context = bot.knowledge_base or ""
+    runtime = await bot_runtime_cache.get(bot_uuid, db)
+    if not runtime:
+        raise HTTPException(status_code=404, detail="Bot not found")
     
-    logger.info(f"Generating AI response for Bot: {bot.bot_id}")
-    logger.info(f"Query: {chat.message}")
-    logger.info(f"Context Length: {len(knowledge_context)} characters")
+    memory = await load_memory(db, bot_uuid, chat.visitor_session_id) if MEMORY_ENABLED else None
+    return runtime, memory
+
+# Token buckets: sustained messages per second and burst, per visitor session and per bot
+CHAT_SESSION_RATE = float(os.getenv("CHAT_SESSION_RATE", 0.5))
+CHAT_SESSION_BURST = int(os.getenv("CHAT_SESSION_BURST", 5))
+CHAT_BOT_RATE = float(os.getenv("CHAT_BOT_RATE", 10))
+CHAT_BOT_BURST = int(os.getenv("CHAT_BOT_BURST", 50))
+CHAT_BUSY_MESSAGE = "The assistant is busy right now, please try again in a moment."
+chat_session_limiter = TokenBucketLimiter("chat_session", CHAT_SESSION_RATE, CHAT_SESSION_BURST)
+chat_bot_limiter = TokenBucketLimiter("chat_bot", CHAT_BOT_RATE, CHAT_BOT_BURST)
+
+def too_many_requests(detail: str, retry_after: int):
+    return HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(retry_after)})
+
+async def admit_chat(chat: ChatMessage):
+    """Reject before any database or model work when the session or bot is over its rate."""
+    # Session first, so one noisy visitor doesn't spend the bot's shared budget
+    allowed, retry_after = await chat_session_limiter.take(f"{chat.bot_id}:{chat.visitor_session_id}")
+    if allowed:
+        allowed, retry_after = await chat_bot_limiter.take(chat.bot_id)
+    if not allowed:
+        raise too_many_requests("Too many messages, please slow down", retry_after)
+    if llm_slots.saturated():
+        raise too_many_requests(CHAT_BUSY_MESSAGE, llm_slots.retry_after)
+
+def get_cached_answer(runtime, memory, chat: ChatMessage):
+    # Follow-up questions depend on the conversation, so only opening questions are cacheable
+    if memory is not None and not memory.is_empty():
+        return None
+    return answer_cache.get(runtime, chat.message)
+
+def build_chat_prompt(runtime, memory, chat: ChatMessage, llm_stats: dict):
+    built = runtime.build_prompt(chat.message, memory=memory)
+    llm_stats["estimated_prompt_tokens"] = built.tokens
+    metrics.prompt_tokens.observe(built.tokens)
+    for part in built.trimmed:
+        metrics.prompt_parts_trimmed.inc(part)
     
+    # Never log the visitor's message itself
+    logger.debug(
+        "Generating AI response",
+        extra={"bot_id": str(runtime.bot_id), "prompt_tokens": built.tokens, "budget": built.budget, "trimmed": built.trimmed}
+    )
+    return built.text
+
+def record_chat_llm_call(runtime, llm_stats: dict, error: bool = False):
+    analytics.record_llm_call(runtime.bot_id, llm_stats, error=error)
+    if not error:
+        # Keeps the offline token estimate in line with what the provider bills
+        token_counter.observe(llm_stats.get("estimated_prompt_tokens", 0), llm_stats.get("prompt_tokens", 0))
+
+def finish_turn(runtime, memory, chat: ChatMessage, answer: str, cacheable: bool):
+    if cacheable and (memory is None or memory.is_empty()):
+        answer_cache.set(runtime, chat.message, answer)
+    analytics.record(runtime.bot_id, messages=2)
+    if memory is not None:
+        record_turn(memory, chat.message, answer)
+
+@app.post("/api/chat/message")
+async def chat_message(chat: ChatMessage, db: AsyncSession = Depends(get_db)):
+    await admit_chat(chat)
+    runtime, memory = await get_chat_runtime(chat, db)
+    
+    cached = get_cached_answer(runtime, memory, chat)
+    if cached is not None:
+        finish_turn(runtime, memory, chat, cached, cacheable=False)
+        return {
+            "answer": cached,
+            "bot_id": chat.bot_id
+        }
+    
+    llm_stats = {}
     try:
-        answer = generate_ai_response(system_prompt, knowledge_context, chat.message)
+        answer = await generate_from_prompt_async(build_chat_prompt(runtime, memory, chat, llm_stats), stats=llm_stats)
+        record_chat_llm_call(runtime, llm_stats)
+        finish_turn(runtime, memory, chat, answer, cacheable=True)
         return {
             "answer": answer,
             "bot_id": chat.bot_id
         }
+    except Overloaded as e:
+        raise too_many_requests(CHAT_BUSY_MESSAGE, e.retry_after)
     except Exception as e:
         logger.error(f"AI Response Error: {e}")
+        record_chat_llm_call(runtime, llm_stats, error=True)
         return {
-            "answer": "Sorry, I'm having trouble thinking right now. Please try again.",
+            "answer": CHAT_FALLBACK_ANSWER,
             "bot_id": chat.bot_id
         }
 
-@app.post("/api/chat/variables")
-async def capture_variables(data: VariableCapture, db: AsyncSession = Depends(get_db)):
-    logger.info(f"Capturing variable: {data.variable_name} = {data.variable_value} for bot: {data.bot_id} | Session: {data.visitor_session_id}")
-    # Find or create conversation
-    result = await db.execute(
-        select(Conversation).where(
-            Conversation.bot_id == uuid.UUID(data.bot_id),
-            Conversation.visitor_session_id == data.visitor_session_id
-        )
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.post("/api/chat/stream")
+async def chat_stream(chat: ChatMessage, db: AsyncSession = Depends(get_db)):
+    """Same as /api/chat/message, but forwards tokens as server-sent events as they arrive."""
+    await admit_chat(chat)
+    runtime, memory = await get_chat_runtime(chat, db)
+    cached = get_cached_answer(runtime, memory, chat)
+    llm_stats = {}
+    prompt = build_chat_prompt(runtime, memory, chat, llm_stats) if cached is None else None
+
+    async def event_stream():
+        if cached is not None:
+            finish_turn(runtime, memory, chat, cached, cacheable=False)
+            yield sse_event({"token": cached})
+            yield sse_event({"bot_id": chat.bot_id}, event="done")
+            return
+        
+        tokens = []
+        try:
+            async for token in stream_from_prompt_async(prompt, stats=llm_stats):
+                tokens.append(token)
+                yield sse_event({"token": token})
+            record_chat_llm_call(runtime, llm_stats)
+            finish_turn(runtime, memory, chat, "".join(tokens), cacheable=True)
+        except Overloaded as e:
+            # Headers are already sent; the client gets the same retry hint as a 429 in the event
+            yield sse_event({"token": CHAT_BUSY_MESSAGE})
+            yield sse_event({"message": "busy", "retry_after": e.retry_after}, event="error")
+        except Exception as e:
+            logger.error(f"AI Stream Error: {e}")
+            record_chat_llm_call(runtime, llm_stats, error=True)
+            if not tokens:
+                yield sse_event({"token": CHAT_FALLBACK_ANSWER})
+            yield sse_event({"message": "generation failed"}, event="error")
+        yield sse_event({"bot_id": chat.bot_id}, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Disable proxy buffering so tokens reach the browser immediately
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    conv = result.scalars().first()
-    
-    if not conv:
-        conv = Conversation(
-            bot_id=uuid.UUID(data.bot_id),
-            visitor_session_id=data.visitor_session_id,
-            captured_data={}
-        )
-        db.add(conv)
-        await db.commit()
-        await db.refresh(conv)
-    
-    # Update captured data
-    captured = dict(conv.captured_data or {})
-    captured[data.variable_name] = data.variable_value
-    conv.captured_data = captured
-    
-    db.add(conv)
-    await db.commit()
+
+@app.post("/api/flows/step")
+async def flow_step(step: FlowStep, db: AsyncSession = Depends(get_db)):
+    """Advance a visitor through the bot's compiled flow; inputs are captured like /api/chat/variables."""
+    try:
+        bot_uuid = uuid.UUID(step.bot_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    flow = await flow_cache.get(bot_uuid, db)
+    if flow is None:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    try:
+        result = flow.step(step.node_id, step.input, step.variables)
+    except FlowError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if result["captured"] and step.visitor_session_id:
+        queue_capture(bot_uuid, step.visitor_session_id, result["captured"])
+    return {**result, "done": result["node"] is None, "version": flow.version}
+
+@app.get("/api/bots/{bot_id}/flow/validate")
+async def validate_flow(bot_id: str, db: AsyncSession = Depends(get_db)):
+    try:
+        bot_uuid = uuid.UUID(bot_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    flow = await flow_cache.get(bot_uuid, db)
+    if flow is None:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    return {"valid": not flow.errors, "errors": flow.errors, "nodes": len(flow.nodes), "version": flow.version}
+
+@app.get("/api/metrics/cache")
+async def cache_metrics():
+    return {
+        "answers": answer_cache.stats(),
+        "bot_runtime": bot_runtime_cache.stats(),
+        "flows": flow_cache.stats(),
+        "widget_config": widget_config_cache.stats(),
+        "widget_bundle": widget_bundle.bundle_cache.stats()
+    }
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+METRICS_CACHES = {
+    "answers": answer_cache,
+    "bot_runtime": bot_runtime_cache,
+    "flows": flow_cache,
+    "widget_config": widget_config_cache,
+    "widget_bundle": widget_bundle.bundle_cache,
+}
+METRICS_WRITERS = (message_writer, capture_writer, analytics.stats_writer)
+
+def _cache_stat(key):
+    return lambda: {(name, ): cache.stats().get(key) for name, cache in METRICS_CACHES.items()}
+
+def _writer_stat(attr):
+    return lambda: {(writer.name, ): getattr(writer, attr) for writer in METRICS_WRITERS}
+
+def _pool_stat(method):
+    # NullPool has no checkout accounting
+    return lambda: getattr(engine.sync_engine.pool, method, lambda: None)()
+
+metrics.CallbackMetric("cache_hits_total", "Cache hits", _cache_stat("hits"), labels=("cache",), type="counter")
+metrics.CallbackMetric("cache_misses_total", "Cache misses", _cache_stat("misses"), labels=("cache",), type="counter")
+metrics.CallbackMetric("db_pool_checked_out", "Connections currently checked out", _pool_stat("checkedout"))
+metrics.CallbackMetric("db_pool_size", "Configured pool size", _pool_stat("size"))
+metrics.CallbackMetric("db_pool_overflow", "Overflow connections in use (negative while below pool size)", _pool_stat("overflow"))
+metrics.CallbackMetric("llm_in_flight", "Model calls holding a concurrency slot", lambda: llm_slots.in_flight)
+metrics.CallbackMetric("llm_waiting", "Model calls queued for a concurrency slot", lambda: llm_slots.waiting)
+metrics.CallbackMetric("llm_rejected_total", "Model calls rejected by admission control", lambda: llm_slots.rejected, type="counter")
+metrics.CallbackMetric(
+    "llm_circuit_open", "1 while a model's circuit breaker is open or probing",
+    lambda: {(model, ): int(state != "closed") for model, state in llm_client.breaker_states().items()},
+    labels=("model",)
+)
+metrics.CallbackMetric(
+    "llm_resilience_events_total", "Model call retries, hedged requests and fallbacks",
+    lambda: {("retry", ): llm_client.retries, ("hedge", ): llm_client.hedges, ("fallback", ): llm_client.fallbacks},
+    labels=("event",), type="counter"
+)
+metrics.CallbackMetric(
+    "chat_rate_limited_total", "Chat requests rejected by token buckets",
+    lambda: {(limiter.name, ): limiter.rejected for limiter in (chat_session_limiter, chat_bot_limiter)},
+    labels=("limiter",), type="counter"
+)
+metrics.CallbackMetric("batch_writer_pending", "Items queued for write-behind", lambda: {(w.name, ): w.pending() for w in METRICS_WRITERS}, labels=("writer",))
+metrics.CallbackMetric("batch_writer_flushed_total", "Items written", _writer_stat("flushed"), labels=("writer",), type="counter")
+metrics.CallbackMetric("batch_writer_dropped_total", "Items dropped on a full queue", _writer_stat("dropped"), labels=("writer",), type="counter")
+metrics.CallbackMetric("login_rejected_total", "Login attempts rejected by the rate limiter", lambda: login_limiter.rejected, type="counter")
+metrics.CallbackMetric("log_records_dropped_total", "Log records dropped on a full log queue", log_config.dropped, type="counter")
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    # Traffic, routes and backend internals are not public: the endpoint is off until a scrape token is set
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def require_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if request.headers.get("authorization") != f"Bearer {ADMIN_TOKEN}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+class LoggingOverrides(BaseModel):
+    sql_echo: Optional[bool] = None
+    levels: Dict[str, str] = {}
+
+@app.put("/api/admin/logging", include_in_schema=False)
+async def update_logging(overrides: LoggingOverrides, request: Request):
+    require_admin(request)
+    try:
+        shared = await log_config.publish_overrides(overrides.model_dump(exclude_none=True))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "scope": "all workers" if shared else "this worker"}
+
+def parse_capture_bot_id(bot_id: str) -> uuid.UUID:
+    try:
+        return uuid.UUID(bot_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid bot_id")
+
+@app.post("/api/chat/variables")
+async def capture_variables(data: VariableCapture):
+    logger.debug("Capturing variable", extra={"bot_id": data.bot_id, "variable": data.variable_name})
+    # Queued and upserted in batches by lead_capture; typically visible in leads within CAPTURE_FLUSH_INTERVAL
+    captured = {data.variable_name: data.variable_value}
+    queue_capture(parse_capture_bot_id(data.bot_id), data.visitor_session_id, captured)
     return {"status": "success", "captured": captured}
 
+@app.post("/api/chat/variables/batch")
+async def capture_variables_batch(data: VariableBatchCapture):
+    """Capture every field of a multi-field form in one request."""
+    if not data.variables:
+        raise HTTPException(status_code=400, detail="No variables to capture")
+    queue_capture(parse_capture_bot_id(data.bot_id), data.visitor_session_id, data.variables)
+    return {"status": "success", "captured": data.variables}
+
+LEADS_DEFAULT_LIMIT = int(os.getenv("LEADS_DEFAULT_LIMIT", 500))
+LEADS_MAX_LIMIT = int(os.getenv("LEADS_MAX_LIMIT", 5000))
+
+def parse_leads_bot_id(bot_id: str) -> uuid.UUID:
+    try:
+        return uuid.UUID(bot_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Bot not found")
+
 @app.get("/api/bots/{bot_id}/leads")
-async def get_bot_leads(bot_id: str, db: AsyncSession = Depends(get_db)):
-    logger.info(f"Fetching leads for bot: {bot_id}")
+async def get_bot_leads(
+    bot_id: str,
+    response: Response,
+    limit: int = Query(LEADS_DEFAULT_LIMIT, ge=1, le=LEADS_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Newest leads first. When more remain, the X-Next-Cursor header holds the
+    cursor for the next page. `fields` is a comma-separated subset of
+    id, session_id, data, created_at.
+    """
+    bot_uuid = parse_leads_bot_id(bot_id)
     try:
-        bot_uuid = uuid.UUID(bot_id)
-        result = await db.execute(
-            select(Conversation).where(
-                Conversation.bot_id == bot_uuid
-            ).order_by(Conversation.created_at.desc())
-        )
-        conversations = result.scalars().all()
-        
-        # Filter conversations that have captured data manually to avoid DB comparison issues
-        leads = [
-            {
-                "id": str(conv.conversation_id),
-                "session_id": conv.visitor_session_id,
-                "data": conv.captured_data,
-                "created_at": conv.created_at
-            }
-            for conv in conversations if conv.captured_data and len(conv.captured_data) > 0
-        ]
-        
-        logger.info(f"Found {len(leads)} leads for bot {bot_id}")
-        return leads
+        selected = parse_fields(fields)
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        # One extra row tells us whether there is a next page
+        result = await db.execute(leads_query(bot_uuid, selected, since, until, after, limit + 1))
+        rows = result.all()
     except Exception as e:
         logger.error(f"Error fetching leads: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+    
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return [serialize_lead(row, selected) for row in rows]
+
+@app.get("/api/bots/{bot_id}/leads/export")
+async def export_bot_leads(
+    bot_id: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    columns: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """Stream every lead as NDJSON or CSV. For CSV, `columns` names captured variables to split out."""
+    bot_uuid = parse_leads_bot_id(bot_id)
+    column_list = [c.strip() for c in columns.split(",") if c.strip()] if columns else None
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_leads_export(bot_uuid, format, since, until, column_list),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="leads-{bot_uuid}.{format}"'}
+    )
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,135 @@
+"""
+Logo and image uploads.
+An upload is streamed to a temp file under a size cap, decoded in a worker
+thread and re-encoded as WebP plus a PNG fallback at a few widths. Variant
+files are named after the sha256 of the original bytes, so re-uploading the
+same image reuses the stored files, and a URL's content never changes: they
+are served with a year-long immutable Cache-Control.
+"""
+import asyncio
+import logging
+import os
+import tempfile
+
+from fastapi.staticfiles import StaticFiles
+
+import ingestion
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
+MEDIA_DIR = os.getenv("MEDIA_DIR", "static/media")
+MEDIA_URL_PATH = "/static/media"
+MEDIA_MAX_UPLOAD_MB = int(os.getenv("MEDIA_MAX_UPLOAD_MB", 5))
+# Longest side of each variant in pixels; the widget draws logos at up to 60px, so 128 covers 2x screens
+MEDIA_SIZES = [int(size) for size in os.getenv("MEDIA_SIZES", "64,128,256").split(",")]
+MEDIA_DEFAULT_SIZE = int(os.getenv("MEDIA_DEFAULT_SIZE", 128))
+# Refuse images that decode to more pixels than this (decompression bombs)
+MEDIA_MAX_PIXELS = int(os.getenv("MEDIA_MAX_PIXELS", 40_000_000))
+MEDIA_WEBP_QUALITY = int(os.getenv("MEDIA_WEBP_QUALITY", 85))
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+FORMATS = ("webp", "png")
+
+
+class InvalidImage(Exception):
+    pass
+
+
+class MediaUnavailable(Exception):
+    pass
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles for content-addressed files: clients may cache them forever."""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+def variant_name(digest, size, fmt):
+    return f"{digest[:32]}-{size}.{fmt}"
+
+
+def variant_urls(digest):
+    """{size: {format: url}} for every configured variant."""
+    return {
+        size: {fmt: f"{BACKEND_URL}{MEDIA_URL_PATH}/{variant_name(digest, size, fmt)}" for fmt in FORMATS}
+        for size in MEDIA_SIZES
+    }
+
+
+def default_url(urls):
+    """WebP URL of the variant used as logo_url."""
+    return urls[MEDIA_DEFAULT_SIZE if MEDIA_DEFAULT_SIZE in urls else MEDIA_SIZES[0]]["webp"]
+
+
+def _save(image, path, fmt):
+    # Write beside the target and rename, so a concurrent request never serves a partial file
+    with tempfile.NamedTemporaryFile(dir=MEDIA_DIR, suffix=".tmp", delete=False) as tmp:
+        try:
+            if fmt == "webp":
+                image.save(tmp, "WEBP", quality=MEDIA_WEBP_QUALITY, method=4)
+            else:
+                image.save(tmp, "PNG", optimize=True)
+        except BaseException:
+            tmp.close()
+            os.remove(tmp.name)
+            raise
+    # NamedTemporaryFile is 0600; the static file server may run as another user
+    os.chmod(tmp.name, 0o644)
+    os.replace(tmp.name, path)
+
+
+def transcode(path, digest):
+    """Write every missing variant of the image at `path`; returns how many were written."""
+    missing = [
+        (size, fmt) for size in MEDIA_SIZES for fmt in FORMATS
+        if not os.path.exists(os.path.join(MEDIA_DIR, variant_name(digest, size, fmt)))
+    ]
+    if not missing:
+        return 0
+    os.makedirs(MEDIA_DIR, exist_ok=True)
+    try:
+        with Image.open(path) as source:
+            # Only the header has been read; check the size before anything is decoded
+            width, height = source.size
+            if width * height > MEDIA_MAX_PIXELS:
+                raise InvalidImage(f"Image exceeds {MEDIA_MAX_PIXELS} pixels")
+            source.seek(0)  # first frame of animated GIF/WebP
+            image = ImageOps.exif_transpose(source).convert("RGBA")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        logger.info(f"Rejected image {digest[:12]}: {e}")
+        raise InvalidImage("Unsupported or corrupt image")
+    resized = {}
+    for size, fmt in missing:
+        if size not in resized:
+            # Never upscale: a small logo keeps its own size in every larger variant
+            resized[size] = image.copy()
+            resized[size].thumbnail((size, size), Image.Resampling.LANCZOS)
+        _save(resized[size], os.path.join(MEDIA_DIR, variant_name(digest, size, fmt)), fmt)
+    return len(missing)
+
+
+async def store_image(file):
+    """
+    Stream an uploaded image to disk and store its variants.
+    Returns (default url, {size: {format: url}}).
+    """
+    if Image is None:
+        raise MediaUnavailable("Image processing is not available (Pillow is not installed)")
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    path, digest = await ingestion.save_upload(file, suffix, max_mb=MEDIA_MAX_UPLOAD_MB, prefix="media-")
+    try:
+        written = await asyncio.to_thread(transcode, path, digest)
+    finally:
+        os.remove(path)
+    logger.info(f"Stored image {digest[:12]}: {written} variants written" if written else f"Image {digest[:12]} already stored")
+    urls = variant_urls(digest)
+    return default_url(urls), urls
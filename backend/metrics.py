@@ -0,0 +1,194 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+Counters and histograms are plain dicts keyed by label values, so recording
+is a few dict operations with no locks (one event loop per worker). Callback
+gauges read existing stats (pool, caches, write queues) only when /metrics is
+scraped. Each worker exposes its own series; scrape every worker or
+aggregate with a `worker` label in the scrape config.
+"""
+import bisect
+import contextvars
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds; dense around typical API and LLM latencies so p99 interpolation is useful
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_registry = []
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in self._values.items():
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        series = self._values.get(label_values)
+        if series is None:
+            series = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        names = self.labels + ("le",)
+        for label_values, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                yield f"{self.name}_bucket", _format_labels(names, label_values + (_format_value(bound),)), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labels, label_values), series[-1]
+            yield f"{self.name}_count", _format_labels(self.labels, label_values), cumulative
+
+
+class CallbackMetric:
+    """Gauge or counter whose values come from `fn()`: a number, or {label values tuple: number}."""
+
+    def __init__(self, name, help, fn, labels=(), type="gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labels = tuple(labels)
+        self.type = type
+        _registry.append(self)
+
+    def samples(self):
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in values.items():
+            if value is not None:
+                yield self.name, _format_labels(self.labels, label_values), value
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        try:
+            samples = list(metric.samples())
+        except Exception as e:
+            logger.warning(f"Metric {metric.name} failed to collect: {e}")
+            continue
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, labels, value in samples:
+            lines.append(f"{name}{labels} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# Shared metrics recorded from several modules
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Time to response headers by route template",
+    labels=("method", "route", "status")
+)
+db_query_duration = Histogram("db_query_duration_seconds", "Duration of individual SQL statements")
+db_queries_per_request = Histogram(
+    "db_queries_per_request", "SQL statements executed per HTTP request", labels=("route",), buckets=COUNT_BUCKETS
+)
+db_time_per_request = Histogram(
+    "db_time_per_request_seconds", "Total SQL time per HTTP request", labels=("route",)
+)
+llm_request_duration = Histogram(
+    "llm_request_duration_seconds", "Model call latency (full response, or stream start to end)",
+    labels=("operation", "outcome")
+)
+llm_tokens = Counter("llm_tokens_total", "Model tokens by kind", labels=("kind",))
+prompt_tokens = Histogram(
+    "prompt_tokens_estimated", "Estimated tokens per chat prompt after budgeting",
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+)
+prompt_parts_trimmed = Counter(
+    "prompt_parts_trimmed_total", "Prompt parts cut or dropped to fit the token budget", labels=("part",)
+)
+
+# [query count, query seconds] for the current request; None outside requests
+_request_db = contextvars.ContextVar("request_db", default=None)
+
+
+def start_request():
+    return _request_db.set([0, 0.0])
+
+
+def finish_request(token, method, route, status, started):
+    elapsed = time.perf_counter() - started
+    db = _request_db.get()
+    _request_db.reset(token)
+    http_request_duration.observe(elapsed, method, route, status)
+    if db is not None:
+        db_queries_per_request.observe(db[0], route)
+        db_time_per_request.observe(db[1], route)
+
+
+def record_query(elapsed):
+    db_query_duration.observe(elapsed)
+    db = _request_db.get()
+    if db is not None:
+        db[0] += 1
+        db[1] += elapsed
+
+
+def record_llm_call(operation, elapsed, error=False, prompt_tokens=0, completion_tokens=0):
+    llm_request_duration.observe(elapsed, operation, "error" if error else "ok")
+    if prompt_tokens:
+        llm_tokens.inc("prompt", amount=prompt_tokens)
+    if completion_tokens:
+        llm_tokens.inc("completion", amount=completion_tokens)
+
+
+def instrument_engine(engine):
+    """Time every statement on an (async) engine via cursor execute events."""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start")
+        if starts:
+            record_query(time.perf_counter() - starts.pop())
@@ -1,71 +1,87 @@
 """
-Migration script to add name and password_hash columns to users table
-Run this once to update your Supabase database
+Database migrations, in order.
+Brings an existing database up to the current models: missing tables are
+created first, then each step below runs in sequence. Every step is
+idempotent, so the whole sequence is safe to re-run on each deploy; pass
+step names to run only those.
+
+  columns        columns added to users, bots, conversations since the first schema
+  payment        bots.export_unlocked (migrate_payment.py)
+  conversations  merges duplicate sessions, unique and leads indexes (migrate_conversations.py)
+  analytics      lead_captured_at and the hourly/daily rollups with backfill (migrate_analytics.py)
+  knowledge      knowledge documents and chunks, legacy knowledge_base moved over (migrate_knowledge.py)
+  prompt_budget  bots.prompt_token_budget (migrate_prompt_budget.py)
+  logos          static/uploads logos transcoded into static/media (migrate_logos.py)
+
+Usage (from backend/): python migrate.py [step ...]
 """
 import asyncio
-import os
+import sys
 from sqlalchemy import text
-from sqlalchemy.ext.asyncio import create_async_engine
-from dotenv import load_dotenv
+from database import engine, Base
+import models  # noqa: F401  registers every table on Base.metadata
+import migrate_analytics
+import migrate_conversations
+import migrate_knowledge
+import migrate_logos
+import migrate_payment
+import migrate_prompt_budget
 
-load_dotenv()
+COLUMNS = [
+    ("users", "name VARCHAR"),
+    ("users", "password_hash VARCHAR"),
+    ("bots", "flow_data JSONB DEFAULT '{}'::jsonb"),
+    ("bots", "knowledge_base TEXT"),
+    # Chunked BM25 index
+    ("bots", "knowledge_index JSONB"),
+    # Cache key, bumped on every bot edit
+    ("bots", "content_version INTEGER NOT NULL DEFAULT 1"),
+    ("bots", "is_active BOOLEAN DEFAULT TRUE"),
+    ("conversations", "captured_data JSONB DEFAULT '{}'::jsonb"),
+    # Conversation memory: rolling summary
+    ("conversations", "summary TEXT"),
+    ("conversations", "summarized_until TIMESTAMP WITH TIME ZONE"),
+]
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-async def run_migration():
-    engine = create_async_engine(
-        DATABASE_URL,
-        connect_args={
-            "prepared_statement_cache_size": 0,
-            "statement_cache_size": 0
-        }
-    )
-    
+async def create_tables():
     async with engine.begin() as conn:
-        # Add name column if it doesn't exist
-        try:
-            await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS name VARCHAR"))
-            print("✓ Added 'name' column")
-        except Exception as e:
-            print(f"Note: name column - {e}")
-        
-        # Add password_hash column if it doesn't exist
-        try:
-            await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS password_hash VARCHAR"))
-            print("✓ Added 'password_hash' column")
-        except Exception as e:
-            print(f"Note: password_hash column - {e}")
-        
-        # Add flow_data column to bots table if it doesn't exist
-        try:
-            await conn.execute(text("ALTER TABLE bots ADD COLUMN IF NOT EXISTS flow_data JSONB DEFAULT '{}'::jsonb"))
-            print("✓ Added 'flow_data' column to bots table")
-        except Exception as e:
-            print(f"Note: flow_data column - {e}")
+        await conn.run_sync(Base.metadata.create_all)
+    print("✓ Created missing tables")
 
-        # Add knowledge_base column to bots table
-        try:
-            await conn.execute(text("ALTER TABLE bots ADD COLUMN IF NOT EXISTS knowledge_base TEXT"))
-            print("✓ Added 'knowledge_base' column to bots table")
-        except Exception as e:
-            print(f"Note: knowledge_base column - {e}")
+async def add_columns():
+    async with engine.begin() as conn:
+        print("Migrating columns...")
+        for table, column in COLUMNS:
+            await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column}"))
+            print(f"✓ Added {table}.{column.split()[0]}")
+        # Conversation memory window lookups
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_messages_conversation_timestamp ON messages (conversation_id, timestamp)"
+        ))
+        print("✓ Added messages (conversation_id, timestamp) index")
 
-        # Add is_active column to bots table
-        try:
-            await conn.execute(text("ALTER TABLE bots ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT TRUE"))
-            print("✓ Added 'is_active' column to bots table")
-        except Exception as e:
-            print(f"Note: is_active column - {e}")
+STEPS = {
+    "columns": add_columns,
+    "payment": migrate_payment.migrate,
+    "conversations": migrate_conversations.migrate,
+    "analytics": migrate_analytics.migrate,
+    "knowledge": migrate_knowledge.migrate,
+    "prompt_budget": migrate_prompt_budget.migrate,
+    "logos": migrate_logos.migrate,
+}
 
-        # Add captured_data column to conversations table
-        try:
-            await conn.execute(text("ALTER TABLE conversations ADD COLUMN IF NOT EXISTS captured_data JSONB DEFAULT '{}'::jsonb"))
-            print("✓ Added 'captured_data' column to conversations table")
-        except Exception as e:
-            print(f"Note: captured_data column - {e}")
-    
-    await engine.dispose()
+async def run_migration(names=None):
+    unknown = set(names or ()) - set(STEPS)
+    if unknown:
+        sys.exit(f"Unknown step(s): {', '.join(sorted(unknown))}; steps are {', '.join(STEPS)}")
+    try:
+        await create_tables()
+        for name, step in STEPS.items():
+            if not names or name in names:
+                await step()
+    finally:
+        await engine.dispose()
     print("\n✅ Migration complete!")
 
 if __name__ == "__main__":
-    asyncio.run(run_migration())
+    asyncio.run(run_migration(sys.argv[1:]))
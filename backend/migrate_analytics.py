@@ -0,0 +1,56 @@
+"""
+Migration step for the per-bot analytics rollups.
+Adds conversations.lead_captured_at, creates bot_stats_hourly and
+bot_stats_daily, and backfills them from existing conversations and messages.
+The backfill only runs while the rollup tables are empty, so run this before
+deploying the code that writes to them. Run through migrate.py; safe to
+run more than once.
+"""
+from sqlalchemy import text
+from database import engine, Base
+import models  # noqa: F401  registers the rollup tables on Base.metadata
+
+BACKFILL_LEAD_CAPTURED_AT = """
+    UPDATE conversations SET lead_captured_at = created_at
+    WHERE lead_captured_at IS NULL AND captured_data::jsonb <> '{}'::jsonb
+"""
+
+# {unit} is the rollup granularity; each assistant message counts as one LLM call (latency and tokens were never stored)
+BACKFILL_ROLLUP = """
+    INSERT INTO {table} (bot_id, bucket, conversations, messages, leads, llm_calls)
+    SELECT bot_id, bucket, sum(conversations), sum(messages), sum(leads), sum(llm_calls)
+    FROM (
+        SELECT bot_id, date_trunc('{unit}', created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS bucket,
+               1 AS conversations, 0 AS messages, 0 AS leads, 0 AS llm_calls
+        FROM conversations WHERE bot_id IS NOT NULL
+        UNION ALL
+        SELECT bot_id, date_trunc('{unit}', lead_captured_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', 0, 0, 1, 0
+        FROM conversations WHERE bot_id IS NOT NULL AND lead_captured_at IS NOT NULL
+        UNION ALL
+        SELECT c.bot_id, date_trunc('{unit}', m.timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', 0, 1, 0,
+               CASE WHEN m.role = 'assistant' THEN 1 ELSE 0 END
+        FROM messages m JOIN conversations c ON c.conversation_id = m.conversation_id
+        WHERE c.bot_id IS NOT NULL
+    ) events
+    GROUP BY bot_id, bucket
+"""
+
+async def migrate():
+    async with engine.begin() as conn:
+        print("Migrating analytics...")
+        await conn.execute(text("ALTER TABLE conversations ADD COLUMN IF NOT EXISTS lead_captured_at TIMESTAMP WITH TIME ZONE"))
+        result = await conn.execute(text(BACKFILL_LEAD_CAPTURED_AT))
+        print(f"✓ Backfilled lead_captured_at for {result.rowcount} conversation(s)")
+
+        await conn.run_sync(Base.metadata.create_all, tables=[
+            models.BotStatsHourly.__table__, models.BotStatsDaily.__table__
+        ])
+        print("✓ Created bot_stats_hourly and bot_stats_daily")
+
+        for table, unit in (("bot_stats_hourly", "hour"), ("bot_stats_daily", "day")):
+            has_rows = (await conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {table})"))).scalar()
+            if has_rows:
+                print(f"Note: {table} already populated, skipping backfill")
+                continue
+            result = await conn.execute(text(BACKFILL_ROLLUP.format(table=table, unit=unit)))
+            print(f"✓ Backfilled {result.rowcount} {table} row(s)")
@@ -0,0 +1,84 @@
+"""
+Migration step for conversation lookups.
+Merges duplicate (bot_id, visitor_session_id) conversations left over from the
+old select-then-insert capture path, adds the unique index that capture
+upserts rely on, then builds the leads listing indexes concurrently so the
+table stays writable. Run through migrate.py; safe to run more than once.
+"""
+from sqlalchemy import text
+from database import engine
+
+# Later captures win for keys present in several duplicates
+MERGE_DUPLICATE_CAPTURES = """
+    UPDATE conversations c SET captured_data = merged.data
+    FROM (
+        SELECT d.bot_id, d.visitor_session_id,
+               jsonb_object_agg(e.key, e.value ORDER BY d.created_at, d.conversation_id) AS data
+        FROM conversations d, jsonb_each(COALESCE(d.captured_data::jsonb, '{}'::jsonb)) e
+        WHERE (d.bot_id, d.visitor_session_id) IN (
+            SELECT bot_id, visitor_session_id FROM conversations
+            GROUP BY bot_id, visitor_session_id HAVING count(*) > 1
+        )
+        GROUP BY d.bot_id, d.visitor_session_id
+    ) merged
+    WHERE c.bot_id = merged.bot_id AND c.visitor_session_id = merged.visitor_session_id
+"""
+
+# The oldest conversation of each session is kept
+REPOINT_DUPLICATE_MESSAGES = """
+    WITH keepers AS (
+        SELECT DISTINCT ON (bot_id, visitor_session_id) conversation_id, bot_id, visitor_session_id
+        FROM conversations
+        ORDER BY bot_id, visitor_session_id, created_at, conversation_id
+    )
+    UPDATE messages m SET conversation_id = k.conversation_id
+    FROM conversations c
+    JOIN keepers k ON k.bot_id = c.bot_id AND k.visitor_session_id = c.visitor_session_id
+    WHERE m.conversation_id = c.conversation_id AND c.conversation_id <> k.conversation_id
+"""
+
+DELETE_DUPLICATES = """
+    DELETE FROM conversations c USING conversations d
+    WHERE c.bot_id = d.bot_id AND c.visitor_session_id = d.visitor_session_id
+      AND (c.created_at, c.conversation_id) > (d.created_at, d.conversation_id)
+"""
+
+# Shared with bench_conversation_indexes.py; {table} is the (schema-qualified) conversations table.
+# The partial index predicate must match the leads query text for the planner to use it.
+LEADS_PREDICATE = "captured_data::jsonb <> '{{}}'::jsonb"
+CONVERSATION_INDEXES = [
+    ("uq_conversations_bot_session",
+     "CREATE UNIQUE INDEX {concurrently} IF NOT EXISTS uq_conversations_bot_session "
+     "ON {table} (bot_id, visitor_session_id)"),
+    ("ix_conversations_bot_created",
+     "CREATE INDEX {concurrently} IF NOT EXISTS ix_conversations_bot_created "
+     "ON {table} (bot_id, created_at DESC)"),
+    ("ix_conversations_bot_leads",
+     "CREATE INDEX {concurrently} IF NOT EXISTS ix_conversations_bot_leads "
+     "ON {table} (bot_id, created_at DESC, conversation_id DESC) WHERE " + LEADS_PREDICATE),
+]
+
+def index_ddl(statement, table="conversations", concurrently=False):
+    return statement.format(table=table, concurrently="CONCURRENTLY" if concurrently else "")
+
+async def migrate():
+    async with engine.begin() as conn:
+        print("Migrating conversations...")
+        # The unique index below can't be built while duplicates exist, so these must succeed
+        await conn.execute(text(MERGE_DUPLICATE_CAPTURES))
+        await conn.execute(text(REPOINT_DUPLICATE_MESSAGES))
+        result = await conn.execute(text(DELETE_DUPLICATES))
+        print(f"✓ Merged {result.rowcount} duplicate conversation(s)")
+
+        await conn.execute(text(index_ddl(CONVERSATION_INDEXES[0][1])))
+        print("✓ Added unique (bot_id, visitor_session_id) index")
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for name, statement in CONVERSATION_INDEXES[1:]:
+            try:
+                await conn.execute(text(index_ddl(statement, concurrently=True)))
+                print(f"✓ Added {name}")
+            except Exception as e:
+                print(f"Note: {name} - {e}")
@@ -0,0 +1,37 @@
+"""
+Migration step for document-based knowledge storage.
+Creates knowledge_documents and knowledge_chunks, links knowledge_jobs to
+documents, then moves every bot's legacy bots.knowledge_base text into a
+document. Bots not migrated here are migrated lazily on first access, so
+running this is optional but keeps first chat turns fast. Run through
+migrate.py; safe to run more than once.
+"""
+from sqlalchemy import text
+from sqlalchemy.future import select
+from database import engine, async_session, Base
+import models
+from knowledge_store import migrate_legacy_knowledge
+
+async def migrate():
+    async with engine.begin() as conn:
+        print("Migrating knowledge storage...")
+        await conn.run_sync(Base.metadata.create_all, tables=[
+            models.KnowledgeDocument.__table__, models.KnowledgeChunk.__table__, models.KnowledgeJob.__table__
+        ])
+        print("✓ Created knowledge_documents and knowledge_chunks")
+        await conn.execute(text(
+            "ALTER TABLE knowledge_jobs ADD COLUMN IF NOT EXISTS document_id UUID "
+            "REFERENCES knowledge_documents(document_id) ON DELETE SET NULL"
+        ))
+        await conn.execute(text("ALTER TABLE knowledge_jobs ADD COLUMN IF NOT EXISTS replaces_document_id UUID"))
+        print("✓ Added document columns to knowledge_jobs")
+
+    async with async_session() as db:
+        result = await db.execute(select(models.Bot.bot_id).where(models.Bot.knowledge_base.is_not(None)))
+        bot_ids = result.scalars().all()
+        migrated = 0
+        for bot_id in bot_ids:
+            # One commit per bot keeps locks short on a live database
+            if await migrate_legacy_knowledge(db, bot_id):
+                migrated += 1
+        print(f"✓ Moved legacy knowledge of {migrated} bot(s) into documents")
@@ -0,0 +1,49 @@
+"""
+Migration step for logos uploaded before the media pipeline.
+Transcodes every bot logo still served from static/uploads into the
+content-addressed WebP/PNG variants under static/media and points the bot's
+visual_config.logo_url at the default variant. Run from backend/ on the host
+that serves static files; the originals are left in place for embeds that
+still reference them. Run through migrate.py; skipped when Pillow is not
+installed, safe to run more than once.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from sqlalchemy import text
+from database import engine
+import media
+
+UPLOADS_PATH = "/static/uploads/"
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+async def migrate():
+    if media.Image is None:
+        print("Note: Pillow is not installed, skipping logo migration")
+        return
+    async with engine.begin() as conn:
+        print("Migrating bot logos...")
+        result = await conn.execute(text("SELECT bot_id, visual_config FROM bots WHERE visual_config->>'logo_url' LIKE :pattern"), {"pattern": f"%{UPLOADS_PATH}%"})
+        migrated = 0
+        for bot_id, config in result.all():
+            path = os.path.join("static/uploads", config["logo_url"].split(UPLOADS_PATH, 1)[1])
+            if not os.path.exists(path):
+                print(f"  ! {bot_id}: {path} not found, skipped")
+                continue
+            digest = file_digest(path)
+            try:
+                await asyncio.to_thread(media.transcode, path, digest)
+            except media.InvalidImage:
+                print(f"  ! {bot_id}: {path} is not a readable image, skipped")
+                continue
+            config["logo_url"] = media.default_url(media.variant_urls(digest))
+            await conn.execute(text("UPDATE bots SET visual_config = CAST(:config AS JSONB) WHERE bot_id = :bot_id"), {"config": json.dumps(config), "bot_id": bot_id})
+            migrated += 1
+        print(f"✓ Moved {migrated} logos to static/media")
@@ -1,5 +1,7 @@
-import asyncio
-import os
+"""
+Migration step for paid lead exports: adds bots.export_unlocked.
+Run through migrate.py; safe to run more than once.
+"""
 from sqlalchemy import text
 from database import engine
 
@@ -12,8 +14,3 @@ async def migrate():
             print("Successfully added export_unlocked column to bots table.")
         except Exception as e:
             print(f"Error adding column: {e}")
-            
-    await engine.dispose()
-
-if __name__ == "__main__":
-    asyncio.run(migrate())
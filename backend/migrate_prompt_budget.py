@@ -0,0 +1,13 @@
+"""
+Migration step for per-bot prompt token budgets.
+Adds bots.prompt_token_budget; NULL keeps a bot on the PROMPT_TOKEN_BUDGET
+default. Run through migrate.py; safe to run more than once.
+"""
+from sqlalchemy import text
+from database import engine
+
+async def migrate():
+    async with engine.begin() as conn:
+        print("Migrating bots...")
+        await conn.execute(text("ALTER TABLE bots ADD COLUMN IF NOT EXISTS prompt_token_budget INTEGER"))
+        print("✓ Added bots.prompt_token_budget")
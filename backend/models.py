@@ -1,6 +1,7 @@
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Text, JSON, Integer, BigInteger, Index, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.sql import func
+from sqlalchemy.orm import deferred
+from sqlalchemy.sql import func, text
 import uuid
 from database import Base
 
@@ -22,9 +23,14 @@ class Bot(Base):
     system_prompt = Column(Text, default="You are a helpful assistant.")
     visual_config = Column(JSON, default={"color": "#3b82f6", "logo_url": "", "position": "right"})
     flow_data = Column(JSON, default={"nodes": [], "edges": []})
-    knowledge_base = Column(Text, nullable=True)
+    # Legacy knowledge storage, moved into knowledge_documents by knowledge_store.py.
+    # Deferred so select(Bot) never pulls the blobs.
+    knowledge_base = deferred(Column(Text, nullable=True))
+    knowledge_index = deferred(Column(JSON, nullable=True))
     is_active = Column(Boolean, default=True)
     export_unlocked = Column(Boolean, default=False)
+    content_version = Column(Integer, nullable=False, default=1, server_default="1") # bumped on every edit, keys caches
+    prompt_token_budget = Column(Integer, nullable=True) # per-bot prompt size cap; NULL uses PROMPT_TOKEN_BUDGET
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class Conversation(Base):
@@ -33,8 +39,22 @@ class Conversation(Base):
     bot_id = Column(UUID(as_uuid=True), ForeignKey("bots.bot_id", ondelete="CASCADE"))
     visitor_session_id = Column(String, nullable=False)
     captured_data = Column(JSON, default={})
+    summary = Column(Text, nullable=True) # rolling summary of turns older than the memory window
+    summarized_until = Column(DateTime(timezone=True), nullable=True)
+    lead_captured_at = Column(DateTime(timezone=True), nullable=True) # first capture; drives lead rollups
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        # One conversation per visitor session; capture upserts conflict on this
+        UniqueConstraint("bot_id", "visitor_session_id", name="uq_conversations_bot_session"),
+        Index("ix_conversations_bot_created", "bot_id", text("created_at DESC")),
+        # Leads listing; keep the predicate in sync with migrate_conversations.LEADS_PREDICATE
+        Index(
+            "ix_conversations_bot_leads", "bot_id", text("created_at DESC"), text("conversation_id DESC"),
+            postgresql_where=text("captured_data::jsonb <> '{}'::jsonb")
+        ),
+    )
+
 class Message(Base):
     __tablename__ = "messages"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -42,3 +62,73 @@ class Message(Base):
     role = Column(String, nullable=False) # 'user' or 'assistant'
     content = Column(Text, nullable=False)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_messages_conversation_timestamp", "conversation_id", "timestamp"),
+    )
+
+class BotStatsMixin:
+    # Rollup counters, incremented in place by analytics.py. No FK to bots so a
+    # late event for a deleted bot can't fail a whole flush.
+    bot_id = Column(UUID(as_uuid=True), primary_key=True)
+    bucket = Column(DateTime(timezone=True), primary_key=True) # UTC start of the hour/day
+    conversations = Column(Integer, nullable=False, default=0, server_default="0")
+    messages = Column(Integer, nullable=False, default=0, server_default="0")
+    leads = Column(Integer, nullable=False, default=0, server_default="0")
+    llm_calls = Column(Integer, nullable=False, default=0, server_default="0")
+    llm_errors = Column(Integer, nullable=False, default=0, server_default="0")
+    llm_latency_ms = Column(BigInteger, nullable=False, default=0, server_default="0") # sum; divide by llm_calls
+    prompt_tokens = Column(BigInteger, nullable=False, default=0, server_default="0")
+    completion_tokens = Column(BigInteger, nullable=False, default=0, server_default="0")
+
+class BotStatsHourly(BotStatsMixin, Base):
+    __tablename__ = "bot_stats_hourly"
+
+class BotStatsDaily(BotStatsMixin, Base):
+    __tablename__ = "bot_stats_daily"
+
+class KnowledgeJob(Base):
+    # Background knowledge ingestion; kept in the database so any worker can answer progress polls
+    __tablename__ = "knowledge_jobs"
+    job_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    bot_id = Column(UUID(as_uuid=True), ForeignKey("bots.bot_id", ondelete="CASCADE"), index=True)
+    document_id = Column(UUID(as_uuid=True), ForeignKey("knowledge_documents.document_id", ondelete="SET NULL"), nullable=True)
+    replaces_document_id = Column(UUID(as_uuid=True), nullable=True) # deleted once this job is done
+    filename = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="queued") # queued, processing, done, failed
+    pages_total = Column(Integer, nullable=True)
+    pages_done = Column(Integer, nullable=False, default=0, server_default="0")
+    chars_added = Column(Integer, nullable=False, default=0, server_default="0")
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class KnowledgeDocument(Base):
+    # One uploaded file or editor save; content_hash dedups identical uploads per bot
+    __tablename__ = "knowledge_documents"
+    document_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    bot_id = Column(UUID(as_uuid=True), ForeignKey("bots.bot_id", ondelete="CASCADE"), nullable=False)
+    source = Column(String, nullable=False) # filename, "editor" or "legacy"
+    content_hash = Column(String(64), nullable=False) # sha256 of the uploaded bytes
+    content = deferred(Column(Text, nullable=False, default="", server_default=""))
+    char_count = Column(Integer, nullable=False, default=0, server_default="0")
+    chunk_count = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("bot_id", "content_hash", name="uq_knowledge_documents_bot_hash"),
+    )
+
+class KnowledgeChunk(Base):
+    # Retrieval units of a document, in document order
+    __tablename__ = "knowledge_chunks"
+    chunk_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    document_id = Column(UUID(as_uuid=True), ForeignKey("knowledge_documents.document_id", ondelete="CASCADE"), nullable=False)
+    bot_id = Column(UUID(as_uuid=True), ForeignKey("bots.bot_id", ondelete="CASCADE"), nullable=False)
+    position = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("document_id", "position", name="uq_knowledge_chunks_document_position"),
+        Index("ix_knowledge_chunks_bot", "bot_id"),
+    )
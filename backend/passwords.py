@@ -0,0 +1,55 @@
+"""
+Password hashing off the event loop.
+bcrypt is deliberately slow (~250ms at cost 12), so hashes and checks run on
+a small dedicated thread pool; bcrypt releases the GIL while it works. The
+pool bounds how many cores auth can take from chat traffic. Hashes made with
+a different BCRYPT_ROUNDS are upgraded on the next successful login.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+
+def _verify(password, password_hash):
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+    except ValueError:
+        # Malformed stored hash
+        return False
+
+
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _hash, password, BCRYPT_ROUNDS)
+
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _verify, password, password_hash)
+
+
+def hash_rounds(password_hash: str):
+    # Modular crypt format: $2b$<cost>$<salt+hash>
+    try:
+        return int(password_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def needs_rehash(password_hash: str) -> bool:
+    return hash_rounds(password_hash) != BCRYPT_ROUNDS
+
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,181 @@
+"""
+Token-budgeted prompt assembly.
+Parts are admitted in priority order until the bot's token budget is spent:
+the question and system prompt always go in (cut down only if they alone
+exceed it), then recent conversation turns newest first and the running
+summary, then knowledge chunks in retrieval rank order. The part that
+overflows is truncated if a useful amount still fits, otherwise dropped.
+Token counts are an offline estimate, calibrated against the counts the
+provider reports so they track the real tokenizer.
+"""
+import math
+import os
+import re
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 8000))
+# A part that would fit only partially is cut if at least this many tokens remain, otherwise dropped
+PROMPT_MIN_PART_TOKENS = int(os.getenv("PROMPT_MIN_PART_TOKENS", 64))
+# Share of the budget a single visitor question may take
+PROMPT_QUESTION_SHARE = float(os.getenv("PROMPT_QUESTION_SHARE", 0.25))
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def build_prompt_prefix(system_prompt, context):
+    return f"{system_prompt}\n\nContext:\n{context}\n\n"
+
+def build_prompt_question(user_query):
+    return f"User Question: {user_query}\n\nAnswer:"
+
+def format_turn(turn):
+    return f"{'User' if turn[0] == 'user' else 'Assistant'}: {turn[1]}"
+
+def build_prompt_history(summary, turns):
+    """Conversation memory block; `turns` are (role, content, ...) tuples, oldest first."""
+    parts = []
+    if summary:
+        parts.append(f"Conversation Summary:\n{summary}\n\n")
+    if turns:
+        lines = "\n".join(format_turn(turn) for turn in turns)
+        parts.append(f"Recent Conversation:\n{lines}\n\n")
+    return "".join(parts)
+
+
+class TokenCounter:
+    """
+    Subword estimate: a word costs one token per four characters, punctuation
+    one each. `ratio` is a moving average of reported / estimated prompt
+    tokens and scales every count.
+    """
+
+    def __init__(self, smoothing=0.05):
+        self.smoothing = smoothing
+        self.ratio = 1.0
+        self.samples = 0
+
+    def raw(self, text):
+        return sum((len(token) + 3) // 4 for token in _TOKEN_RE.findall(text))
+
+    def count(self, text):
+        return self.scale(self.raw(text))
+
+    def scale(self, raw):
+        """Calibrated count for a raw() result computed earlier."""
+        return math.ceil(raw * self.ratio)
+
+    def observe(self, estimated, actual):
+        """Feed back a prompt's estimated and provider-reported token counts."""
+        if estimated <= 0 or actual <= 0:
+            return
+        observed = min(max(actual / estimated * self.ratio, 0.5), 3.0)
+        weight = max(self.smoothing, 1 / (self.samples + 1))
+        self.ratio += (observed - self.ratio) * weight
+        self.samples += 1
+
+
+token_counter = TokenCounter()
+
+
+def truncate_to_tokens(text, tokens, counter=token_counter, total=None):
+    """Cut `text` at a word boundary so it costs at most about `tokens`; pass `total` if already counted."""
+    if total is None:
+        total = counter.count(text)
+    if total <= tokens:
+        return text
+    if tokens <= 0:
+        return ""
+    # Proportional cut, tightened until the estimate fits (token density varies across the text)
+    length = len(text)
+    for _ in range(4):
+        length = int(length * tokens / total)
+        cut = text[:length]
+        space = cut.rfind(" ")
+        if space > len(cut) // 2:
+            cut = cut[:space]
+        total = counter.count(cut)
+        if total <= tokens:
+            break
+    return cut.rstrip() + " …"
+
+
+class BuiltPrompt:
+    __slots__ = ("text", "tokens", "budget", "trimmed")
+
+    def __init__(self, text, tokens, budget, trimmed):
+        self.text = text
+        self.tokens = tokens  # estimate for the whole prompt
+        self.budget = budget
+        self.trimmed = trimmed  # names of parts cut or dropped to fit
+
+
+def build(system_prompt, question, chunks=(), chunk_tokens=None, summary="", turns=(), budget=None,
+          prefix=None, counter=token_counter):
+    """
+    Assemble a prompt within `budget` tokens. `chunks` are ranked context
+    passages (best first) and `chunk_tokens` their precomputed counts, if
+    known. `prefix` is a prebuilt build_prompt_prefix(system_prompt, all
+    chunks) used when nothing from it had to be cut.
+    """
+    budget = budget or PROMPT_TOKEN_BUDGET
+    trimmed = []
+    # Labels and separators of the template, counted once
+    overhead = counter.count(build_prompt_prefix("", "") + build_prompt_question(""))
+
+    question_tokens = counter.count(question)
+    question_cap = int(budget * PROMPT_QUESTION_SHARE)
+    if question_tokens > question_cap:
+        question = truncate_to_tokens(question, question_cap, counter)
+        question_tokens = question_cap
+        trimmed.append("question")
+
+    system_tokens = counter.count(system_prompt)
+    system_cap = max(budget - overhead - question_tokens, 0)
+    if system_tokens > system_cap:
+        system_prompt = truncate_to_tokens(system_prompt, system_cap, counter)
+        system_tokens = system_cap
+        trimmed.append("system_prompt")
+    remaining = budget - overhead - question_tokens - system_tokens
+
+    kept_turns = []
+    label = counter.count("Recent Conversation:") if turns else 0
+    remaining -= label
+    for turn in reversed(turns):
+        cost = counter.count(format_turn(turn)) + 1
+        if cost > remaining:
+            trimmed.append("history")
+            break
+        kept_turns.append(turn)
+        remaining -= cost
+    kept_turns.reverse()
+    if not kept_turns:
+        remaining += label
+    if summary:
+        cost = counter.count(summary) + 4
+        if cost > remaining:
+            summary = truncate_to_tokens(summary, remaining - 4, counter) if remaining >= PROMPT_MIN_PART_TOKENS else ""
+            cost = counter.count(summary) + 4 if summary else 0
+            trimmed.append("summary")
+        remaining -= cost
+
+    kept_chunks = []
+    separator = counter.count(CONTEXT_SEPARATOR)
+    for index, chunk in enumerate(chunks):
+        tokens = chunk_tokens[index] if chunk_tokens else counter.count(chunk)
+        cost = tokens + (separator if kept_chunks else 0)
+        if cost > remaining:
+            if remaining >= PROMPT_MIN_PART_TOKENS:
+                chunk = truncate_to_tokens(chunk, remaining - separator, counter, total=tokens)
+                kept_chunks.append(chunk)
+                remaining -= counter.count(chunk) + separator
+            trimmed.append("context")
+            break
+        kept_chunks.append(chunk)
+        remaining -= cost
+
+    if prefix is not None and "system_prompt" not in trimmed and "context" not in trimmed:
+        head = prefix
+    else:
+        head = build_prompt_prefix(system_prompt, CONTEXT_SEPARATOR.join(kept_chunks))
+    text = head + build_prompt_history(summary, kept_turns) + build_prompt_question(question)
+    return BuiltPrompt(text, budget - remaining, budget, trimmed)
@@ -0,0 +1,231 @@
+"""
+Request rate limiting and admission control.
+FixedWindowLimiter counts hits per key in fixed windows. With REDIS_URL set
+the counters live in Redis so the limit holds across workers; otherwise (or
+if Redis errors) each worker counts on its own.
+TokenBucketLimiter allows a steady rate with bursts. Buckets live in a
+pluggable store: per worker in memory by default, or in Redis
+(RATELIMIT_BACKEND=redis) so the limit is shared by all workers.
+ConcurrencyLimiter caps in-flight work with a bounded wait queue and rejects
+immediately once the queue is full.
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Only trust X-Forwarded-For behind a proxy that sets it
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
+# Proxies in front of the app that append to X-Forwarded-For; the client is that many entries from the right
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 1))
+# "memory" (per worker) or "redis" (shared; needs REDIS_URL) for token buckets
+RATELIMIT_BACKEND = os.getenv("RATELIMIT_BACKEND", "memory").lower()
+
+
+def client_ip(request):
+    """
+    The peer address, or with TRUST_FORWARDED_FOR the X-Forwarded-For entry
+    added by the outermost trusted proxy. Entries to the left of it come from
+    the client and can be forged.
+    """
+    if TRUST_FORWARDED_FOR:
+        hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+        if len(hops) >= TRUSTED_PROXY_HOPS > 0:
+            return hops[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+
+class FixedWindowLimiter:
+    def __init__(self, name, limit, window, max_keys=100000):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._counts = {}  # key -> (window index, hits)
+        self.rejected = 0
+
+    async def hit(self, key):
+        """Count one hit; returns (allowed, seconds until the window resets)."""
+        now = time.time()
+        window_index = int(now // self.window)
+        retry_after = max(int((window_index + 1) * self.window - now), 1)
+        hits = await self._hit_shared(key, window_index)
+        if hits is None:
+            hits = self._hit_local(key, window_index)
+        if hits > self.limit:
+            self.rejected += 1
+            return False, retry_after
+        return True, retry_after
+
+    async def _hit_shared(self, key, window_index):
+        client = get_redis()
+        if client is None:
+            return None
+        redis_key = f"ratelimit:{self.name}:{key}:{window_index}"
+        try:
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.incr(redis_key)
+                pipe.expire(redis_key, self.window + 1)
+                hits, _ = await pipe.execute()
+            return hits
+        except Exception as e:
+            logger.warning(f"Rate limit Redis error ({self.name}), counting locally: {e}")
+            return None
+
+    def _hit_local(self, key, window_index):
+        entry = self._counts.get(key)
+        hits = entry[1] + 1 if entry and entry[0] == window_index else 1
+        self._counts[key] = (window_index, hits)
+        if len(self._counts) > self.max_keys:
+            # Drop counters from finished windows
+            self._counts = {k: v for k, v in self._counts.items() if v[0] == window_index}
+        return hits
+
+
+class MemoryBucketStore:
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, last refill]
+
+    async def take(self, key, rate, burst, cost=1):
+        """Take `cost` tokens; returns (allowed, seconds until they would be available)."""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [burst, now]
+            if len(self._buckets) > self.max_keys:
+                # Least recently used buckets have refilled long ago, so dropping them loses nothing
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return True, 0.0
+        return False, (cost - bucket[0]) / rate
+
+
+# Refill and take in one round-trip; Redis TIME keeps workers on the same clock
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(wait)}
+"""
+
+
+class RedisBucketStore:
+    """Shared buckets; falls back to a local store while Redis is unavailable."""
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback or MemoryBucketStore()
+        self._script = None
+
+    async def take(self, key, rate, burst, cost=1):
+        client = get_redis()
+        if client is None:
+            return await self.fallback.take(key, rate, burst, cost)
+        try:
+            if self._script is None:
+                self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+            allowed, wait = await self._script(keys=[f"bucket:{key}"], args=[rate, burst, cost])
+            return bool(int(allowed)), float(wait)
+        except Exception as e:
+            logger.warning(f"Token bucket Redis error, limiting locally: {e}")
+            return await self.fallback.take(key, rate, burst, cost)
+
+
+def default_bucket_store():
+    if RATELIMIT_BACKEND == "redis":
+        return RedisBucketStore()
+    return MemoryBucketStore()
+
+
+class TokenBucketLimiter:
+    def __init__(self, name, rate, burst, store=None):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.store = store or default_bucket_store()
+        self.rejected = 0
+
+    async def take(self, key, cost=1):
+        """Returns (allowed, whole seconds to wait before retrying)."""
+        allowed, wait = await self.store.take(f"{self.name}:{key}", self.rate, self.burst, cost)
+        if not allowed:
+            self.rejected += 1
+        return allowed, max(math.ceil(wait), 1)
+
+
+class Overloaded(Exception):
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is at capacity")
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    def __init__(self, name, limit, max_waiting, max_wait):
+        self.name = name
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self._semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    @property
+    def retry_after(self):
+        return max(math.ceil(self.max_wait), 1)
+
+    def saturated(self):
+        """True when a new caller would be rejected without waiting."""
+        return self.in_flight >= self.limit and self.waiting >= self.max_waiting
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of `limit` slots; raises Overloaded if the queue is full or the wait exceeds max_wait."""
+        if self._semaphore.locked():
+            if self.waiting >= self.max_waiting:
+                self.rejected += 1
+                raise Overloaded(self.name, self.retry_after)
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise Overloaded(self.name, self.retry_after)
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
@@ -0,0 +1,120 @@
+"""
+Lexical retrieval (BM25) over a bot's knowledge base.
+The knowledge base is split into chunks when it is uploaded and a small
+inverted index is stored alongside the bot, so a chat turn only sends the
+top-k relevant chunks to the model instead of the whole text.
+"""
+import heapq
+import math
+import os
+import re
+from collections import Counter
+
+# "retrieval" sends the top-k chunks, "full" keeps the old behaviour of
+# sending the entire knowledge base on every turn.
+KNOWLEDGE_MODE = os.getenv("KNOWLEDGE_MODE", "retrieval")
+KNOWLEDGE_TOP_K = int(os.getenv("KNOWLEDGE_TOP_K", 4))
+CHUNK_SIZE = int(os.getenv("KNOWLEDGE_CHUNK_SIZE", 800))
+CHUNK_OVERLAP = int(os.getenv("KNOWLEDGE_CHUNK_OVERLAP", 100))
+
+INDEX_VERSION = 1
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be but by do does for from has have how i in is it its "
+    "me my of on or our so that the their there this to was we what when where "
+    "which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def _split_long(paragraph, size, overlap):
+    # Window over an oversized paragraph, breaking on whitespace where possible
+    pieces = []
+    start = 0
+    while start < len(paragraph):
+        end = min(start + size, len(paragraph))
+        if end < len(paragraph):
+            space = paragraph.rfind(" ", start + size // 2, end)
+            if space != -1:
+                end = space
+        pieces.append(paragraph[start:end].strip())
+        if end >= len(paragraph):
+            break
+        start = max(end - overlap, start + 1)
+    return [p for p in pieces if p]
+
+
+def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Pack paragraphs into chunks of at most `size` characters."""
+    chunks = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text or ""):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        if len(paragraph) > size:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.extend(_split_long(paragraph, size, overlap))
+        elif len(current) + len(paragraph) + 1 > size:
+            chunks.append(current)
+            current = paragraph
+        else:
+            current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def empty_index():
+    return {"version": INDEX_VERSION, "chunks": [], "lengths": [], "postings": {}, "total_length": 0}
+
+
+def add_chunks(index, chunks):
+    """Append chunks to an index in place. Postings are [chunk_position, term_frequency] pairs."""
+    postings = index["postings"]
+    for chunk in chunks:
+        terms = tokenize(chunk)
+        position = len(index["chunks"])
+        index["chunks"].append(chunk)
+        index["lengths"].append(len(terms))
+        index["total_length"] += len(terms)
+        for term, count in Counter(terms).items():
+            postings.setdefault(term, []).append([position, count])
+    return index
+
+
+def search(index, query, top_k=KNOWLEDGE_TOP_K):
+    chunks = index.get("chunks") or []
+    if not chunks:
+        return []
+    n = len(chunks)
+    avgdl = (index["total_length"] / n) or 1
+    lengths = index["lengths"]
+    scores = {}
+    for term in set(tokenize(query)):
+        postings = index["postings"].get(term)
+        if not postings:
+            continue
+        idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+        for position, tf in postings:
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * lengths[position] / avgdl)
+            scores[position] = scores.get(position, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+    best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+    return [chunks[position] for position, _ in best]
+
+
+def select_chunks(knowledge_index, query, top_k=KNOWLEDGE_TOP_K):
+    """Ranked chunks for a query, best first."""
+    chunks = search(knowledge_index, query, top_k)
+    if not chunks:
+        # Nothing matched lexically (e.g. "hi"); the opening chunks usually describe the business
+        chunks = knowledge_index["chunks"][:top_k]
+    return chunks
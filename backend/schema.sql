@@ -5,6 +5,8 @@ CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 CREATE TABLE IF NOT EXISTS users (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     email TEXT UNIQUE NOT NULL,
+    name TEXT,
+    password_hash TEXT,
     subscription_tier TEXT DEFAULT 'Free',
     stripe_customer_id TEXT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
@@ -17,7 +19,13 @@ CREATE TABLE IF NOT EXISTS bots (
     bot_name TEXT NOT NULL,
     system_prompt TEXT DEFAULT 'You are a helpful assistant.',
     visual_config JSONB DEFAULT '{"color": "#3b82f6", "logo_url": "", "position": "right"}',
+    flow_data JSONB DEFAULT '{"nodes": [], "edges": []}',
+    knowledge_base TEXT,
+    knowledge_index JSONB,
     is_active BOOLEAN DEFAULT TRUE,
+    export_unlocked BOOLEAN DEFAULT FALSE,
+    content_version INTEGER NOT NULL DEFAULT 1,
+    prompt_token_budget INTEGER,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
@@ -26,9 +34,20 @@ CREATE TABLE IF NOT EXISTS conversations (
     conversation_id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     bot_id UUID REFERENCES bots(bot_id) ON DELETE CASCADE,
     visitor_session_id TEXT NOT NULL,
+    captured_data JSONB DEFAULT '{}'::jsonb,
+    summary TEXT,
+    summarized_until TIMESTAMP WITH TIME ZONE,
+    lead_captured_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- One conversation per visitor session (capture upserts conflict on this)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_conversations_bot_session ON conversations (bot_id, visitor_session_id);
+CREATE INDEX IF NOT EXISTS ix_conversations_bot_created ON conversations (bot_id, created_at DESC);
+-- Leads listing: only conversations with captured data
+CREATE INDEX IF NOT EXISTS ix_conversations_bot_leads ON conversations (bot_id, created_at DESC, conversation_id DESC)
+    WHERE captured_data::jsonb <> '{}'::jsonb;
+
 -- Messages Table
 CREATE TABLE IF NOT EXISTS messages (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -37,3 +56,65 @@ CREATE TABLE IF NOT EXISTS messages (
     content TEXT NOT NULL,
     timestamp TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
+
+CREATE INDEX IF NOT EXISTS ix_messages_conversation_timestamp ON messages (conversation_id, timestamp);
+
+-- Per-bot analytics rollups, maintained incrementally by analytics.py
+CREATE TABLE IF NOT EXISTS bot_stats_hourly (
+    bot_id UUID NOT NULL,
+    bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+    conversations INTEGER NOT NULL DEFAULT 0,
+    messages INTEGER NOT NULL DEFAULT 0,
+    leads INTEGER NOT NULL DEFAULT 0,
+    llm_calls INTEGER NOT NULL DEFAULT 0,
+    llm_errors INTEGER NOT NULL DEFAULT 0,
+    llm_latency_ms BIGINT NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (bot_id, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS bot_stats_daily (LIKE bot_stats_hourly INCLUDING ALL);
+
+-- Knowledge documents (one per upload or editor save) and their retrieval chunks.
+-- bots.knowledge_base / knowledge_index are legacy and migrated into these tables.
+CREATE TABLE IF NOT EXISTS knowledge_documents (
+    document_id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    bot_id UUID NOT NULL REFERENCES bots(bot_id) ON DELETE CASCADE,
+    source TEXT NOT NULL,
+    content_hash VARCHAR(64) NOT NULL,
+    content TEXT NOT NULL DEFAULT '',
+    char_count INTEGER NOT NULL DEFAULT 0,
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    CONSTRAINT uq_knowledge_documents_bot_hash UNIQUE (bot_id, content_hash)
+);
+
+CREATE TABLE IF NOT EXISTS knowledge_chunks (
+    chunk_id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    document_id UUID NOT NULL REFERENCES knowledge_documents(document_id) ON DELETE CASCADE,
+    bot_id UUID NOT NULL REFERENCES bots(bot_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    CONSTRAINT uq_knowledge_chunks_document_position UNIQUE (document_id, position)
+);
+
+CREATE INDEX IF NOT EXISTS ix_knowledge_chunks_bot ON knowledge_chunks (bot_id);
+
+-- Background knowledge ingestion jobs (polled by the dashboard)
+CREATE TABLE IF NOT EXISTS knowledge_jobs (
+    job_id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    bot_id UUID REFERENCES bots(bot_id) ON DELETE CASCADE,
+    document_id UUID REFERENCES knowledge_documents(document_id) ON DELETE SET NULL,
+    replaces_document_id UUID,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    pages_total INTEGER,
+    pages_done INTEGER NOT NULL DEFAULT 0,
+    chars_added INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS ix_knowledge_jobs_bot_id ON knowledge_jobs (bot_id);
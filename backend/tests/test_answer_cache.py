@@ -0,0 +1,54 @@
+import pytest
+
+from answer_cache import AnswerCache, normalize_query, query_signature
+
+
+class Runtime:
+    bot_id = "bot"
+    fingerprint = "v1"
+
+
+@pytest.mark.parametrize("first, second", [
+    ("When do you deliver?", "Where do you deliver?"),
+    ("Who are you?", "What are you?"),
+    ("Do you ship abroad?", "Don't you ship abroad?"),
+    ("Can I return it?", "Can you return it?"),
+    ("Is A better than B?", "Is B better than A?"),
+    ("Is the red one cheaper than the blue one?", "Is the blue one cheaper than the red one?"),
+    ("Very very spicy?", "Very spicy?"),
+])
+def test_different_questions_get_different_signatures(first, second):
+    assert query_signature(first) != query_signature(second)
+
+
+@pytest.mark.parametrize("first, second", [
+    ("What's the price?", "what is the price"),
+    ("Opening hours?", "opening   HOURS"),
+    ("Your opening hours, please?", "your opening hours"),
+])
+def test_rephrasings_share_a_signature(first, second):
+    assert query_signature(first) == query_signature(second)
+
+
+def test_filler_only_question_is_not_cached():
+    cache = AnswerCache()
+    cache.set(Runtime, "the?", "answer")
+    assert cache.get(Runtime, "a?") is None
+
+
+def test_cache_separates_interrogatives():
+    cache = AnswerCache()
+    cache.set(Runtime, "When do you deliver?", "Mondays")
+    assert cache.get(Runtime, "when do you deliver") == "Mondays"
+    assert cache.get(Runtime, "Where do you deliver?") is None
+
+
+def test_word_order_keeps_answers_apart():
+    cache = AnswerCache()
+    cache.set(Runtime, "Does plan X include plan Y?", "Yes")
+    assert cache.get(Runtime, "Does plan Y include plan X?") is None
+    assert cache.get(Runtime, "does plan x include plan y") == "Yes"
+
+
+def test_normalize_query():
+    assert normalize_query("  What's  the PRICE?? ") == "what s the price"
@@ -0,0 +1,133 @@
+import asyncio
+
+from sqlalchemy.exc import DBAPIError, IntegrityError, OperationalError
+
+from batching import BatchWriter, strip_nul
+
+
+def data_error():
+    return DBAPIError("INSERT", {}, Exception("unsupported Unicode escape sequence"))
+
+
+def make_writer(fail):
+    """BatchWriter whose flush raises fail(batch) (or succeeds when it returns None) and records what landed."""
+    written = []
+
+    async def flush(batch):
+        error = fail(batch)
+        if error is not None:
+            raise error
+        written.extend(batch)
+
+    return BatchWriter("test", flush, max_batch=10), written
+
+
+def test_rejected_batch_is_retried_item_by_item():
+    writer, written = make_writer(lambda batch: data_error() if "bad" in batch else None)
+    for item in ["a", "bad", "b"]:
+        writer.submit(item)
+    asyncio.run(writer.flush())
+    assert written == ["a", "b"]
+    assert writer.pending() == 0
+    assert (writer.flushed, writer.dropped) == (2, 1)
+
+
+def test_integrity_error_drops_only_the_failing_item():
+    writer, written = make_writer(
+        lambda batch: IntegrityError("INSERT", {}, Exception("fk violation")) if "orphan" in batch else None
+    )
+    for item in ["orphan", "a"]:
+        writer.submit(item)
+    asyncio.run(writer.flush())
+    assert written == ["a"]
+
+
+def test_connection_error_requeues_the_batch():
+    writer, written = make_writer(lambda batch: OperationalError("INSERT", {}, Exception("connection refused")))
+    for item in ["a", "b"]:
+        writer.submit(item)
+    asyncio.run(writer.flush())
+    assert written == []
+    assert writer.pending_snapshot() == ["a", "b"]
+    assert writer.dropped == 0
+
+
+def test_connection_lost_during_retry_requeues_the_rest():
+    calls = []
+
+    def fail(batch):
+        calls.append(list(batch))
+        if len(batch) > 1:
+            return data_error()
+        if batch == ["b"]:
+            return OperationalError("INSERT", {}, Exception("connection reset"))
+        return None
+
+    writer, written = make_writer(fail)
+    for item in ["a", "b", "c"]:
+        writer.submit(item)
+    asyncio.run(writer.flush())
+    assert written == ["a"]
+    assert writer.pending_snapshot() == ["b", "c"]
+
+
+def test_strip_nul():
+    assert strip_nul({"na\x00me": ["a\x00b", {"x": "\x00"}], "n": 1}) == {"name": ["ab", {"x": ""}], "n": 1}
+
+
+def blocking_writer():
+    """BatchWriter whose flush waits for `release` once it has started."""
+    written = []
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def flush(batch):
+        started.set()
+        await release.wait()
+        written.extend(batch)
+
+    return BatchWriter("test", flush, max_batch=2, max_delay=0.01), written, started, release
+
+
+def test_stop_during_flush_finishes_the_batch():
+    async def scenario():
+        writer, written, started, release = blocking_writer()
+        writer.start()
+        for item in ["a", "b", "c"]:
+            writer.submit(item)
+        await started.wait()
+        stopping = asyncio.create_task(writer.stop())
+        await asyncio.sleep(0.05)
+        assert not stopping.done()
+        release.set()
+        await stopping
+        return writer, written
+
+    writer, written = asyncio.run(scenario())
+    assert written == ["a", "b", "c"]
+    assert writer.pending() == 0
+
+
+def test_cancelled_flush_keeps_its_batch():
+    async def scenario():
+        writer, written, started, release = blocking_writer()
+        writer.start()
+        for item in ["a", "b", "c"]:
+            writer.submit(item)
+        await started.wait()
+        writer._task.cancel()
+        await asyncio.gather(writer._task, return_exceptions=True)
+        writer._task = None
+        release.set()
+        await writer.stop()
+        return writer, written
+
+    writer, written = asyncio.run(scenario())
+    assert written == ["a", "b", "c"]
+
+
+def test_pending_snapshot_is_a_copy():
+    writer, _ = make_writer(lambda batch: None)
+    writer.submit("a")
+    snapshot = writer.pending_snapshot()
+    snapshot.append("b")
+    assert writer.pending_snapshot() == ["a"]
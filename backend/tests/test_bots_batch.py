@@ -0,0 +1,121 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+
+import main
+from database import get_db
+
+
+class Result:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class FakeSession:
+    def __init__(self, user_exists=True, insert_error=None):
+        self.user_exists = user_exists
+        self.insert_error = insert_error
+        self.inserted = []
+
+    async def execute(self, stmt, rows=None):
+        if rows is None:
+            return Result(uuid.uuid4() if self.user_exists else None)
+        if self.insert_error:
+            raise self.insert_error
+        self.inserted.extend(rows)
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+
+@pytest.fixture
+def client():
+    def use(session):
+        async def get_session():
+            yield session
+        main.app.dependency_overrides[get_db] = get_session
+        return TestClient(main.app)
+
+    yield use
+    main.app.dependency_overrides.pop(get_db, None)
+
+
+def create(client, user_id):
+    return client.post("/api/bots/batch", json={"user_id": user_id, "bots": [{"bot_name": "A"}]})
+
+
+def test_malformed_user_id(client):
+    response = create(client(FakeSession()), "not-a-uuid")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid user_id"
+
+
+def test_unknown_user(client):
+    response = create(client(FakeSession(user_exists=False)), str(uuid.uuid4()))
+    assert response.status_code == 404
+    assert response.json()["detail"] == "User not found"
+
+
+def test_user_deleted_during_insert(client):
+    session = FakeSession(insert_error=IntegrityError("INSERT", {}, Exception("fk violation")))
+    assert create(client(session), str(uuid.uuid4())).status_code == 404
+
+
+def test_bots_created(client):
+    session = FakeSession()
+    response = create(client(session), str(uuid.uuid4()))
+    assert response.status_code == 200
+    assert len(response.json()["bot_ids"]) == 1 == len(session.inserted)
+
+
+class ScalarsResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class UpdateSession:
+    def __init__(self, existing):
+        self.existing = existing
+        self.statements = []
+
+    async def execute(self, stmt, rows=None):
+        self.statements.append(stmt)
+        return ScalarsResult(self.existing)
+
+    async def commit(self):
+        pass
+
+
+def test_batch_update_is_one_statement():
+    a, b = uuid.uuid4(), uuid.uuid4()
+    stmt = main.batch_update_statement({a: {"bot_name": "A", "prompt_token_budget": None}, b: {"visual_config": {}}})
+    sql = str(stmt.compile(dialect=postgresql.asyncpg.dialect()))
+    assert sql.startswith("UPDATE bots SET") and "FROM (VALUES" in sql and "RETURNING bots.bot_id" in sql
+    # Only the fields someone sent are touched, each behind its own flag
+    assert "set_visual_config" in sql and "set_system_prompt" not in sql and "system_prompt=" not in sql
+
+
+def test_batch_patch(client):
+    a, b = uuid.uuid4(), uuid.uuid4()
+    session = UpdateSession([a])
+    response = client(session).patch("/api/bots/batch", json={"updates": [
+        {"bot_id": str(a), "bot_name": "A"}, {"bot_id": str(b), "prompt_token_budget": 512}
+    ]})
+    assert response.status_code == 200
+    assert response.json()["updated"] == [str(a)] and response.json()["not_found"] == [str(b)]
+    assert len(session.statements) == 1
@@ -0,0 +1,13 @@
+import uuid
+
+from conversation_memory import ConversationMemory, message_writer, record_turn
+
+
+def test_record_turn_strips_nul_bytes():
+    memory = ConversationMemory(uuid.uuid4(), "", [], [])
+    record_turn(memory, "hi\x00 there", "hello\x00")
+    rows = message_writer._pending[-2:]
+    del message_writer._pending[-2:]
+    assert [row["content"] for row in rows] == ["hi there", "hello"]
+    assert [row["role"] for row in rows] == ["user", "assistant"]
+    assert rows[0]["timestamp"] < rows[1]["timestamp"]
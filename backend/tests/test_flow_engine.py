@@ -0,0 +1,160 @@
+import math
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from database import get_db
+from flow_engine import FlowError, _number, compile_flow, flow_shape_errors
+
+
+def node(node_id, node_type, **data):
+    return {"id": node_id, "type": node_type, "data": data}
+
+
+def edge(source, target, handle=None):
+    return {"id": f"{source}-{target}", "source": source, "target": target, "sourceHandle": handle}
+
+
+def age_flow(operator="greater_than", value="17"):
+    """start -> ask age -> condition(age <operator> value) -> adult / minor."""
+    return {
+        "nodes": [
+            node("start", "start"),
+            node("age", "numberInput", label="age", message="How old are you?"),
+            node("check", "condition", variable="age", operator=operator, value=value),
+            node("adult", "end", message="Welcome!"),
+            node("minor", "end", message="Sorry."),
+        ],
+        "edges": [
+            edge("start", "age"), edge("age", "check"),
+            edge("check", "adult", "true"), edge("check", "minor", "false"),
+        ],
+    }
+
+
+def test_flow_runs_to_the_first_input():
+    result = compile_flow(age_flow()).step()
+    assert result["messages"] == ["How old are you?"]
+    assert result["node"]["id"] == "age"
+
+
+@pytest.mark.parametrize("answer, ending", [("30", "Welcome!"), ("17", "Sorry."), ("1e2", "Welcome!"), ("0x20", "Welcome!")])
+def test_condition_branches(answer, ending):
+    result = compile_flow(age_flow()).step("age", answer)
+    assert result["messages"] == [ending]
+    assert result["node"] is None
+    assert result["captured"] == {"age": answer}
+
+
+def test_invalid_number_is_asked_again():
+    flow = compile_flow(age_flow())
+    for answer in ("nan", "inf", "1_000", "twelve"):
+        result = flow.step("age", answer)
+        assert result["error"] == "Please enter a number."
+        assert result["node"]["id"] == "age"
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("", 0.0), ("  ", 0.0), (" 42 ", 42.0), ("-1.5", -1.5), (".5", 0.5), ("5.", 5.0), ("1e3", 1000.0),
+    ("Infinity", math.inf), ("-Infinity", -math.inf), ("0x1A", 26.0), ("0b101", 5.0), ("0o17", 15.0),
+    (True, 1.0), (3, 3.0),
+])
+def test_number_follows_js(value, expected):
+    assert _number(value) == expected
+
+
+@pytest.mark.parametrize("value", ["nan", "NaN", "inf", "infinity", "1_000", "-0x1A", "0x", "1e", "12abc", "١٢"])
+def test_number_is_nan_where_js_is(value):
+    assert math.isnan(_number(value))
+
+
+def test_non_numeric_comparison_is_false():
+    flow = compile_flow(age_flow(operator="less_than", value="100"))
+    check = flow.nodes["check"]
+    assert not check.condition({"age": "abc"})
+    # Blank is 0 in JS, so it is less than 100
+    assert check.condition({})
+
+
+def test_unparsable_condition_value_is_reported():
+    flow = compile_flow(age_flow(value="lots"))
+    assert flow.errors == ["Node check: unsupported condition"]
+    assert flow.step("age", "30")["messages"] == ["Sorry."]
+
+
+def test_missing_nodes():
+    data = age_flow()
+    data["edges"].append(edge("adult", "gone"))
+    flow = compile_flow(data)
+    assert flow.errors == ["Edge adult-gone: references a missing node"]
+    with pytest.raises(FlowError):
+        flow.step("deleted-node", "x")
+    with pytest.raises(FlowError):
+        flow.step("start", "x")
+
+
+def test_branch_to_nowhere_ends_the_flow():
+    data = age_flow()
+    data["edges"] = [e for e in data["edges"] if e["sourceHandle"] != "false"]
+    result = compile_flow(data).step("age", "3")
+    assert result == {"messages": [], "node": None, "variables": {"age": "3"}, "captured": {"age": "3"}, "error": None}
+
+
+def test_cycle_without_input_is_stopped():
+    data = {
+        "nodes": [node("start", "start"), node("a", "message", message="A"), node("b", "message", message="B")],
+        "edges": [edge("start", "a"), edge("a", "b"), edge("b", "a")],
+    }
+    with pytest.raises(FlowError, match="did not reach an input or end node"):
+        compile_flow(data).step()
+
+
+def test_cycle_through_an_input_asks_again():
+    data = {
+        "nodes": [node("start", "start"), node("q", "textInput", label="name", message="Name?"),
+                  node("m", "message", message="Thanks")],
+        "edges": [edge("start", "q"), edge("q", "m"), edge("m", "q")],
+    }
+    result = compile_flow(data).step("q", "Ann")
+    assert result["messages"] == ["Thanks", "Name?"]
+    assert result["node"]["id"] == "q"
+
+
+@pytest.mark.parametrize("flow_data, error", [
+    ([], "flow_data must be an object"),
+    ({"nodes": {}}, "nodes must be a list"),
+    ({"nodes": ["start"]}, "Node 0: must be an object"),
+    ({"nodes": [{"type": "start"}]}, "Node 0: id must be a non-empty string"),
+    ({"nodes": [{"id": "a", "type": ["start"]}]}, "Node 0: type must be a string"),
+    ({"nodes": [{"id": "a", "data": "hi"}]}, "Node 0: data must be an object"),
+    ({"nodes": [{"id": "a", "data": {"label": {}}}]}, "Node 0: data.label must be a string"),
+    ({"nodes": [{"id": "a", "data": {"options": "yes,no"}}]}, "Node 0: data.options must be a list"),
+    ({"edges": [None]}, "Edge 0: must be an object"),
+    ({"edges": [{"source": "a", "target": 1}]}, "Edge 0: source and target must be strings"),
+    ({"edges": [{"source": "a", "target": "b", "sourceHandle": 1}]}, "Edge 0: sourceHandle must be a string"),
+])
+def test_malformed_flow_is_rejected_not_crashed(flow_data, error):
+    assert flow_shape_errors(flow_data) == [error]
+    flow = compile_flow(flow_data)
+    assert flow.errors == [error] and flow.nodes == {}
+    assert flow.step()["node"] is None
+
+
+def test_well_formed_flow_has_no_shape_errors():
+    assert flow_shape_errors(None) == []
+    assert flow_shape_errors({}) == []
+    assert flow_shape_errors(age_flow()) == []
+
+
+def test_patch_with_malformed_flow_is_a_400():
+    async def no_db():
+        yield None
+    main.app.dependency_overrides[get_db] = no_db
+    try:
+        response = TestClient(main.app).patch(f"/api/bots/{uuid.uuid4()}", json={"flow_data": {"nodes": ["x"]}})
+    finally:
+        main.app.dependency_overrides.pop(get_db, None)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid flow_data: Node 0: must be an object"
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import ingestion
+from models import KnowledgeJob
+
+
+def job(status, age_seconds):
+    return KnowledgeJob(status=status, updated_at=datetime.now(timezone.utc) - timedelta(seconds=age_seconds))
+
+
+@pytest.mark.parametrize("status, age, stale", [
+    ("processing", ingestion.INGEST_STALE_SECONDS + 60, True),
+    ("queued", ingestion.INGEST_STALE_SECONDS + 60, True),
+    ("processing", ingestion.INGEST_HEARTBEAT_SECONDS, False),
+    ("done", ingestion.INGEST_STALE_SECONDS + 60, False),
+    ("failed", ingestion.INGEST_STALE_SECONDS + 60, False),
+])
+def test_is_stale(status, age, stale):
+    assert ingestion.is_stale(job(status, age)) is stale
+
+
+def test_heartbeat_is_well_inside_the_stale_timeout():
+    assert ingestion.INGEST_HEARTBEAT_SECONDS * 3 <= ingestion.INGEST_STALE_SECONDS
+
+
+def test_pool_does_not_fork(monkeypatch):
+    monkeypatch.setattr(ingestion, "_pool", None)
+    pool = ingestion.get_pool()
+    try:
+        assert pool._mp_context.get_start_method() == "spawn"
+    finally:
+        pool.shutdown()
@@ -0,0 +1,88 @@
+import asyncio
+import uuid
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql.dml import Insert
+
+import knowledge_store
+from retrieval import chunk_text
+
+
+class Row:
+    char_count = 0
+    chunk_count = 7
+
+
+class Result:
+    def first(self):
+        return Row
+
+
+class RecordingSession:
+    def __init__(self):
+        self.inserts = []
+
+    async def execute(self, stmt):
+        if isinstance(stmt, Insert):
+            self.inserts.append(stmt.compile(dialect=postgresql.asyncpg.dialect()).params)
+        return Result()
+
+
+def test_large_documents_are_inserted_in_bounded_batches():
+    content = "\n\n".join(f"Paragraph {i}. " + "word " * 150 for i in range(2500))
+    chunks = chunk_text(content)
+    assert len(chunks) > 2 * knowledge_store.CHUNK_INSERT_BATCH
+
+    db = RecordingSession()
+    asyncio.run(knowledge_store.append_to_document(db, uuid.uuid4(), uuid.uuid4(), content))
+
+    assert len(db.inserts) == -(-len(chunks) // knowledge_store.CHUNK_INSERT_BATCH)
+    assert all(len(params) <= 5 * knowledge_store.CHUNK_INSERT_BATCH < 32767 for params in db.inserts)
+    positions = [value for params in db.inserts for name, value in params.items() if name.startswith("position")]
+    assert sorted(positions) == list(range(Row.chunk_count, Row.chunk_count + len(chunks)))
+
+
+class ScriptedResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def scalar(self):
+        return self.rows[0] if self.rows else None
+
+    def all(self):
+        return self.rows
+
+    def scalars(self):
+        return self
+
+
+class ScriptedSession:
+    """Answers each execute() with the next rows in `script` and counts the queries."""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.queries = 0
+
+    async def execute(self, stmt, params=None):
+        self.queries += 1
+        return ScriptedResult(self.script.pop(0))
+
+
+def load(db, previous=None):
+    return asyncio.run(knowledge_store.load_runtime_knowledge(db, uuid.uuid4(), full_context=False, previous=previous))
+
+
+def test_runtime_knowledge_is_reused_while_documents_are_unchanged():
+    documents = [("hash-a", 2)]
+    first = load(ScriptedSession([], documents, ["Opening hours are nine to five.", "We sell shoes."]))
+    assert first[1]["chunks"] == ["Opening hours are nine to five.", "We sell shoes."]
+
+    # A visual edit bumped the version: no chunk query, same index object
+    db = ScriptedSession([], documents)
+    assert load(db, previous=first) is first
+    assert db.queries == 2
+
+    # Ingestion appended a page range to the same document
+    db = ScriptedSession([], [("hash-a", 3)], ["Opening hours are nine to five.", "We sell shoes.", "Returns: 30 days."])
+    third = load(db, previous=first)
+    assert third[2] != first[2] and len(third[1]["chunks"]) == 3
@@ -0,0 +1,23 @@
+import uuid
+
+from lead_capture import capture_writer, merge_captures, queue_capture
+
+
+def test_queue_capture_strips_nul_bytes():
+    bot_uuid = uuid.uuid4()
+    queue_capture(bot_uuid, "visitor\x00-1", {"email": "a\x00@example.com"})
+    item = capture_writer._pending.pop()
+    assert item == (bot_uuid, "visitor-1", {"email": "a@example.com"})
+
+
+def test_merge_captures_keeps_arrival_order_per_session():
+    bot_uuid = uuid.uuid4()
+    merged = merge_captures([
+        (bot_uuid, "s1", {"email": "old@example.com"}),
+        (bot_uuid, "s2", {"name": "B"}),
+        (bot_uuid, "s1", {"email": "new@example.com", "name": "A"}),
+    ])
+    assert merged == {
+        (bot_uuid, "s1"): {"email": "new@example.com", "name": "A"},
+        (bot_uuid, "s2"): {"name": "B"},
+    }
@@ -0,0 +1,60 @@
+import asyncio
+import csv
+import io
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import leads
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def partitions(self, size):
+        for start in range(0, len(self.rows), size):
+            yield self.rows[start:start + size]
+
+
+class FakeSession:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def stream(self, stmt):
+        return FakeResult(self.rows)
+
+
+def export_csv(monkeypatch, rows, columns):
+    monkeypatch.setattr(leads, "async_session", lambda: FakeSession(rows))
+
+    async def collect():
+        return "".join([part async for part in leads.stream_leads_export(uuid.uuid4(), "csv", columns=columns)])
+
+    return list(csv.reader(io.StringIO(asyncio.run(collect()))))
+
+
+def test_csv_export_neutralises_formulas(monkeypatch):
+    row = SimpleNamespace(
+        id=uuid.uuid4(),
+        session_id="=HYPERLINK(\"http://evil\")",
+        data={"email": "@SUM(A1)", "phone": "+1 555 0100", "note": "\tcmd", "name": "Ann", "age": -3},
+        created_at=datetime(2026, 1, 1, tzinfo=timezone.utc),
+    )
+    header, line = export_csv(monkeypatch, [row], ["email", "phone", "note", "name", "age"])
+    assert header == ["id", "session_id", "created_at", "email", "phone", "note", "name", "age"]
+    assert line[1] == "'=HYPERLINK(\"http://evil\")"
+    assert line[3:] == ["'@SUM(A1)", "'+1 555 0100", "'\tcmd", "Ann", "-3"]
+
+
+def test_csv_cell_leaves_safe_values_alone():
+    assert leads.csv_cell("hello") == "hello"
+    assert leads.csv_cell(42) == 42
+    assert leads.csv_cell("-5") == "'-5"
+    assert leads.csv_cell("\rx") == "'\rx"
@@ -0,0 +1,168 @@
+import asyncio
+
+import pytest
+
+from llm_client import CircuitBreaker, FakeProvider, LLMClient, LLMUnavailable
+
+PRIMARY, FALLBACK = "primary", "fallback"
+
+
+class ScriptedProvider(FakeProvider):
+    """FakeProvider whose calls follow `script`: each step is a delay in seconds or an exception to raise."""
+
+    def __init__(self, script=(), **kwargs):
+        super().__init__(latency=0, jitter=0, **kwargs)
+        self.script = list(script)
+        self.called = []
+
+    async def _upstream(self, model):
+        self.calls += 1
+        self.called.append(model)
+        if model in self.down_models:
+            raise self.error(f"fake upstream error from {model}")
+        step = self.script.pop(0) if self.script else 0
+        if isinstance(step, BaseException):
+            raise step
+        await asyncio.sleep(step)
+
+
+class BrokenStreamProvider(FakeProvider):
+    """Streams one chunk, then loses the connection."""
+
+    async def stream(self, model, prompt):
+        self.calls += 1
+
+        async def chunks():
+            yield self.answer[:5]
+            raise ConnectionError("connection reset mid-stream")
+        return chunks()
+
+
+def make_client(provider, **kwargs):
+    kwargs = {"models": [PRIMARY, FALLBACK], "timeout": 0.1, "deadline": 5, "max_retries": 1, **kwargs}
+    client = LLMClient(provider, **kwargs)
+    client._backoff = lambda attempt: 0
+    return client
+
+
+def test_timeout_is_retried():
+    provider = ScriptedProvider([1.0, 0])
+    client = make_client(provider)
+    stats = {}
+    response = asyncio.run(client.generate("hi", stats))
+    assert response.text == provider.answer
+    assert provider.called == [PRIMARY, PRIMARY]
+    assert client.retries == 1 and client.fallbacks == 0
+    assert stats == {"model": PRIMARY, "attempts": 2}
+
+
+def test_bad_request_fails_at_once():
+    provider = ScriptedProvider([ValueError("prompt rejected")])
+    client = make_client(provider)
+    with pytest.raises(ValueError, match="prompt rejected"):
+        asyncio.run(client.generate("hi"))
+    assert provider.called == [PRIMARY]
+    assert client.breaker_states() == {PRIMARY: "closed", FALLBACK: "closed"}
+
+
+def test_fallback_chain():
+    provider = ScriptedProvider(down_models=[PRIMARY])
+    client = make_client(provider)
+    stats = {}
+    asyncio.run(client.generate("hi", stats))
+    assert provider.called == [PRIMARY, PRIMARY, FALLBACK]
+    assert stats["model"] == FALLBACK and client.fallbacks == 1
+
+
+def test_full_outage_raises_unavailable():
+    provider = ScriptedProvider(down_models=[PRIMARY, FALLBACK])
+    client = make_client(provider)
+    with pytest.raises(LLMUnavailable):
+        asyncio.run(client.generate("hi"))
+    assert provider.calls == 4
+
+
+def test_open_circuit_skips_the_model():
+    provider = ScriptedProvider(down_models=[PRIMARY])
+    client = make_client(provider, max_retries=0)
+    client.breakers[PRIMARY] = CircuitBreaker(PRIMARY, failure_threshold=2, reset_timeout=60)
+
+    async def calls(n):
+        for _ in range(n):
+            await client.generate("hi")
+
+    asyncio.run(calls(4))
+    # The primary is tried until its circuit opens, then every call goes straight to the fallback
+    assert provider.called == [PRIMARY, FALLBACK, PRIMARY, FALLBACK, FALLBACK, FALLBACK]
+    assert client.breaker_states()[PRIMARY] == "open"
+
+
+def test_breaker_opens_then_half_opens(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("llm_client.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker("m", failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] += 30
+    assert breaker.allow() and breaker.state == "half_open"
+    # Only one probe at a time
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0 and breaker.allow()
+
+
+def test_stuck_probe_does_not_wedge_the_breaker(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("llm_client.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker("m", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    now[0] += 30
+    assert breaker.allow()
+    now[0] += 30
+    assert breaker.allow()
+
+
+def test_hedge_answers_from_the_faster_request():
+    provider = ScriptedProvider([1.0, 0])
+    client = make_client(provider, timeout=2, hedge_after=0.05)
+    response = asyncio.run(asyncio.wait_for(client.generate("hi"), timeout=0.5))
+    assert response.text == provider.answer
+    assert client.hedges == 1 and client.retries == 0
+
+
+def collect(client, prompt="hi"):
+    async def run():
+        return [chunk.text async for chunk in client.stream(prompt)]
+    return asyncio.run(run())
+
+
+def test_stream_falls_back_before_the_first_chunk():
+    provider = ScriptedProvider(down_models=[PRIMARY])
+    client = make_client(provider, max_retries=0)
+    assert "".join(collect(client)) == provider.answer
+    assert provider.called == [PRIMARY, FALLBACK]
+
+
+def test_stream_is_not_retried_after_the_first_chunk():
+    provider = BrokenStreamProvider(latency=0, jitter=0)
+    client = make_client(provider)
+    received = []
+
+    async def run():
+        async for chunk in client.stream("hi"):
+            received.append(chunk)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(run())
+    assert received == [provider.answer[:5]]
+    assert provider.calls == 1
+    assert client.retries == 0 and client.fallbacks == 0
+    assert client.breakers[PRIMARY].failures == 1
@@ -0,0 +1,63 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+import media
+
+
+@pytest.fixture
+def media_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(media, "MEDIA_DIR", str(tmp_path / "media"))
+    return tmp_path / "media"
+
+
+def write_png(path, size):
+    Image.new("RGB", size, "red").save(path, "PNG")
+    return str(path)
+
+
+def test_variants_are_written_without_upscaling(tmp_path, media_dir):
+    source = write_png(tmp_path / "logo.png", (100, 50))
+    assert media.transcode(source, "ab" * 32) == len(media.MEDIA_SIZES) * len(media.FORMATS)
+    with Image.open(media_dir / media.variant_name("ab" * 32, 64, "webp")) as small:
+        assert small.size == (64, 32)
+    with Image.open(media_dir / media.variant_name("ab" * 32, 256, "png")) as large:
+        assert large.size == (100, 50)
+    assert media.transcode(source, "ab" * 32) == 0
+
+
+def test_variants_are_world_readable(tmp_path, media_dir):
+    media.transcode(write_png(tmp_path / "logo.png", (10, 10)), "cd" * 32)
+    for name in os.listdir(media_dir):
+        assert os.stat(media_dir / name).st_mode & 0o777 == 0o644
+
+
+def test_oversized_image_is_rejected_before_decoding(tmp_path, media_dir, monkeypatch):
+    source = write_png(tmp_path / "big.png", (300, 200))
+    monkeypatch.setattr(media, "MEDIA_MAX_PIXELS", 300 * 200 - 1)
+    monkeypatch.setattr(media.ImageOps, "exif_transpose", lambda image: pytest.fail("image was decoded"))
+    with pytest.raises(media.InvalidImage):
+        media.transcode(source, "cd" * 32)
+    assert not any(media_dir.iterdir())
+
+
+def test_corrupt_image_is_rejected(tmp_path, media_dir):
+    source = tmp_path / "bad.png"
+    source.write_bytes(b"not an image")
+    with pytest.raises(media.InvalidImage):
+        media.transcode(str(source), "ef" * 32)
+
+
+def test_concurrent_transcodes_of_the_same_image(tmp_path, media_dir):
+    source = write_png(tmp_path / "logo.png", (400, 400))
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: media.transcode(source, "12" * 32), range(8)))
+    names = sorted(os.listdir(media_dir))
+    assert not [name for name in names if name.endswith(".tmp")]
+    assert len(names) == len(media.MEDIA_SIZES) * len(media.FORMATS)
+    for name in names:
+        with Image.open(media_dir / name) as image:
+            image.load()
@@ -0,0 +1,22 @@
+from fastapi.testclient import TestClient
+
+import main
+
+
+def scrape(token=None):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    return TestClient(main.app).get("/metrics", headers=headers)
+
+
+def test_metrics_are_disabled_without_a_token(monkeypatch):
+    monkeypatch.setattr(main, "METRICS_TOKEN", None)
+    assert scrape().status_code == 404
+
+
+def test_metrics_require_the_token(monkeypatch):
+    monkeypatch.setattr(main, "METRICS_TOKEN", "secret")
+    assert scrape().status_code == 401
+    assert scrape("wrong").status_code == 401
+    response = scrape("secret")
+    assert response.status_code == 200
+    assert "llm_in_flight" in response.text
@@ -0,0 +1,79 @@
+import pytest
+
+import prompt_builder
+from prompt_builder import TokenCounter, build, truncate_to_tokens
+
+
+@pytest.fixture
+def counter():
+    # Uncalibrated, so results don't depend on what other tests fed the shared counter
+    return TokenCounter()
+
+
+def sentence(i, words=20):
+    return " ".join(f"fact{i}word{j}" for j in range(words))
+
+
+def test_everything_fits_untrimmed(counter):
+    prompt = build("Be helpful.", "Opening hours?", chunks=["We open at nine."], summary="Asked about shoes.",
+                   turns=[("user", "hi"), ("assistant", "hello")], budget=1000, counter=counter)
+    assert prompt.trimmed == []
+    for part in ("Be helpful.", "Opening hours?", "We open at nine.", "Asked about shoes.", "User: hi", "Assistant: hello"):
+        assert part in prompt.text
+    assert prompt.tokens <= prompt.budget
+
+
+@pytest.mark.parametrize("budget", [150, 300, 600, 1200])
+def test_prompt_stays_within_budget(counter, budget):
+    chunks = [sentence(i) for i in range(30)]
+    turns = [("user" if i % 2 == 0 else "assistant", sentence(100 + i, 10)) for i in range(12)]
+    prompt = build("You are a shop assistant.", "Do you ship abroad?", chunks=chunks, summary=sentence(99, 40),
+                   turns=turns, budget=budget, counter=counter)
+    assert prompt.tokens <= budget
+    assert counter.count(prompt.text) <= budget * 1.05
+    assert "You are a shop assistant." in prompt.text and "Do you ship abroad?" in prompt.text
+
+
+def test_history_is_kept_newest_first_and_before_context(counter):
+    turns = [("user", sentence(i, 10)) for i in range(10)]
+    chunks = [sentence(50 + i) for i in range(10)]
+    prompt = build("Sys.", "Q?", chunks=chunks, turns=turns, budget=250, counter=counter)
+    kept = [i for i in range(10) if sentence(i, 10) in prompt.text]
+    assert kept and kept == list(range(10 - len(kept), 10))
+    assert "history" in prompt.trimmed
+    # Turns don't all fit, so no chunk gets budget
+    assert not any(sentence(50 + i)[:20] in prompt.text for i in range(10))
+
+
+def test_context_keeps_rank_order_and_truncates_the_overflowing_chunk(counter, monkeypatch):
+    monkeypatch.setattr(prompt_builder, "PROMPT_MIN_PART_TOKENS", 8)
+    chunks = [sentence(i) for i in range(10)]
+    prompt = build("Sys.", "Q?", chunks=chunks, budget=500, counter=counter)
+    assert prompt.trimmed == ["context"]
+    whole = [i for i in range(10) if chunks[i] in prompt.text]
+    assert whole == list(range(len(whole)))
+    cut = chunks[len(whole)]
+    assert cut.split()[0] in prompt.text and " …" in prompt.text
+
+
+def test_overflow_below_minimum_is_dropped(counter, monkeypatch):
+    monkeypatch.setattr(prompt_builder, "PROMPT_MIN_PART_TOKENS", 10_000)
+    prompt = build("Sys.", "Q?", chunks=[sentence(i) for i in range(10)], budget=500, counter=counter)
+    assert "…" not in prompt.text
+
+
+def test_oversized_question_is_capped_to_its_share(counter):
+    question = sentence(1, 400)
+    prompt = build("Sys.", question, budget=400, counter=counter)
+    assert "question" in prompt.trimmed
+    asked = prompt.text.split("User Question: ", 1)[1]
+    assert counter.count(asked) <= 400 * prompt_builder.PROMPT_QUESTION_SHARE + counter.count("\n\nAnswer:") + 1
+
+
+def test_truncate_to_tokens(counter):
+    text = sentence(1, 200)
+    cut = truncate_to_tokens(text, 50, counter)
+    assert counter.count(cut) <= 50 + counter.count(" …")
+    assert text.startswith(cut[:-2])
+    assert truncate_to_tokens("short", 50, counter) == "short"
+    assert truncate_to_tokens(text, 0, counter) == ""
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+import ratelimit
+
+
+class Client:
+    host = "10.0.0.1"
+
+
+class Request:
+    def __init__(self, forwarded=None):
+        self.headers = {"x-forwarded-for": forwarded} if forwarded is not None else {}
+        self.client = Client
+
+
+@pytest.fixture
+def trust_proxies(monkeypatch):
+    def trust(hops):
+        monkeypatch.setattr(ratelimit, "TRUST_FORWARDED_FOR", True)
+        monkeypatch.setattr(ratelimit, "TRUSTED_PROXY_HOPS", hops)
+    return trust
+
+
+def test_forwarded_for_ignored_unless_trusted():
+    assert ratelimit.client_ip(Request("1.2.3.4")) == "10.0.0.1"
+
+
+def test_forged_leftmost_entries_are_ignored(trust_proxies):
+    trust_proxies(1)
+    assert ratelimit.client_ip(Request("6.6.6.6, 203.0.113.7")) == "203.0.113.7"
+    assert ratelimit.client_ip(Request("7.7.7.7, 203.0.113.7")) == "203.0.113.7"
+
+
+def test_nth_entry_from_the_right(trust_proxies):
+    trust_proxies(2)
+    assert ratelimit.client_ip(Request("6.6.6.6, 203.0.113.7, 198.51.100.2")) == "203.0.113.7"
+
+
+def test_missing_or_short_header_falls_back_to_peer(trust_proxies):
+    trust_proxies(2)
+    assert ratelimit.client_ip(Request("203.0.113.7")) == "10.0.0.1"
+    assert ratelimit.client_ip(Request()) == "10.0.0.1"
+    assert ratelimit.client_ip(Request(" , ")) == "10.0.0.1"
+
+
+def test_token_bucket_refuses_after_burst():
+    limiter = ratelimit.TokenBucketLimiter("test", rate=0.001, burst=2)
+
+    async def take_three():
+        return [await limiter.take("k") for _ in range(3)]
+
+    results = asyncio.run(take_three())
+    assert [allowed for allowed, _ in results] == [True, True, False]
+    assert results[-1][1] >= 1
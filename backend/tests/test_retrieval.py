@@ -0,0 +1,38 @@
+from retrieval import chunk_text
+
+
+def test_small_paragraphs_are_packed_together():
+    text = "First paragraph.\n\nSecond   paragraph\nspans lines.\n\n\n  Third.  "
+    assert chunk_text(text, size=100) == ["First paragraph.\nSecond paragraph spans lines.\nThird."]
+
+
+def test_chunks_never_exceed_size():
+    text = "\n\n".join(f"Paragraph {i} " + "word " * (i % 7) for i in range(40))
+    chunks = chunk_text(text, size=60, overlap=10)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 60 for chunk in chunks)
+    # Packing only changes separators, never the words
+    assert " ".join(" ".join(chunks).split()) == " ".join(text.split())
+
+
+def test_long_paragraph_is_windowed_with_overlap():
+    words = [f"w{i:03d}" for i in range(100)]
+    chunks = chunk_text(" ".join(words), size=50, overlap=12)
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    # Windows end on whitespace, and each starts inside the tail of the previous one
+    assert all(chunk.split()[-1] in words for chunk in chunks)
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current[:8] in previous[-12:]
+    assert chunks[0].split()[0] == words[0] and chunks[-1].split()[-1] == words[-1]
+
+
+def test_long_paragraph_flushes_the_pending_chunk_first():
+    chunks = chunk_text("Intro.\n\n" + "x" * 30, size=20, overlap=5)
+    assert chunks[0] == "Intro."
+    assert "".join(chunks[1:]).startswith("x" * 20)
+
+
+def test_empty_text_has_no_chunks():
+    assert chunk_text("") == []
+    assert chunk_text(None) == []
+    assert chunk_text(" \n\n \n") == []
@@ -0,0 +1,100 @@
+import shutil
+import subprocess
+
+import pytest
+
+import widget_bundle
+from widget_bundle import minify_js
+
+node = shutil.which("node")
+needs_node = pytest.mark.skipif(node is None, reason="node is not installed")
+
+# Each program prints what it computes, so the minified copy must print the same
+CORPUS = {
+    "regex with quotes and spaces": """
+        var r = /it's  "x"/g;  // a quote inside a regex
+        console.log(r.source, "it's  \\"x\\" it's  \\"x\\"".replace(r, "-"));
+    """,
+    "regex with slashes": """
+        console.log("a/b//c".split(/[/]+/).join("|"), /\\/\\//.test("x//y"), /[*]/.test("*"));
+    """,
+    "regex after keyword": """
+        function f(s) { return /a b/i.test(s) }
+        console.log(f("A b"), f("ab"), typeof /x/);
+    """,
+    "division": """
+        var a = 10, g = 2, i = 1, j = 4;
+        var k = j++ / 2;
+        console.log(a / g / i, a /g/ i, (a) / 2, [a][0] / 2, k, j-- / 2);
+    """,
+    "asi": """
+        var a = 1
+        var b = a
+        ++b
+        function g() {
+          return
+          42
+        }
+        var x = [1, 2]
+          .map(function (v) { return v * 2 })
+        let s = "a"
+        ;[1, 2].forEach(n => s += n)
+        console.log(a, b, g(), x, s)
+    """,
+    "templates": """
+        const n = 3, o = {k: "v"}
+        console.log(`a  ${n + 1}  b ${`nested ${o.k}  `} // not a comment /* nor this */`)
+        console.log(`brace } in ${ {a: 1}.a } and ${"}"}`)
+    """,
+    "comments and unary operators": """
+        var u = "http://x" // trailing
+        /* block */ console.log(u, 1 /* inline */ + 2)
+        var a = 5, b = 2
+        console.log(a - -b, a + +b, a - - b, 1 .toString(), 'it\\'s /*', "//")
+    """,
+}
+
+
+def run_node(code):
+    result = subprocess.run([node, "-"], input=code, capture_output=True, text=True, timeout=30)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+@needs_node
+@pytest.mark.parametrize("name", sorted(CORPUS))
+def test_minified_corpus_behaves_the_same(name):
+    source = CORPUS[name]
+    minified = minify_js(source)
+    assert len(minified) < len(source)
+    assert run_node(minified) == run_node(source)
+
+
+@needs_node
+def test_minified_widget_parses(tmp_path):
+    bundle = widget_bundle.build("bot", '{"color":"#3b82f6"}', "etag")
+    path = tmp_path / "widget.js"
+    path.write_bytes(bundle["identity"])
+    result = subprocess.run([node, "--check", str(path)], capture_output=True, text=True, timeout=30)
+    assert result.returncode == 0, result.stderr
+
+
+def test_widget_shrinks_and_keeps_its_strings():
+    with open(widget_bundle.WIDGET_SOURCE, encoding="utf-8") as f:
+        source = f.read()
+    minified = minify_js(source)
+    assert len(minified) < len(source) * 0.8
+    assert "/*" not in minified
+    assert "Nimmi AI" in minified
+
+
+def test_regex_literal_is_copied_verbatim():
+    assert minify_js("x = /a  'b' [/]/g ;") == "x=/a  'b' [/]/g;"
+    # After a value, `/` divides and keeps its spacing
+    assert minify_js("y = a / b / c") == "y=a / b / c"
+
+
+def test_negotiate():
+    assert widget_bundle.negotiate("gzip, deflate") == "gzip"
+    assert widget_bundle.negotiate("gzip;q=0, identity") == "identity"
+    assert widget_bundle.negotiate(None) == "identity"
@@ -1,8 +1,13 @@
 import os
+import time
 from PyPDF2 import PdfReader
 import google.generativeai as genai
 from dotenv import load_dotenv
 
+import metrics
+from llm_client import llm_client
+from ratelimit import ConcurrencyLimiter
+
 load_dotenv()
 
 # Initialize Clients (Resilient)
@@ -13,31 +18,80 @@ except Exception as e:
 
 # Pinecone is no longer used. Using RAG Lite (direct text context).
 
-def extract_text_from_pdf(pdf_file):
-    try:
-        reader = PdfReader(pdf_file)
-        text = ""
-        for page in reader.pages:
-            content = page.extract_text()
-            if content:
-                text += content + "\n"
-        return text
-    except Exception as e:
-        print(f"Error extracting PDF: {e}")
-        return ""
-
-def extract_text_from_txt(txt_file):
-    try:
-        content = txt_file.read()
-        if isinstance(content, bytes):
-            return content.decode('utf-8')
-        return content
-    except Exception as e:
-        print(f"Error extracting TXT: {e}")
-        return ""
-
-def generate_ai_response(system_prompt, context, user_query):
-    model = genai.GenerativeModel('models/gemini-3-flash-preview')
-    prompt = f"{system_prompt}\n\nContext:\n{context}\n\nUser Question: {user_query}\n\nAnswer:"
-    response = model.generate_content(prompt)
+# Upper bound on in-flight model calls per worker; timeouts, retries and fallbacks live in llm_client
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 200))
+# Calls allowed to wait for a slot, and for how long, before being rejected as Overloaded
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 100))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", 5))
+
+llm_slots = ConcurrencyLimiter("llm", LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT_SECONDS)
+
+def count_pdf_pages(path):
+    return len(PdfReader(path).pages)
+
+def extract_pdf_pages(path, start, stop):
+    """Text of pages [start, stop) of the PDF at `path`. Runs in the ingestion process pool."""
+    reader = PdfReader(path)
+    pages = []
+    for page in reader.pages[start:stop]:
+        content = page.extract_text()
+        if content:
+            pages.append(content)
+    return pages
+
+def usage_tokens(response):
+    """(prompt tokens, completion tokens) from a response or stream chunk; zeros if not reported."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0, 0
+    return getattr(usage, "prompt_token_count", 0) or 0, getattr(usage, "candidates_token_count", 0) or 0
+
+def record_usage(stats, response, started):
+    """Fill a caller-supplied stats dict with latency and token usage of a model call."""
+    if stats is None:
+        return
+    stats["latency_ms"] = int((time.perf_counter() - started) * 1000)
+    if getattr(response, "usage_metadata", None) is not None:
+        stats["prompt_tokens"], stats["completion_tokens"] = usage_tokens(response)
+
+async def generate_from_prompt_async(prompt, stats=None):
+    """
+    Non-blocking variant for async handlers. Uses the SDK's async API so the
+    event loop keeps serving other requests during the model round-trip;
+    concurrency is capped per worker (callers queue briefly, then get
+    Overloaded), and llm_client adds deadlines, retries and fallbacks.
+    """
+    async with llm_slots.slot():
+        started = time.perf_counter()
+        try:
+            response = await llm_client.generate(prompt, stats=stats)
+        except Exception:
+            metrics.record_llm_call("generate", time.perf_counter() - started, error=True)
+            raise
+        metrics.record_llm_call("generate", time.perf_counter() - started, False, *usage_tokens(response))
+        record_usage(stats, response, started)
     return response.text
+
+
+async def stream_from_prompt_async(prompt, stats=None):
+    """Yield answer text fragments as the model produces them."""
+    async with llm_slots.slot():
+        started = time.perf_counter()
+        tokens = (0, 0)
+        error = True
+        try:
+            async for chunk in llm_client.stream(prompt, stats=stats):
+                # Usage metadata arrives on the final chunks; keep the latest
+                record_usage(stats, chunk, started)
+                if getattr(chunk, "usage_metadata", None) is not None:
+                    tokens = usage_tokens(chunk)
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without text parts (e.g. a trailing finish_reason) raise on .text
+                    continue
+                if text:
+                    yield text
+            error = False
+        finally:
+            metrics.record_llm_call("stream", time.perf_counter() - started, error, *tokens)
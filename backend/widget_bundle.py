@@ -0,0 +1,206 @@
+"""
+Bootstrap bundle for the embeddable widget.
+/api/bots/{id}/widget.js serves widget.js minified, with the bot's widget
+config passed in as NIMMI_BOOTSTRAP, so an embed renders after one request
+instead of loading the script and then fetching its config. Bundles are
+built once per bot version (widget source + config ETag), precompressed
+with brotli (when installed) and gzip, and kept per worker; a bot edit
+changes the config ETag, so the next request rebuilds.
+"""
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import re
+
+from cache import TTLCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+WIDGET_SOURCE = os.getenv("WIDGET_SOURCE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "widget", "widget.js"))
+WIDGET_BUNDLE_CACHE_SIZE = int(os.getenv("WIDGET_BUNDLE_CACHE_SIZE", 512))
+WIDGET_BUNDLE_CACHE_TTL = int(os.getenv("WIDGET_BUNDLE_CACHE_TTL", 3600))
+ENCODINGS = ("br", "gzip", "identity") if brotli is not None else ("gzip", "identity")
+
+# Punctuation that whitespace next to can be dropped; + - / . are left out so `a - -b`, `a / /re/` and `1 .x` survive
+_TIGHT = set("{}()[];,=:<>?!&|*%^~")
+# A newline after these can't have ended a statement, so ASI never applies
+_JOINS_NEXT_LINE = set("{([,;=:?&|<>!*%^~")
+_ENDS_BEFORE = set("})],;")
+# A `/` after these (or at the start) begins a regex literal rather than a division
+_STARTS_REGEX = set("(,=:[!&|?{};+-*%<>~^")
+_REGEX_KEYWORD_RE = re.compile(r"(?:^|[^\w$])(?:return|typeof|instanceof|in|of|new|delete|void|throw|case|do|else|yield|await)$")
+
+_source = None
+bundle_cache = TTLCache(maxsize=WIDGET_BUNDLE_CACHE_SIZE, ttl=WIDGET_BUNDLE_CACHE_TTL)
+
+
+class WidgetUnavailable(Exception):
+    pass
+
+
+def minify_js(source):
+    """
+    Drop comments and redundant whitespace. Strings and template literals
+    (with nested ${...} expressions) are copied verbatim, and a line break
+    is only removed where it can't end a statement. A `/` starts a regex
+    literal, also copied verbatim, where a division can't appear: after an
+    operator, an opening bracket or a keyword such as return.
+    """
+    out = []
+
+    def emit(token):
+        # Drop the whitespace before `token` when it separates nothing
+        if out and out[-1].isspace():
+            prev = out[-2][-1] if len(out) > 1 else ""
+            if out[-1] == "\n":
+                if prev in _JOINS_NEXT_LINE or token[0] in _ENDS_BEFORE:
+                    out.pop()
+            elif prev in _TIGHT or token[0] in _TIGHT:
+                out.pop()
+        out.append(token)
+
+    def space(newline):
+        if not out:
+            return
+        if out[-1] == " " and newline:
+            out[-1] = "\n"
+        elif not out[-1].isspace():
+            out.append("\n" if newline else " ")
+
+    def regex_end(start):
+        # End of the regex literal at `start`, or None if `/` there is a division
+        tail = "".join(out[-12:]).rstrip()
+        if tail.endswith(("++", "--")) or tail and tail[-1] not in _STARTS_REGEX and not _REGEX_KEYWORD_RE.search(tail):
+            return None
+        j, in_class = start + 1, False
+        while j < n and source[j] != "\n":
+            c = source[j]
+            if c == "\\":
+                j += 1
+            elif c == "[":
+                in_class = True
+            elif c == "]":
+                in_class = False
+            elif c == "/" and not in_class:
+                j += 1
+                while j < n and (source[j].isalnum() or source[j] in "_$"):
+                    j += 1
+                return j
+            j += 1
+        return None
+
+    # One entry per nesting level: brace depth for code, None inside a template literal
+    stack = [0]
+    i, n = 0, len(source)
+    while i < n:
+        c = source[i]
+        if stack[-1] is None:
+            if c == "\\":
+                out.append(source[i:i + 2])
+                i += 2
+            elif c == "`":
+                out.append(c)
+                stack.pop()
+                i += 1
+            elif source.startswith("${", i):
+                out.append("${")
+                stack.append(0)
+                i += 2
+            else:
+                out.append(c)
+                i += 1
+            continue
+        if c in "'\"":
+            j = i + 1
+            while source[j] != c:
+                j += 2 if source[j] == "\\" else 1
+            emit(source[i:j + 1])
+            i = j + 1
+        elif c == "`":
+            emit(c)
+            stack.append(None)
+            i += 1
+        elif source.startswith("//", i):
+            end = source.find("\n", i)
+            i = n if end == -1 else end
+        elif source.startswith("/*", i):
+            end = source.index("*/", i) + 2
+            space("\n" in source[i:end])
+            i = end
+        elif c == "/" and (end := regex_end(i)) is not None:
+            emit(source[i:end])
+            i = end
+        elif c.isspace():
+            j = i
+            while j < n and source[j].isspace():
+                j += 1
+            space("\n" in source[i:j])
+            i = j
+        else:
+            if c == "{":
+                stack[-1] += 1
+            elif c == "}":
+                if stack[-1] == 0 and len(stack) > 1:
+                    stack.pop()  # closes a template's ${
+                else:
+                    stack[-1] -= 1
+            emit(c)
+            i += 1
+    return "".join(out).strip()
+
+
+def widget_source():
+    """(minified widget.js, its sha256), read once per process."""
+    global _source
+    if _source is None:
+        try:
+            with open(WIDGET_SOURCE, encoding="utf-8") as f:
+                text = minify_js(f.read())
+        except OSError as e:
+            raise WidgetUnavailable(f"Widget source not found at {WIDGET_SOURCE}: {e}")
+        _source = (text, hashlib.sha256(text.encode()).hexdigest())
+        logger.info(f"Loaded widget bundle source ({len(text)} bytes minified)")
+    return _source
+
+
+def build(bot_id, config_body, config_etag):
+    """Bundle for one bot version: {"version": ..., encoding: bytes for each of ENCODINGS}."""
+    source, source_digest = widget_source()
+    version = hashlib.sha256(f"{source_digest}:{config_etag}".encode()).hexdigest()[:20]
+    body = (
+        f'(function(NIMMI_BOOTSTRAP){{\n{source}\n}})'
+        f'({{"bot_id":"{bot_id}","version":"{version}","config":{config_body}}});\n'
+    ).encode()
+    bundle = {"version": version, "identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        bundle["br"] = brotli.compress(body, mode=brotli.MODE_TEXT, quality=11)
+    return bundle
+
+
+async def get(bot_id, config_body, config_etag):
+    """Cached bundle for the bot, rebuilt (off the event loop) when its config ETag no longer matches."""
+    bundle = bundle_cache.get(bot_id)
+    if bundle is None or bundle["config_etag"] != config_etag:
+        bundle = await asyncio.to_thread(build, bot_id, config_body, config_etag)
+        bundle["config_etag"] = config_etag
+        bundle_cache.set(bot_id, bundle)
+    return bundle
+
+
+def negotiate(accept_encoding):
+    """Best precompressed encoding the client accepts."""
+    accepted = set()
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(name.strip())
+    for encoding in ENCODINGS:
+        if encoding in accepted or encoding == "identity":
+            return encoding
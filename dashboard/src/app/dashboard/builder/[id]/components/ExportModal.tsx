@@ -16,11 +16,9 @@ export default function ExportModal({ botId, onClose }: ExportModalProps) {
     const [checkingStatus, setCheckingStatus] = useState(true);
     const [paying, setPaying] = useState(false);
 
-    const baseUrl = typeof window !== "undefined" && !window.location.hostname.includes("localhost")
-        ? window.location.origin
-        : "http://localhost:3000";
     const apiBase = process.env.NEXT_PUBLIC_API_URL || "http://127.0.0.1:8000";
-    const scriptUrl = `${baseUrl}/widget.js`;
+    // Bootstrap bundle: the widget with this bot's config inlined, served by the API
+    const scriptUrl = `${apiBase}/api/bots/${botId}/widget.js`;
 
     useEffect(() => {
         const checkStatus = async () => {
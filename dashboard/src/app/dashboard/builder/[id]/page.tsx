@@ -68,11 +68,17 @@ function BuilderContent({ params }: { params: Promise<{ id: string }> }) {
     const fetchLeads = async () => {
         setLeadsLoading(true);
         try {
-            const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/bots/${id}/leads`);
-            const data = await res.json();
-            if (res.ok) {
-                setLeads(data);
-            }
+            // Leads are paginated; follow the cursor header until every page is loaded
+            const all: any[] = [];
+            let cursor: string | null = null;
+            do {
+                const query: string = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+                const res: Response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/bots/${id}/leads${query}`);
+                if (!res.ok) break;
+                all.push(...(await res.json()));
+                cursor = res.headers.get("X-Next-Cursor");
+            } while (cursor);
+            setLeads(all);
         } catch (err) {
             console.error("Failed to fetch leads:", err);
         } finally {
@@ -183,13 +189,15 @@ function BuilderContent({ params }: { params: Promise<{ id: string }> }) {
             }
 
             setSaving(true);
+            // Saving knowledge replaces every stored document, so only send it when it was edited
+            const lastKnowledgeBase = lastSavedState.current ? JSON.parse(lastSavedState.current).knowledgeBase : undefined;
             const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/bots/${id}`, {
                 method: "PATCH",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({
                     bot_name: botName,
                     system_prompt: systemPrompt,
-                    knowledge_base: knowledgeBase,
+                    ...(knowledgeBase !== lastKnowledgeBase ? { knowledge_base: knowledgeBase } : {}),
                     visual_config: {
                         color,
                         logo_url: overrideLogo || botLogo,
@@ -259,9 +267,30 @@ function BuilderContent({ params }: { params: Promise<{ id: string }> }) {
                 body: formData,
             });
             const data = await res.json();
-            if (res.ok && data.knowledge_base) {
-                setKnowledgeBase(data.knowledge_base);
-                // useEffect will catch this and handle it debounced
+            if (res.ok && data.job_id) {
+                // Ingestion runs in the background; poll the job, then reload the extracted text
+                let job = data;
+                while (job.status === "queued" || job.status === "processing") {
+                    await new Promise((resolve) => setTimeout(resolve, 1000));
+                    const jobRes = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/bots/${id}/knowledge/jobs/${data.job_id}`);
+                    if (!jobRes.ok) break;
+                    job = await jobRes.json();
+                }
+                if (job.status === "failed") {
+                    console.error("Knowledge ingestion failed:", job.error);
+                }
+                const configRes = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/bots/${id}/config`);
+                const config = await configRes.json();
+                if (configRes.ok) {
+                    // Already stored server-side, so mark it saved rather than echoing it back
+                    if (lastSavedState.current) {
+                        lastSavedState.current = JSON.stringify({
+                            ...JSON.parse(lastSavedState.current),
+                            knowledgeBase: config.knowledge_base || ""
+                        });
+                    }
+                    setKnowledgeBase(config.knowledge_base || "");
+                }
             }
         } catch (err) {
             console.error("Failed to upload knowledge:", err);
@@ -22,10 +22,9 @@ export default function DemoPage({ params }: { params: Promise<{ id: string }> }
         };
         fetchConfig();
 
-        // Load widget script
+        // Load the widget bundle (config inlined, no second request)
         const script = document.createElement("script");
-        script.src = "/widget.js";
-        script.setAttribute("data-bot-id", id);
+        script.src = `${process.env.NEXT_PUBLIC_API_URL}/api/bots/${id}/widget.js`;
         script.async = true;
         document.body.appendChild(script);
 
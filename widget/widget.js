@@ -1,7 +1,11 @@
 (function () {
     const script = document.currentScript;
-    const botId = script.getAttribute('data-bot-id');
-    const API_BASE = script.getAttribute('data-api-url') || "http://localhost:8000";
+    // Set when this file is served by /api/bots/{id}/widget.js with the bot's config inlined
+    const BOOTSTRAP = typeof NIMMI_BOOTSTRAP !== 'undefined' ? NIMMI_BOOTSTRAP : null;
+    const botId = BOOTSTRAP ? BOOTSTRAP.bot_id : script.getAttribute('data-bot-id');
+    const API_BASE = script.getAttribute('data-api-url') || (BOOTSTRAP ? new URL(script.src).origin : "http://localhost:8000");
+    // Stream answers token by token unless the embed opts out with data-stream="false"
+    const STREAMING = script.getAttribute('data-stream') !== 'false';
 
     if (!botId) {
         console.error("Nimmi AI: data-bot-id is missing.");
@@ -119,9 +123,11 @@
     }
 
     function loadConfig(container) {
-        // Fetch Config
-        fetch(`${API_BASE}/api/bots/${botId}/config`)
-            .then(res => res.json())
+        // Inlined by the bootstrap bundle; otherwise fetched
+        const configReady = BOOTSTRAP
+            ? Promise.resolve(BOOTSTRAP.config)
+            : fetch(`${API_BASE}/api/bots/${botId}/widget-config`).then(res => res.json());
+        configReady
             .then(config => {
                 const { visual_config, bot_name } = config;
                 const {
@@ -151,6 +157,13 @@
                 let flowActive = nodes.length > 0;
                 const variables = {};
 
+                // Session ID management
+                let visitorSessionId = localStorage.getItem('nimmi_session_id');
+                if (!visitorSessionId) {
+                    visitorSessionId = 'v' + Math.random().toString(36).substring(2, 10);
+                    localStorage.setItem('nimmi_session_id', visitorSessionId);
+                }
+
                 container.style.right = position === 'right' ? `${right_padding}px` : 'auto';
                 container.style.left = position === 'left' ? `${right_padding}px` : 'auto';
                 container.style.bottom = `${bottom_padding}px`;
@@ -315,6 +328,19 @@
                     const name = node.data.label || node.id;
                     variables[name] = value;
                     console.log(`Nimmi AI: Set variable "${name}" to "${value}"`);
+
+                    fetch(`${API_BASE}/api/chat/variables`, {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify({
+                            bot_id: botId,
+                            visitor_session_id: visitorSessionId,
+                            variable_name: name,
+                            variable_value: value
+                        })
+                    }).then(res => res.json())
+                        .then(d => console.log("Nimmi AI: Variable captured", d))
+                        .catch(e => console.error("Nimmi AI: Capture failed", e));
                 };
 
                 const evaluateCondition = (node) => {
@@ -380,25 +406,80 @@
                     processNode(startNode);
                 }
 
+                const chatRequest = (text) => ({
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({
+                        bot_id: botId,
+                        message: text,
+                        visitor_session_id: visitorSessionId,
+                        history: []
+                    })
+                });
+
+                // Reads server-sent events from /api/chat/stream and renders tokens as they arrive
+                const streamAnswer = (text) => {
+                    const inner = addMessage('...', 'assistant').firstChild;
+                    let answer = '';
+
+                    const render = (eventText) => {
+                        const data = eventText.split('\n')
+                            .filter(line => line.startsWith('data:'))
+                            .map(line => line.slice(5).trim())
+                            .join('\n');
+                        if (!data) return;
+                        const payload = JSON.parse(data);
+                        if (payload.token) {
+                            answer += payload.token;
+                            inner.innerText = answer;
+                            messages.scrollTop = messages.scrollHeight;
+                        }
+                    };
+
+                    return fetch(`${API_BASE}/api/chat/stream`, chatRequest(text))
+                        .then(res => {
+                            if (res.status === 429) {
+                                // Rate limited or busy: show the server's message instead of the generic error
+                                return res.json().then(data => { answer = data.detail; inner.innerText = answer; });
+                            }
+                            if (!res.ok || !res.body) throw new Error(`Stream unavailable (${res.status})`);
+                            const reader = res.body.getReader();
+                            const decoder = new TextDecoder();
+                            let buffer = '';
+                            const pump = () => reader.read().then(({ done, value }) => {
+                                if (done) {
+                                    if (buffer.trim()) render(buffer);
+                                    return;
+                                }
+                                buffer += decoder.decode(value, { stream: true });
+                                const events = buffer.split('\n\n');
+                                buffer = events.pop();
+                                events.forEach(render);
+                                return pump();
+                            });
+                            return pump();
+                        })
+                        .catch(err => {
+                            console.error("Nimmi AI: Streaming failed", err);
+                            if (!answer) inner.innerText = "Sorry, I'm having trouble thinking right now. Please try again.";
+                        });
+                };
+
                 const sendMessage = () => {
                     const text = input.value.trim();
                     if (!text) return;
                     addMessage(text, 'user');
                     input.value = '';
 
-                    fetch(`${API_BASE}/api/chat/message`, {
-                        method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify({
-                            bot_id: botId,
-                            message: text,
-                            visitor_session_id: 'temp-session',
-                            history: []
-                        })
-                    })
+                    if (STREAMING && typeof ReadableStream !== 'undefined' && typeof TextDecoder !== 'undefined') {
+                        streamAnswer(text);
+                        return;
+                    }
+
+                    fetch(`${API_BASE}/api/chat/message`, chatRequest(text))
                         .then(res => res.json())
                         .then(data => {
-                            addMessage(data.answer, 'assistant');
+                            addMessage(data.answer || data.detail, 'assistant');
                         });
                 };
 